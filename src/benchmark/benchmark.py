@@ -0,0 +1,242 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import datetime
+import subprocess
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARK_DIR), 'python'))
+
+import bootstrap
+import clean_room
+import constants
+import jenkins_clean_room
+import reports
+import synthetic_repo
+import fake_reports
+
+START_DATE = datetime.datetime(2018, 1, 1)
+JENKINS_JOBS = ['sarowe/Lucene-Solr-tests-master', 'thetaphi/Lucene-Solr-master-Linux']
+
+
+def get_arg(name, default, convert=str):
+    if name in sys.argv:
+        index = sys.argv.index(name)
+        return convert(sys.argv[index + 1])
+    return default
+
+
+def make_config(work_dir, name, output_dir):
+    return {
+        'name': name,
+        'repo': os.path.join(work_dir, 'repo.git'),
+        'branch': 'master',
+        'checkout': os.path.join(output_dir, 'checkout'),
+        'output': output_dir,
+        'report': os.path.join(output_dir, 'report'),
+        'include': '*Test.java',
+        'exclude': '',
+        'tests_jvms': 1,
+        'promote_if_not_failed_days': 7,
+        'jenkins_jobs': JENKINS_JOBS,
+        'failure_report_url': 'http://localhost/not-used',
+        'filters': [
+            {'name': 'simple', 'test': '${ant} test -Dtestcase=${test_name}'},
+            {'name': 'beast', 'test': '${ant} beast -Dtests.jvms=${tests_jvms} -Dtestcase=${test_name}'}
+        ]
+    }
+
+
+def setup(work_dir, num_modules, tests_per_module, days):
+    """Generates the synthetic repository, failure reports, report.json files and the fake ant script"""
+    marker = os.path.join(work_dir, 'setup.json')
+    params = {'modules': num_modules, 'tests_per_module': tests_per_module, 'days': days}
+    tests = synthetic_repo.all_tests(num_modules, tests_per_module)
+    if os.path.exists(marker):
+        with open(marker, 'r') as f:
+            if json.load(f) == params:
+                print('Reusing synthetic data in %s' % work_dir)
+                return tests
+    if os.path.exists(work_dir):
+        shutil.rmtree(work_dir)
+    os.makedirs(work_dir)
+
+    t0 = time.time()
+    last = synthetic_repo.generate(os.path.join(work_dir, 'repo.git'), num_modules, tests_per_module, days,
+                                   start_date=START_DATE)
+    print('Generated repository with %d tests and %d days of commits up to %s in %.1f sec'
+          % (len(tests), days, last, time.time() - t0))
+    subprocess.check_call([constants.GIT_EXE, 'clone', '-q', os.path.join(work_dir, 'repo.git'),
+                           os.path.join(work_dir, 'checkout')])
+
+    t0 = time.time()
+    fake_reports.generate_failure_reports(os.path.join(work_dir, 'jenkins-archive'), tests, JENKINS_JOBS,
+                                          START_DATE, days + 1)
+    fake_reports.generate_reports(os.path.join(work_dir, 'report'), tests, START_DATE, days)
+    print('Generated failure reports and room reports for %d days in %.1f sec' % (days, time.time() - t0))
+
+    # 1% of tests fail reproducibly
+    script = {'sleep': 0, 'tests': {}}
+    for module, test_name in tests[::100]:
+        script['tests'][test_name] = {'exit': 1}
+    with open(os.path.join(work_dir, 'fake_ant.json'), 'w') as f:
+        json.dump(script, f)
+
+    with open(marker, 'w') as f:
+        json.dump(params, f)
+    return tests
+
+
+def bench_gather_interesting_tests(work_dir, tests, days):
+    run_tests = bootstrap.gather_interesting_tests(os.path.join(work_dir, 'checkout'), [], ['*Test.java'])
+    found = sum(len(run_tests[k]) for k in run_tests)
+    if found != len(tests):
+        raise RuntimeError('Expected %d tests but found %d' % (len(tests), found))
+
+
+def bench_csv_ingestion(work_dir, tests, days):
+    archive = os.path.join(work_dir, 'jenkins-archive')
+    for f in sorted(os.listdir(archive)):
+        for _ in jenkins_clean_room.read_failure_report(os.path.join(archive, f), JENKINS_JOBS):
+            pass
+
+
+def bench_room_persistence(work_dir, tests, days):
+    output_dir = os.path.join(work_dir, 'rooms')
+    if os.path.exists(output_dir):
+        shutil.rmtree(output_dir)
+    os.makedirs(output_dir)
+    config = make_config(work_dir, 'bench', output_dir)
+    clean_room_data, detention_data = bootstrap.load_validate_room_data(config, output_dir, 'LATEST')
+    clean = clean_room.Room('clean-room', clean_room_data)
+    for module, test_name in tests:
+        clean.enter(test_name, module, '2018-01-01 00-00-00', '%040x' % 0)
+    file_path = os.path.join(output_dir, 'clean_room_data.json')
+    bootstrap.save_clean_room_data(config['name'], clean.get_data(), file_path)
+    data = bootstrap.load_clean_room_data_for_room(config['name'], file_path)
+    if len(data['tests']) != len(tests):
+        raise RuntimeError('Expected %d tests in the clean room but found %d' % (len(tests), len(data['tests'])))
+
+
+def bench_reports_main(work_dir, tests, days):
+    config = make_config(work_dir, 'bench', work_dir)
+    config_path = os.path.join(work_dir, 'reports-config.json')
+    with open(config_path, 'w') as f:
+        json.dump(config, f)
+    argv = sys.argv
+    try:
+        sys.argv = ['reports.py', '-config', config_path]
+        reports.main()
+    finally:
+        sys.argv = argv
+
+
+def bench_do_work(work_dir, tests, days):
+    output_dir = os.path.join(work_dir, 'do_work')
+    if os.path.exists(output_dir):
+        shutil.rmtree(output_dir)
+    os.makedirs(output_dir)
+    os.symlink(os.path.join(work_dir, 'jenkins-archive'), os.path.join(output_dir, 'jenkins-archive'))
+    config = make_config(work_dir, 'bench', output_dir)
+    e2e_days = get_arg('-e2e-days', 3, int)
+    argv = sys.argv
+    try:
+        sys.argv = ['jenkins_clean_room.py']
+        for d in range(days - e2e_days + 1, days + 1):
+            config['time_stamp'] = 'bench-%d' % d
+            jenkins_clean_room.do_work(START_DATE + datetime.timedelta(days=d), config)
+    finally:
+        sys.argv = argv
+
+
+BENCHMARKS = [
+    ('gather_interesting_tests', bench_gather_interesting_tests),
+    ('csv_ingestion', bench_csv_ingestion),
+    ('room_persistence', bench_room_persistence),
+    ('reports_main', bench_reports_main),
+    ('do_work', bench_do_work),
+]
+
+
+def compare(results, baseline, threshold):
+    """Returns a list of (name, seconds, baseline seconds) for results slower than baseline by more than threshold"""
+    regressions = []
+    for name in results:
+        if name in baseline and results[name] > baseline[name] * (1 + threshold):
+            regressions.append((name, results[name], baseline[name]))
+    return regressions
+
+
+def main():
+    work_dir = get_arg('-work-dir', '/tmp/clean-room-benchmark')
+    num_modules = get_arg('-modules', 100, int)
+    tests_per_module = get_arg('-tests-per-module', 100, int)
+    days = get_arg('-days', 1000, int)
+    repeat = get_arg('-repeat', 3, int)
+    threshold = get_arg('-threshold', 0.25, float)
+    baseline_path = get_arg('-baseline', None)
+    save_baseline_path = get_arg('-save-baseline', None)
+    only = get_arg('-only', None)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    constants.ANT_EXE = os.path.join(BENCHMARK_DIR, 'fake_ant.py')
+    os.environ['FAKE_ANT_SCRIPT'] = os.path.join(work_dir, 'fake_ant.json')
+
+    tests = setup(work_dir, num_modules, tests_per_module, days)
+
+    results = {}
+    for name, fn in BENCHMARKS:
+        if only is not None and name not in only.split(','):
+            continue
+        timings = []
+        for _ in range(repeat):
+            t0 = time.time()
+            fn(work_dir, tests, days)
+            timings.append(time.time() - t0)
+        results[name] = min(timings)
+        print('%-28s %10.3f sec (min of %d: %s)' % (name, results[name], repeat,
+                                                    ', '.join('%.3f' % t for t in timings)))
+
+    params = {'modules': num_modules, 'tests_per_module': tests_per_module, 'days': days,
+              'e2e_days': get_arg('-e2e-days', 3, int)}
+    if save_baseline_path is not None:
+        with open(save_baseline_path, 'w') as f:
+            json.dump({'params': params, 'results': results}, f, indent=4, sort_keys=True)
+        print('Baseline written to %s' % save_baseline_path)
+
+    if baseline_path is not None:
+        with open(baseline_path, 'r') as f:
+            baseline = json.load(f)
+        if baseline['params'] != params:
+            print('Baseline %s was recorded with %s but this run used %s' % (baseline_path, baseline['params'], params))
+            exit(1)
+        regressions = compare(results, baseline['results'], threshold)
+        for name, seconds, expected in regressions:
+            print('REGRESSION: %s took %.3f sec, baseline is %.3f sec (threshold %d%%)'
+                  % (name, seconds, expected, threshold * 100))
+        if len(regressions) > 0:
+            exit(1)
+        print('No regressions beyond %d%% of baseline %s' % (threshold * 100, baseline_path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A stand-in for ant that sleeps, prints and fails according to a JSON script.
+
+The script is read from the file named by the FAKE_ANT_SCRIPT environment variable:
+
+{
+  "sleep": 0.1,                       # seconds to sleep for every invocation
+  "targets": {"compile-test": {"sleep": 2}},
+  "tests": {"SomeTest": {"exit": 1, "sleep": 0.5, "output": "..."}}
+}
+
+Settings for the test named by -Dtestcase override settings for the target which override the defaults. When only the
+method named by -Dtests.method is run, the settings in the test's "methods" for that method override the test's.
+
+The comma separated tests named by -Dtests.class are run in one invocation, like a batched filter does. A JUnit XML
+report is written for each of them into ../build/<name of the current directory>/test and the invocation fails if any
+of them fails.
+"""
+
+import os
+import sys
+import json
+import time
+
+TESTCASE_ARG = '-Dtestcase='
+TESTS_CLASS_ARG = '-Dtests.class='
+TESTS_METHOD_ARG = '-Dtests.method='
+
+
+def load_script():
+    path = os.environ.get('FAKE_ANT_SCRIPT')
+    if path is None or not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def write_report(test_name, failed):
+    report_dir = os.path.join('..', 'build', os.path.basename(os.getcwd()), 'test')
+    if not os.path.exists(report_dir):
+        os.makedirs(report_dir)
+    with open(os.path.join(report_dir, 'TEST-org.example.%s.xml' % test_name), 'w') as f:
+        f.write('<testsuite name="org.example.%s" tests="1" failures="%d" errors="0" skipped="0">\n'
+                % (test_name, 1 if failed else 0))
+        f.write('  <testcase classname="org.example.%s" name="testFake">%s</testcase>\n'
+                % (test_name, '<failure message="fake"/>' if failed else ''))
+        f.write('</testsuite>\n')
+
+
+def run_batch(script, targets, test_names):
+    defaults = {'sleep': script.get('sleep', 0), 'exit': script.get('exit', 0)}
+    for t in targets:
+        defaults.update(script.get('targets', {}).get(t, {}))
+    print('Buildfile: build.xml')
+    if defaults['sleep'] > 0:
+        time.sleep(defaults['sleep'])
+    failed = []
+    for test_name in test_names:
+        settings = dict(defaults)
+        settings.update(script.get('tests', {}).get(test_name, {}))
+        if 'sleep' in script.get('tests', {}).get(test_name, {}):
+            time.sleep(settings['sleep'])
+        if 'output' in settings:
+            print(settings['output'])
+        if settings['exit'] != 0:
+            failed.append(test_name)
+        write_report(test_name, settings['exit'] != 0)
+    if len(failed) == 0:
+        print('   [junit4] Tests summary: %d suites, %d tests' % (len(test_names), len(test_names)))
+    else:
+        print('   [junit4] Tests with failures [seed: DEADBEEF]:')
+        for test_name in failed:
+            print('   [junit4]   - %s.testFake' % test_name)
+    print('BUILD %s' % ('SUCCESSFUL' if len(failed) == 0 else 'FAILED'))
+    exit(1 if len(failed) > 0 else 0)
+
+
+def main():
+    script = load_script()
+    args = sys.argv[1:]
+    targets = [a for a in args if not a.startswith('-')]
+    test_name = None
+    batch = None
+    method_name = None
+    for a in args:
+        if a.startswith(TESTCASE_ARG):
+            test_name = a[len(TESTCASE_ARG):]
+        if a.startswith(TESTS_CLASS_ARG):
+            batch = a[len(TESTS_CLASS_ARG):].split(',')
+        if a.startswith(TESTS_METHOD_ARG):
+            method_name = a[len(TESTS_METHOD_ARG):]
+    if batch is not None:
+        run_batch(script, targets, batch)
+        return
+
+    settings = {'sleep': script.get('sleep', 0), 'exit': script.get('exit', 0)}
+    for t in targets:
+        settings.update(script.get('targets', {}).get(t, {}))
+    if test_name is not None:
+        settings.update(script.get('tests', {}).get(test_name, {}))
+        if method_name is not None:
+            settings.update(settings.get('methods', {}).get(method_name, {}))
+
+    print('Buildfile: build.xml')
+    if settings['sleep'] > 0:
+        time.sleep(settings['sleep'])
+    if 'output' in settings:
+        print(settings['output'])
+    if test_name is not None:
+        if settings['exit'] == 0:
+            print('   [junit4] Tests summary: 1 suite, 1 test')
+        else:
+            print('   [junit4] Tests with failures [seed: DEADBEEF]:')
+            print('   [junit4]   - %s.testFake' % test_name)
+    print('BUILD %s' % ('SUCCESSFUL' if settings['exit'] == 0 else 'FAILED'))
+    exit(settings['exit'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import gzip
+import json
+import random
+import datetime
+
+OTHER_JOBS = ['apache/Lucene-Solr-NightlyTests-master', 'thetaphi/Lucene-Solr-7.x-Windows']
+
+
+def generate_failure_reports(archive_dir, tests, jenkins_jobs, start_date, days, failures_per_day=20, seed=0):
+    """Writes one <date>.method-failures.csv.gz per day in the same layout as the fucit.org daily archive.
+
+    Each day gets failures_per_day rows for randomly chosen tests, roughly half of which are on one of jenkins_jobs.
+    Returns the list of generated file paths.
+    """
+    rnd = random.Random(seed)
+    if not os.path.exists(archive_dir):
+        os.makedirs(archive_dir)
+    jobs = list(jenkins_jobs) + OTHER_JOBS
+    paths = []
+    for d in range(days):
+        day = start_date + datetime.timedelta(days=d)
+        path = os.path.join(archive_dir, '%s.method-failures.csv.gz' % day.strftime('%Y-%m-%d'))
+        lines = []
+        for _ in range(failures_per_day):
+            module, test_name = tests[rnd.randrange(len(tests))]
+            package = module.split('/')[-1]
+            lines.append('org.apache.bench.%s.%s,test%d,%s/%d/'
+                         % (package, test_name, rnd.randrange(10), rnd.choice(jobs), rnd.randrange(10000)))
+        with gzip.open(path, 'wb') as f:
+            f.write(('\n'.join(lines) + '\n').encode('utf-8'))
+        paths.append(path)
+    return paths
+
+
+def generate_reports(reports_dir, tests, start_date, days, detention_size=500, seed=0):
+    """Writes a report.json for each of the given days as written by bootstrap.write_report"""
+    rnd = random.Random(seed)
+    for d in range(days):
+        day = start_date + datetime.timedelta(days=d)
+        date_s = day.strftime('%Y-%m-%d %H-%M-%S')
+        detained = set(rnd.sample(range(len(tests)), min(detention_size, len(tests))))
+        clean, detention = {}, {}
+        for idx, (module, test_name) in enumerate(tests):
+            entry = {'name': test_name, 'entry_date': date_s, 'git_sha': '%040x' % idx, 'module': module}
+            if idx in detained:
+                entry['extra_info'] = {'reproducible': rnd.random() < 0.1, 'good_sha': '%040x' % (idx + 1)}
+                detention[test_name] = entry
+            else:
+                clean[test_name] = entry
+        report = {'time_stamp': day.strftime('%Y.%m.%d.%H.%M.%S'),
+                  'num_clean': len(clean),
+                  'num_detention': len(detention),
+                  'clean': {'name': 'bench', 'tests': clean},
+                  'detention': {'name': 'bench', 'tests': detention},
+                  'num_promotions': rnd.randrange(10),
+                  'num_demotions': rnd.randrange(10),
+                  'promotions': {},
+                  'demotions': {},
+                  'test_date': date_s,
+                  'new_tests': []}
+        report_path = os.path.join(reports_dir, day.strftime('%Y.%m.%d.%H.%M.%S'))
+        if not os.path.exists(report_path):
+            os.makedirs(report_path)
+        with open(os.path.join(report_path, 'report.json'), 'w') as f:
+            json.dump(report, f)
@@ -0,0 +1,115 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import random
+import datetime
+import subprocess
+
+GIT_EXE = 'git'
+
+TEST_TEMPLATE = """package org.apache.bench.%(package)s;
+
+public class %(name)s {
+  // revision %(revision)d
+}
+"""
+
+
+def module_name(m):
+    return 'bench/module%d' % m
+
+
+def test_name(m, t):
+    return 'Module%dBench%dTest' % (m, t)
+
+
+def test_path(m, t):
+    return '%s/src/test/org/apache/bench/module%d/%s.java' % (module_name(m), m, test_name(m, t))
+
+
+def all_tests(num_modules, tests_per_module):
+    """Returns a list of (module, test_name) tuples in the synthetic repository"""
+    return [(module_name(m), test_name(m, t)) for m in range(num_modules) for t in range(tests_per_module)]
+
+
+def _data(out, s):
+    b = s.encode('utf-8')
+    out.write(('data %d\n' % len(b)).encode('utf-8'))
+    out.write(b)
+    out.write(b'\n')
+
+
+def _commit(out, when, message, files):
+    epoch = int((when - datetime.datetime(1970, 1, 1)).total_seconds())
+    out.write(b'commit refs/heads/master\n')
+    out.write(('committer Bench <bench@example.com> %d +0000\n' % epoch).encode('utf-8'))
+    _data(out, message)
+    for path, content in files:
+        out.write(('M 100644 inline %s\n' % path).encode('utf-8'))
+        _data(out, content)
+
+
+def generate(repo_dir, num_modules, tests_per_module, days, commits_per_day=2,
+             start_date=datetime.datetime(2018, 1, 1), seed=0):
+    """Creates a bare git repository with num_modules x tests_per_module test files and days of history.
+
+    All test files are added by the first commit on start_date. Each following day gets commits_per_day commits,
+    each of which touches one randomly chosen test. Uses git fast-import so that generating thousands of commits
+    takes seconds. Returns the date of the last commit.
+    """
+    rnd = random.Random(seed)
+    if not os.path.exists(repo_dir):
+        os.makedirs(repo_dir)
+    subprocess.check_call([GIT_EXE, 'init', '-q', '--bare', repo_dir])
+    subprocess.check_call([GIT_EXE, '--git-dir', repo_dir, 'symbolic-ref', 'HEAD', 'refs/heads/master'])
+    process = subprocess.Popen([GIT_EXE, '--git-dir', repo_dir, 'fast-import', '--quiet'], stdin=subprocess.PIPE)
+    out = process.stdin
+
+    files = [('build.xml', '<project name="bench"/>\n')]
+    for m in range(num_modules):
+        for t in range(tests_per_module):
+            files.append((test_path(m, t),
+                          TEST_TEMPLATE % {'package': 'module%d' % m, 'name': test_name(m, t), 'revision': 0}))
+    _commit(out, start_date, 'Initial commit', files)
+
+    revision = 0
+    when = start_date
+    for d in range(1, days + 1):
+        day = start_date + datetime.timedelta(days=d)
+        for c in range(commits_per_day):
+            revision += 1
+            m, t = rnd.randrange(num_modules), rnd.randrange(tests_per_module)
+            when = day + datetime.timedelta(hours=1 + c * 23 // max(commits_per_day, 1))
+            content = TEST_TEMPLATE % {'package': 'module%d' % m, 'name': test_name(m, t), 'revision': revision}
+            _commit(out, when, 'BENCH-%d: change %s' % (revision, test_name(m, t)), [(test_path(m, t), content)])
+    out.close()
+    if process.wait() != 0:
+        raise RuntimeError('git fast-import failed with exit code %d' % process.returncode)
+    return when
+
+
+def main():
+    if len(sys.argv) < 5:
+        print('Usage: python synthetic_repo.py <repo_dir> <num_modules> <tests_per_module> <days>')
+        exit(1)
+    last = generate(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4]))
+    print('Synthetic repository written to %s, last commit on %s' % (sys.argv[1], last))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Per-test history of the rooms across all reports and the flakiness metrics computed from it.
+
+The history is kept as columns, one per test, of bits over the dates of the reports (bit d is the d-th date in
+order): whether the test was in a room, whether it was in detention and whether it failed on Jenkins on that date.
+Python integers are arbitrary precision bitsets so every metric is a handful of operations over a test's entire
+history instead of a loop over the dates. The columns are saved in $report/analytics/history.json and only the
+reports of new dates are read on the next load. Query results are cached until a new date arrives.
+
+python src/python/analytics.py -config /path/to/config.json -query flips|failure_rate|mtbf|trend [-top 20] [-window 7]
+"""
+
+import os
+import sys
+import json
+import datetime
+
+import bootstrap
+import locks
+
+ANALYTICS_DIR = 'analytics'
+HISTORY_FILE = 'history.json'
+QUERIES_FILE = 'queries.json'
+DATE_DIR_FORMAT_LEN = len('2018.01.01.00.00.00')
+
+
+def popcount(x):
+    return bin(x).count('1')
+
+
+class History:
+    def __init__(self):
+        # test dates of the reports in order, bit d of every column is the d-th date
+        self.dates = []
+        self.tests = []
+        self.modules = []
+        self.index = {}
+        # columns, one bitset per test
+        self.present = []
+        self.detained = []
+        self.failed = []
+
+    def get_test(self, test_name, module):
+        idx = self.index.get(test_name)
+        if idx is None:
+            idx = len(self.tests)
+            self.index[test_name] = idx
+            self.tests.append(test_name)
+            self.modules.append(module)
+            self.present.append(0)
+            self.detained.append(0)
+            self.failed.append(0)
+        elif module is not None:
+            self.modules[idx] = module
+        return idx
+
+    def add_report(self, report):
+        """Adds the rooms of a report whose test date is after all dates in the history"""
+        if len(self.dates) > 0 and report['test_date'] <= self.dates[-1]:
+            raise ValueError('Report for %s is not after %s' % (report['test_date'], self.dates[-1]))
+        bit = 1 << len(self.dates)
+        self.dates.append(report['test_date'])
+        day = report['test_date'][:10]
+        for room, detained in ((report['clean'], False), (report['detention'], True)):
+            for name, entry in room['tests'].items():
+                idx = self.get_test(name, entry['module'] if 'module' in entry else None)
+                self.present[idx] |= bit
+                if detained:
+                    self.detained[idx] |= bit
+                    # a test (re-)enters detention on the day it fails on jenkins
+                    if entry['entry_date'][:10] == day:
+                        self.failed[idx] |= bit
+        for name, entry in report['demotions'].items():
+            self.failed[self.get_test(name, entry['module'] if 'module' in entry else None)] |= bit
+
+    def mask(self, start=0, end=None):
+        """Returns a bitset of the dates from index start up to, but not including, end"""
+        end = len(self.dates) if end is None else end
+        return ((1 << max(end - start, 0)) - 1) << start
+
+    def flips(self, idx):
+        """Number of times the test moved between the rooms on consecutive dates"""
+        both = self.present[idx] & (self.present[idx] >> 1)
+        return popcount((self.detained[idx] ^ (self.detained[idx] >> 1)) & both)
+
+    def failure_rate(self, idx, mask=None):
+        mask = self.mask() if mask is None else mask
+        days = popcount(self.present[idx] & mask)
+        return popcount(self.failed[idx] & mask) / float(days) if days > 0 else 0.0
+
+    def get_data(self):
+        return {'dates': self.dates, 'tests': self.tests, 'modules': self.modules,
+                'present': ['%x' % c for c in self.present], 'detained': ['%x' % c for c in self.detained],
+                'failed': ['%x' % c for c in self.failed]}
+
+    @staticmethod
+    def from_data(data):
+        h = History()
+        h.dates = data['dates']
+        h.tests = data['tests']
+        h.modules = data['modules']
+        h.index = dict((t, i) for i, t in enumerate(h.tests))
+        h.present = [int(c, 16) for c in data['present']]
+        h.detained = [int(c, 16) for c in data['detained']]
+        h.failed = [int(c, 16) for c in data['failed']]
+        return h
+
+
+def get_analytics_dir(config):
+    return os.path.join(config['report'], ANALYTICS_DIR)
+
+
+def list_reports(reports_dir):
+    """Returns (test date, path) of all report.json files in the reports directory in the order of their test dates"""
+    if not os.path.exists(reports_dir):
+        return []
+    # the directories are named after the test date in %Y.%m.%d.%H.%M.%S which sorts in date order
+    return [(datetime.datetime.strptime(d, '%Y.%m.%d.%H.%M.%S').strftime('%Y-%m-%d %H-%M-%S'),
+             os.path.join(reports_dir, d, 'report.json')) for d in sorted(os.listdir(reports_dir))
+            if len(d) == DATE_DIR_FORMAT_LEN and os.path.exists(os.path.join(reports_dir, d, 'report.json'))]
+
+
+def read_reports(paths):
+    for p in paths:
+        with open(p, 'r') as f:
+            yield json.load(f)
+
+
+def load(config):
+    """Returns the history of all reports, reading only the reports of dates that are not in the saved history"""
+    history_path = os.path.join(get_analytics_dir(config), HISTORY_FILE)
+    history = None
+    if os.path.exists(history_path):
+        with open(history_path, 'r') as f:
+            history = History.from_data(json.load(f))
+    reports = list_reports(config['report'])
+    known = set(history.dates) if history is not None else set()
+    new_reports = [(d, p) for d, p in reports if d not in known]
+    if len(new_reports) == 0 and history is not None:
+        return history
+    if history is not None and new_reports[0][0] < history.dates[-1]:
+        # a report for an earlier date was added, the bits of all later dates move
+        history = None
+        new_reports = reports
+    if history is None:
+        history = History()
+    for report in read_reports(p for d, p in new_reports):
+        history.add_report(report)
+    if not os.path.exists(get_analytics_dir(config)):
+        os.makedirs(get_analytics_dir(config))
+    locks.dump_json(history.get_data(), history_path)
+    return history
+
+
+def top_flips(history, n):
+    """The tests that moved between the rooms most often"""
+    result = [(history.flips(i), i) for i in range(len(history.tests))]
+    result.sort(key=lambda r: (-r[0], history.tests[r[1]]))
+    return [{'test': history.tests[i], 'module': history.modules[i], 'flips': f} for f, i in result[:n] if f > 0]
+
+
+def top_failure_rates(history, n):
+    """The tests that failed on the largest fraction of the dates on which they were in a room"""
+    result = [(history.failure_rate(i), i) for i in range(len(history.tests))]
+    result.sort(key=lambda r: (-r[0], history.tests[r[1]]))
+    return [{'test': history.tests[i], 'module': history.modules[i], 'failure_rate': r,
+             'failures': popcount(history.failed[i])} for r, i in result[:n] if r > 0]
+
+
+def mtbf_by_module(history, n):
+    """Mean number of dates between failures of a test in each module i.e. test-dates in a room over failures,
+    lowest first"""
+    days, failures = {}, {}
+    for i in range(len(history.tests)):
+        m = history.modules[i]
+        days[m] = days.get(m, 0) + popcount(history.present[i])
+        failures[m] = failures.get(m, 0) + popcount(history.failed[i])
+    result = [{'module': m, 'mtbf_days': days[m] / float(failures[m]), 'failures': failures[m]}
+              for m in days if failures[m] > 0]
+    result.sort(key=lambda r: (r['mtbf_days'], r['module']))
+    return result[:n]
+
+
+def failure_trend(history, n, window):
+    """The tests whose failure rate increased most in the last window dates compared to the window before"""
+    end = len(history.dates)
+    recent = history.mask(max(end - window, 0), end)
+    previous = history.mask(max(end - 2 * window, 0), max(end - window, 0))
+    result = []
+    for i in range(len(history.tests)):
+        delta = history.failure_rate(i, recent) - history.failure_rate(i, previous)
+        if delta != 0:
+            result.append((delta, i))
+    result.sort(key=lambda r: (-r[0], history.tests[r[1]]))
+    return [{'test': history.tests[i], 'module': history.modules[i], 'change': d,
+             'recent_failure_rate': history.failure_rate(i, recent)} for d, i in result[:n]]
+
+
+QUERIES = {
+    'flips': lambda h, n, window: top_flips(h, n),
+    'failure_rate': lambda h, n, window: top_failure_rates(h, n),
+    'mtbf': lambda h, n, window: mtbf_by_module(h, n),
+    'trend': failure_trend,
+}
+
+
+def query(config, name, n=20, window=7):
+    """Runs one of QUERIES over the history. Results are cached until a report for a new date is written."""
+    if name not in QUERIES:
+        raise ValueError('Unknown query %s, must be one of %s' % (name, sorted(QUERIES)))
+    history = load(config)
+    queries_path = os.path.join(get_analytics_dir(config), QUERIES_FILE)
+    cache = {}
+    if os.path.exists(queries_path):
+        with open(queries_path, 'r') as f:
+            cache = json.load(f)
+    if cache.get('dates') != len(history.dates) or cache.get('last_date') != history.dates[-1]:
+        cache = {'dates': len(history.dates), 'last_date': history.dates[-1], 'results': {}}
+    key = '%s:%d:%d' % (name, n, window)
+    if key not in cache['results']:
+        cache['results'][key] = QUERIES[name](history, n, window)
+        locks.dump_json(cache, queries_path)
+    return cache['results'][key]
+
+
+def main():
+    config = bootstrap.get_config()
+    name = 'flips'
+    if '-query' in sys.argv:
+        index = sys.argv.index('-query')
+        name = sys.argv[index + 1]
+    n = 20
+    if '-top' in sys.argv:
+        index = sys.argv.index('-top')
+        n = int(sys.argv[index + 1])
+    window = 7
+    if '-window' in sys.argv:
+        index = sys.argv.index('-window')
+        window = int(sys.argv[index + 1])
+    if len(list_reports(config['report'])) == 0:
+        print('No reports found in %s' % config['report'])
+        exit(1)
+    print(json.dumps(query(config, name, n, window), indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A store of the packages built by LuceneSolrCheckout.build, addressed by the build backend, a digest of how the
+package is built and the git tree hash of the checkout.
+
+The tree hash identifies the sources rather than the commit so that commits with the same sources, e.g. a revert of
+a revert or the same change merged to two branches, share a package. The backend is part of the key because ant and
+gradle package the same sources differently. The digest covers what else decides the package: the build command with
+its properties and flags, the JVM and the environment variables the build tools read. Each entry is a directory named after the key holding the tgz and an
+artifact.json with the commit it was built from and when it was last used. Once the entries take more than
+artifact_cache_max_bytes, the least recently used ones are evicted.
+
+A hit is hard linked, or copied, out of the cache while the cache is locked, so an entry evicted by another process
+afterwards does not remove the package from under the build that got it.
+
+python src/python/artifact_cache.py -config /path/to/config.json
+"""
+
+import os
+import json
+import glob
+import shutil
+import hashlib
+import logging
+import datetime
+
+import bootstrap
+import constants
+import locks
+import metrics
+import utils
+
+INFO_FILE = 'artifact.json'
+# 10 GB, about 40 solr packages
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024 * 1024
+# read by java, ant or gradle, they can change the JVM or the properties of the build
+BUILD_ENV_VARIABLES = ['JAVA_HOME', 'JAVA_TOOL_OPTIONS', '_JAVA_OPTIONS', 'ANT_OPTS', 'ANT_ARGS', 'GRADLE_OPTS']
+
+
+def read_info(info_path):
+    try:
+        with open(info_path, 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        # evicted by another process in the meantime
+        return None
+
+
+def link_or_copy(src, dest):
+    if os.path.exists(dest):
+        os.remove(dest)
+    try:
+        os.link(src, dest)
+    except OSError:
+        # e.g. the cache is on another file system
+        shutil.copy2(src, dest)
+
+
+def get_java_version():
+    """Returns the output of java -version or None if java cannot be run"""
+    try:
+        output, ret = utils.run_get_output(['java', '-version'])
+    except OSError:
+        return None
+    return output.strip() if ret == 0 else None
+
+
+def get_build_digest(command, checkout_dir, java_version=None, env=None):
+    """Returns a digest of the build command, the java version and the build environment variables. Paths into the
+    checkout, e.g. of the gradle wrapper, are made relative so that checkouts in different directories share
+    packages."""
+    env = env if env is not None else os.environ
+    checkout_dir = os.path.abspath(checkout_dir)
+    parts = [os.path.relpath(arg, checkout_dir) if arg.startswith(checkout_dir + os.sep) else arg for arg in command]
+    parts.append('java=%s' % java_version)
+    parts.extend('%s=%s' % (v, env[v]) for v in BUILD_ENV_VARIABLES if v in env)
+    return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()[:12]
+
+
+def get_time_stamp():
+    return datetime.datetime.now().strftime('%Y.%m.%d.%H.%M.%S.%f')
+
+
+class ArtifactCache:
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES, logger=logging.getLogger()):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.logger = logger
+
+    def get_key(self, checkout_dir, backend_name, build_digest):
+        """Returns the backend name, the build digest (see get_build_digest) and the tree hash of the checked out
+        commit or None if tracked files were modified since"""
+        output, ret = utils.run_get_output([constants.GIT_EXE, 'status', '--porcelain', '--untracked-files=no'],
+                                           cwd=checkout_dir)
+        if ret != 0 or output.strip() != '':
+            self.logger.info('Checkout %s has local modifications, its artifacts will not be cached' % checkout_dir)
+            return None
+        output, ret = utils.run_get_output([constants.GIT_EXE, 'rev-parse', 'HEAD^{tree}'], cwd=checkout_dir)
+        if ret != 0:
+            raise RuntimeError('Unable to read the tree hash of %s: %s' % (checkout_dir, output))
+        return '%s-%s-%s' % (backend_name, build_digest, output.strip())
+
+    def list_entries(self):
+        """Returns the entries in the cache as a list of dicts sorted by last use, least recently used first"""
+        entries = []
+        for info_path in glob.glob(os.path.join(self.cache_dir, '*', INFO_FILE)):
+            entry = read_info(info_path)
+            if entry is None:
+                continue
+            entry['path'] = os.path.dirname(info_path)
+            entries.append(entry)
+        return sorted(entries, key=lambda e: e['last_used'])
+
+    def get(self, key, dest_dir):
+        """Links the cached tgz for the key into dest_dir and returns the path to the link or None"""
+        entry_dir = os.path.join(self.cache_dir, key)
+        info_path = os.path.join(entry_dir, INFO_FILE)
+        with locks.lock(self.cache_dir):
+            entry = read_info(info_path)
+            if entry is None:
+                metrics.inc('cache_misses_total', cache='artifacts')
+                return None
+            entry['last_used'] = get_time_stamp()
+            locks.dump_json(entry, info_path)
+            path = os.path.join(dest_dir, entry['file'])
+            link_or_copy(os.path.join(entry_dir, entry['file']), path)
+        metrics.inc('cache_hits_total', cache='artifacts')
+        self.logger.info('Using %s built from git sha %s on %s' % (path, entry['git_sha'], entry['created']))
+        return path
+
+    def put(self, key, tgz_path, git_sha):
+        """Copies the tgz into the cache, evicting the least recently used entries if the cache grows too large"""
+        entry_dir = os.path.join(self.cache_dir, key)
+        file_name = os.path.basename(tgz_path)
+        tmp_dir = '%s.%d.tmp' % (entry_dir, os.getpid())
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
+        shutil.copy2(tgz_path, os.path.join(tmp_dir, file_name))
+        now = get_time_stamp()
+        locks.dump_json({'key': key, 'git_sha': git_sha, 'file': file_name, 'size': os.path.getsize(tgz_path),
+                         'created': now, 'last_used': now}, os.path.join(tmp_dir, INFO_FILE))
+        with locks.lock(self.cache_dir):
+            if os.path.exists(entry_dir):
+                shutil.rmtree(entry_dir)
+            os.rename(tmp_dir, entry_dir)
+            self.evict(keep=key)
+        self.logger.info('Cached %s built from git sha %s at %s' % (file_name, git_sha, entry_dir))
+
+    def evict(self, keep=None):
+        """Removes the least recently used entries, other than keep, until the cache fits in max_bytes"""
+        entries = self.list_entries()
+        total = sum(e['size'] for e in entries)
+        for e in entries:
+            if total <= self.max_bytes:
+                break
+            if e['key'] == keep:
+                continue
+            self.logger.info('Evicting artifact %s of git sha %s last used on %s from %s'
+                             % (e['file'], e['git_sha'], e['last_used'], e['path']))
+            shutil.rmtree(e['path'])
+            total -= e['size']
+
+
+def is_enabled(config):
+    return 'artifact_cache' in config and config['artifact_cache']
+
+
+def get_cache(config, logger=logging.getLogger()):
+    """Returns the ArtifactCache of the configuration or None if it is not enabled"""
+    if not is_enabled(config):
+        return None
+    cache_dir = config['artifact_cache_dir'] if 'artifact_cache_dir' in config \
+        else os.path.join(config['output'], 'artifact-cache')
+    max_bytes = int(config['artifact_cache_max_bytes']) if 'artifact_cache_max_bytes' in config \
+        else DEFAULT_MAX_BYTES
+    return ArtifactCache(cache_dir, max_bytes, logger)
+
+
+def main():
+    config = bootstrap.get_config()
+    cache = get_cache(config)
+    if cache is None:
+        print('artifact_cache is not enabled in the configuration')
+        exit(1)
+    entries = cache.list_entries()
+    for e in entries:
+        print('%s %s of git sha %s, %d bytes, last used on %s' % (e['key'], e['file'], e['git_sha'], e['size'],
+                                                                 e['last_used']))
+    print('%d artifacts, %d of %d bytes' % (len(entries), sum(e['size'] for e in entries), cache.max_bytes))
+
+
+if __name__ == '__main__':
+    main()
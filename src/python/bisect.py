@@ -19,16 +19,14 @@ import time
 
 import bootstrap
 import room_filter
+import runner
 from utils import GOOD_STATUS, SKIP_STATUS, ABORT_STATUS
 
 
 def test(config, test_name):
     checkout_dir = config['checkout']
 
-    filters = []
-    for f in config['filters']:
-        ff = room_filter.Filter(f['name'], f['test'], tests_jvms=config['tests_jvms'])
-        filters.append(ff)
+    filters = room_filter.get_filters(config)
 
     include = config['include'].split('|') if 'include' in config else ['*.java']
     exclude = config['exclude'].split('|') if 'exclude' in config else []
@@ -74,7 +72,7 @@ def main():
         exit(ABORT_STATUS)
 
     config = bootstrap.get_config()
-    
+    runner.install_signal_handlers()
     exit(test(config, test_name))
 
 
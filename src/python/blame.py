@@ -23,21 +23,139 @@ import re
 import json
 
 import bootstrap
+import failure_archive
+import impact
+import locks
+import noisy_bisect
 import solr
 import utils
 import constants
+import metrics
+import runner
 
 
 # # first bad commit: [a2d927667418d17a1f5f31a193092d5b04a4219e] LUCENE-8335: Enforce soft-deletes field up-front.
 reBadCommit = re.compile(r'^# first bad commit: \[(.*)\] (.*)$', re.MULTILINE)
+# There are only 'skip'ped commits left to test.
+# The first bad commit could be any of:
+# 2904f95...
+reSkippedCandidates = re.compile(r'^The first bad commit could be any of:\n((?:[0-9a-f]{40}\n)+)', re.MULTILINE)
+# the number of commits passed to each git bisect skip
+SKIP_BATCH_SIZE = 100
+
+
+def get_relevant_commits(checkout, test_name, good_sha, bad_sha):
+    """Returns (relevant, irrelevant) lists of the commits in good_sha..bad_sha. A commit is relevant if it changed
+    a build file or any other file outside the src directories of the modules (see impact.affects_all_tests), the
+    source of the test or of a class that it depends on, directly or transitively, or any other file in the src
+    directory of a module of those classes. Merge commits are always relevant. Returns None if the
+    test cannot be found. Must be run in the checkout with bad_sha checked out."""
+    i = logging.info
+    graph = impact.build_graph(checkout.checkout_dir)
+    test_classes = graph.find_tests(test_name)
+    if len(test_classes) == 0:
+        i('Test %s not found in the dependency graph at %s' % (test_name, bad_sha))
+        return None
+    dependencies = graph.get_dependencies(test_classes)
+    paths = set(graph.paths[c] for c in dependencies)
+    modules = set(impact.get_module(p) for p in paths)
+    i('Test %s depends on %d classes in modules %s' % (test_name, len(dependencies), sorted(modules)))
+
+    def is_relevant(path):
+        if impact.affects_all_tests(checkout, path) or path in paths:
+            return True
+        # resources, test-files and java files that no longer exist at bad_sha
+        return impact.get_module(path) in modules and path not in graph.classes
+
+    output, ret = utils.run_get_output([constants.GIT_EXE, 'log', '--format=%x00%H', '--name-only',
+                                        '%s..%s' % (good_sha, bad_sha)])
+    if ret != 0:
+        i('Unable to list the commits between %s and %s: %s' % (good_sha, bad_sha, output))
+        return None
+    relevant, irrelevant = [], []
+    for commit in output.split('\x00')[1:]:
+        lines = [l.strip() for l in commit.split('\n') if len(l.strip()) > 0]
+        sha, changed = lines[0], lines[1:]
+        if len(changed) == 0 or any(is_relevant(p) for p in changed):
+            relevant.append(sha)
+        else:
+            irrelevant.append(sha)
+    return relevant, irrelevant
+
+
+def is_pruning_enabled(config):
+    return 'bisect_prune_commits' not in config or config['bisect_prune_commits']
+
+
+def noisy_blame(config, checkout, test_name, good_sha, bad_sha):
+    """Finds the first bad commit of a flaky test with noisy_bisect, must be run in the checkout"""
+    i = logging.info
+    commits = noisy_bisect.get_commits(good_sha, bad_sha)
+    original_sha = checkout.get_head_sha()
+    try:
+        if is_pruning_enabled(config):
+            with metrics.phase('prune_commits'):
+                utils.run_command([constants.GIT_EXE, 'checkout', '-q', bad_sha])
+                relevant = get_relevant_commits(checkout, test_name, good_sha, bad_sha)
+            if relevant is not None:
+                relevant = set(relevant[0])
+                i('%d of %d commits between %s and %s cannot affect test %s, skipping them'
+                  % (len(commits) - len(relevant), len(commits), good_sha, bad_sha, test_name))
+                commits = [c for c in commits if c in relevant]
+        if len(commits) == 0:
+            print('Bisect unsuccessful! No commit between %s and %s can affect the test' % (good_sha, bad_sha))
+            return
+        start_time = time.time()
+        with metrics.phase('bisect'):
+            result = noisy_bisect.NoisyBisect(config, checkout, test_name).bisect(commits, bad_sha)
+        i('Time taken: %d seconds' % (time.time() - start_time))
+        if result is None:
+            print('Bisect unsuccessful! The failure could not be reproduced at %s' % bad_sha)
+            return
+        sha, probability = result
+        output, ret = utils.run_get_output([constants.GIT_EXE, 'log', '-1', '--format=%s', sha])
+        if probability >= noisy_bisect.get_confidence(config):
+            print('Found bad commit SHA: %s with confidence %.3f commit message: %s' % (sha, probability, output.strip()))
+        else:
+            print('Bisect unsuccessful! Most likely bad commit SHA: %s with confidence %.3f commit message: %s'
+                  % (sha, probability, output.strip()))
+    finally:
+        if original_sha is not None:
+            utils.run_command([constants.GIT_EXE, 'checkout', '-q', original_sha])
+
+
+def log_failure_history(config, test_name, test_date):
+    """Logs the jenkins failures of the test in the failure archive window ending on test_date"""
+    i = logging.info
+    start_date = test_date - datetime.timedelta(days=failure_archive.get_window_days(config) - 1)
+    methods = {}
+    days = set()
+    for date, t, method_name, jenkins in failure_archive.get_archive(config).get_failures(
+            start_date, test_date, test_name, config['jenkins_jobs']):
+        methods[method_name] = methods.get(method_name, 0) + 1
+        days.add(date)
+    i('Test %s failed %d times on %d days between %s and %s'
+      % (test_name, sum(methods.values()), len(days), start_date.strftime('%Y-%m-%d'), test_date.strftime('%Y-%m-%d')))
+    for method_name in sorted(methods, key=lambda m: -methods[m]):
+        i('Method %s failed %d times' % (method_name, methods[method_name]))
 
 
 def blame(config, time_stamp, test_date, test_name, good_sha, bad_sha, new_test=False):
+    """Finds the commit that broke the test holding the lock on the checkout"""
+    with locks.lock(config['checkout'], timeout=locks.get_timeout(config)):
+        _blame(config, time_stamp, test_date, test_name, good_sha, bad_sha, new_test)
+
+
+def _blame(config, time_stamp, test_date, test_name, good_sha, bad_sha, new_test=False):
     i = logging.info
 
-    i('Checking out code')
-    checkout = solr.LuceneSolrCheckout(config['repo'], config['checkout'])
-    checkout.checkout()
+    if failure_archive.is_enabled(config) and not new_test:
+        log_failure_history(config, test_name, test_date)
+
+    with metrics.phase('checkout'):
+        i('Checking out code')
+        checkout = solr.get_checkout(config)
+        checkout.checkout()
 
     # TODO run the bisect script against the bad_sha first and assert that it
     # TODO fails otherwise the bisection is not likely to be useful
@@ -48,12 +166,18 @@ def blame(config, time_stamp, test_date, test_name, good_sha, bad_sha, new_test=
         try:
             if new_test:
                 # no need to bisect, we can find the commit that introduced the test
-                # git log --diff-filter=A -- */AutoScalingHandlerTest.java
-                cmd = [constants.GIT_EXE, 'log', '--diff-filter=A', '--', '*/%s.java' % test_name]
-                i('Running command: %s' % cmd)
-                output, ret = utils.run_get_output(cmd)
-                i(output)
-                exit(0)
+                i(find_introducing_commits([test_name])[test_name])
+                return
+
+            if 'bisect_mode' in config and config['bisect_mode'] == 'noisy':
+                noisy_blame(config, checkout, test_name, good_sha, bad_sha)
+                return
+
+            commits = None
+            if is_pruning_enabled(config):
+                with metrics.phase('prune_commits'):
+                    utils.run_command([constants.GIT_EXE, 'checkout', '-q', bad_sha])
+                    commits = get_relevant_commits(checkout, test_name, good_sha, bad_sha)
 
             # git bisect start bad good
             cmd = [constants.GIT_EXE, 'bisect', 'start', bad_sha, good_sha]
@@ -61,18 +185,32 @@ def blame(config, time_stamp, test_date, test_name, good_sha, bad_sha, new_test=
             output, ret = utils.run_get_output(cmd)
             i(output)
 
+            if commits is not None:
+                relevant, irrelevant = commits
+                i('%d of %d commits between %s and %s cannot affect test %s, skipping them'
+                  % (len(irrelevant), len(relevant) + len(irrelevant), good_sha, bad_sha, test_name))
+                for idx in range(0, len(irrelevant), SKIP_BATCH_SIZE):
+                    cmd = [constants.GIT_EXE, 'bisect', 'skip'] + irrelevant[idx:idx + SKIP_BATCH_SIZE]
+                    output, ret = utils.run_get_output(cmd)
+                    logging.debug(output)
+
             index = sys.argv.index('-config')
             config_path = sys.argv[index + 1]
+            bisect_timeout = float(config['bisect_timeout_secs']) if 'bisect_timeout_secs' in config else None
 
             # git bisect run sh -c "ant compile-test || exit 125; python src/python/bisect.py -config %s -test %s"
+            backend = checkout.backend
+            compile_cmd = ' '.join(backend.get_command(*(backend.clean_tasks + backend.compile_tests_tasks)))
             cmd = [constants.GIT_EXE, 'bisect', 'run', 'sh', '-c',
-                   'ant clean clean-jars compile-test || exit 125; python %s/src/python/bisect.py -config %s/%s -test %s'
-                   % (x, x, config_path, test_name)]
+                   '%s || exit 125; python %s/src/python/bisect.py -config %s/%s -test %s'
+                   % (compile_cmd, x, x, config_path, test_name)]
             i('Running command: %s' % cmd)
             start_time = time.time()
-            output, ret = utils.run_get_output(cmd)
+            with metrics.phase('bisect'):
+                output, ret = utils.run_get_output(cmd, timeout=bisect_timeout)
             i('Time taken: %d seconds' % (time.time() - start_time))
             i(output)
+            candidates = reSkippedCandidates.search(output)
 
             # git bisect log
             cmd = [constants.GIT_EXE, 'bisect', 'log']
@@ -82,6 +220,13 @@ def blame(config, time_stamp, test_date, test_name, good_sha, bad_sha, new_test=
             result = reBadCommit.search(output)
             if result is not None:
                 print('Found bad commit SHA: %s commit message: %s' % (result.group(1), result.group(2)))
+            elif candidates is not None and commits is not None:
+                # the skipped commits next to the first bad commit cannot have affected the test
+                relevant = [c for c in candidates.group(1).split() if c in commits[0]]
+                if len(relevant) == 1:
+                    print('Found bad commit SHA: %s, the other candidates cannot affect the test' % relevant[0])
+                else:
+                    print('Bisect unsuccessful! The first bad commit could be any of: %s' % ', '.join(relevant))
             else:
                 print('Bisect unsuccessful!')
         finally:
@@ -94,11 +239,22 @@ def blame(config, time_stamp, test_date, test_name, good_sha, bad_sha, new_test=
         os.chdir(x)
 
 
+def find_introducing_commits(test_names, concurrency=4):
+    """Returns a dict of test name to the git log of the commit(s) that added the test, must be run in the checkout.
+    The git log commands for all tests are run concurrently."""
+    # git log --diff-filter=A -- */AutoScalingHandlerTest.java
+    cmds = [[constants.GIT_EXE, 'log', '--diff-filter=A', '--', '*/%s.java' % t] for t in test_names]
+    for cmd in cmds:
+        logging.info('Running command: %s' % cmd)
+    results = runner.run_all(cmds, concurrency=concurrency)
+    return dict((t, r.output) for t, r in zip(test_names, results))
+
+
 def find_tests(config, test_date):
     i = logging.info
 
     i('Checking out code')
-    checkout = solr.LuceneSolrCheckout(config['repo'], config['checkout'])
+    checkout = solr.get_checkout(config)
     checkout.checkout()
 
     reports_dir = config['report']
@@ -184,12 +340,17 @@ def main():
 
     config['time_stamp'] = time_stamp
     bootstrap.setup_logging(output_dir, time_stamp, level)
+    runner.install_signal_handlers()
 
-    tests = [(test_name, None, good_sha, bad_sha, new_test)] if test_name is not None else find_tests(config, test_date)
-    for test in tests:
-        t, m, g, b, nt = test
-        print('running blame for test %s in module %s good_sha %s bad_sha %s is_new: %s' % (t, m, g, b, str(nt)))
-        # blame(config, time_stamp, test_date, t, g, b, nt)
+    try:
+        with metrics.phase('total'):
+            tests = [(test_name, None, good_sha, bad_sha, new_test)] if test_name is not None else find_tests(config, test_date)
+            for test in tests:
+                t, m, g, b, nt = test
+                print('running blame for test %s in module %s good_sha %s bad_sha %s is_new: %s' % (t, m, g, b, str(nt)))
+                # blame(config, time_stamp, test_date, t, g, b, nt)
+    finally:
+        metrics.write_metrics(config, 'blame')
 
 
 if __name__ == '__main__':
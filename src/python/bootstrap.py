@@ -24,9 +24,15 @@ import fnmatch
 
 import solr
 import room_filter
+import work_queue
 import constants
 import clean_room
 import utils
+import metrics
+import runner
+import dependency_cache
+import locks
+import build_backend
 
 
 def load_overrides(config, cmd_params):
@@ -65,6 +71,9 @@ def load_config(config_path):
     return config
 
 
+LOG_FORMAT = '%(asctime)s [%(threadName)-12.12s] [%(levelname)-5.5s]  %(message)s'
+
+
 def setup_logging(output_dir, time_stamp, level=logging.INFO):
     # fix logging paths
     run_log_dir = '%s/%s' % (output_dir, time_stamp)
@@ -77,7 +86,7 @@ def setup_logging(output_dir, time_stamp, level=logging.INFO):
             os.makedirs(run_log_dir)
     print('Logging to %s' % run_log_file)
     # setup logger configuration
-    log_formatter = logging.Formatter("%(asctime)s [%(threadName)-12.12s] [%(levelname)-5.5s]  %(message)s")
+    log_formatter = logging.Formatter(LOG_FORMAT)
     root_logger = logging.getLogger()
     root_logger.setLevel(level)
     file_handler = logging.FileHandler(run_log_file)
@@ -88,13 +97,30 @@ def setup_logging(output_dir, time_stamp, level=logging.INFO):
     root_logger.addHandler(console_handler)
 
 
-def load_detention_data(file_path):
-    detention_data = {}
+def add_log_file(output_dir, time_stamp):
+    """Additionally logs to $output_dir/$time_stamp/output.txt until the returned handler is removed"""
+    run_log_dir = '%s/%s' % (output_dir, time_stamp)
+    if not os.path.exists(run_log_dir):
+        os.makedirs(run_log_dir)
+    file_handler = logging.FileHandler('%s/output.txt' % run_log_dir)
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    logging.getLogger().addHandler(file_handler)
+    return file_handler
+
+
+def read_room_data(file_path):
+    """Reads the rooms in file_path, the caller holds a lock on it"""
+    data = {}
     if os.path.exists(file_path):
-        logging.info('Loading detention data from %s' % file_path)
+        logging.info('Loading room data from %s' % file_path)
         with open(file_path, 'r') as f:
-            detention_data = json.load(f)
-    return detention_data
+            data = json.load(f)
+    return data
+
+
+def load_detention_data(file_path):
+    with locks.lock(file_path, shared=True):
+        return read_room_data(file_path)
 
 
 def load_detention_data_for_room(room_name, file_path):
@@ -107,20 +133,17 @@ def save_detention_data(room_name, detention_data, file_path):
     time_stamp = '%04d.%02d.%02d.%02d.%02d.%02d' % (
         start.year, start.month, start.day, start.hour, start.minute, start.second)
     detention_data['last_updated'] = time_stamp
-    latest_data = load_detention_data(file_path)
-    latest_data[room_name] = detention_data
-    logging.info('Saving detention data at %s' % file_path)
-    with open(file_path, 'w') as f:
-        json.dump(latest_data, f, indent=4)
+    # other configurations save their rooms in the same file
+    with locks.lock(file_path):
+        latest_data = read_room_data(file_path)
+        latest_data[room_name] = detention_data
+        logging.info('Saving detention data at %s' % file_path)
+        locks.dump_json(latest_data, file_path, indent=4)
 
 
 def load_clean_room_data(file_path):
-    clean_room_data = {}
-    if os.path.exists(file_path):
-        logging.info('Loading clean room data from %s' % file_path)
-        with open(file_path, 'r') as f:
-            clean_room_data = json.load(f)
-    return clean_room_data
+    with locks.lock(file_path, shared=True):
+        return read_room_data(file_path)
 
 
 def load_clean_room_data_for_room(room_name, file_path):
@@ -133,11 +156,12 @@ def save_clean_room_data(room_name, clean_room_data, file_path):
     time_stamp = '%04d.%02d.%02d.%02d.%02d.%02d' % (
         start.year, start.month, start.day, start.hour, start.minute, start.second)
     clean_room_data['last_updated'] = time_stamp
-    latest_data = load_clean_room_data(file_path)
-    latest_data[room_name] = clean_room_data
-    logging.info('Saving clean room data at %s' % file_path)
-    with open(file_path, 'w') as f:
-        json.dump(latest_data, f, indent=4)
+    # other configurations save their rooms in the same file
+    with locks.lock(file_path):
+        latest_data = read_room_data(file_path)
+        latest_data[room_name] = clean_room_data
+        logging.info('Saving clean room data at %s' % file_path)
+        locks.dump_json(latest_data, file_path, indent=4)
 
 
 def gather_interesting_tests(checkout_dir, exclude, include):
@@ -209,7 +233,7 @@ def load_validate_room_data(config, output_dir, revision):
     return clean_room_data, detention_data
 
 
-def write_report(config, clean, detention, test_date, new_tests=[]):
+def write_report(config, clean, detention, test_date, new_tests=[], deferred=[]):
     test_date_str = test_date.strftime('%Y-%m-%d %H-%M-%S')
     reports_dir = config['report']
     report_path = os.path.join(reports_dir, test_date.strftime('%Y.%m.%d.%H.%M.%S'))
@@ -224,55 +248,79 @@ def write_report(config, clean, detention, test_date, new_tests=[]):
               # promotions are the tests that exit detention and enter clean room
               # we cannot use clean.get_entered to count promotions because that also includes
               # new tests that we haven't seen previously
-              'num_promotions': len(detention.get_exited()),
+              'num_promotions': detention.num_exited(),
               # demotions are the tests that exit clean room and enter detention
               # we cannot use detention.get_entered here because that may count
               # failures on tests that were already in detention
-              'num_demotions': len(clean.get_exited()),
+              'num_demotions': clean.num_exited(),
               'promotions': detention.get_exited(),
               'demotions': clean.get_exited(),
               'test_date': test_date_str,
-              'new_tests' : new_tests}
-    with open(report_file, 'w') as f:
-        json.dump(report, f, indent=8, sort_keys=True)
+              'new_tests' : new_tests,
+              # filter jobs left for the next run once the time budget was spent
+              'num_deferred': len(deferred),
+              'deferred': deferred}
+    with locks.lock(reports_dir):
+        locks.dump_json(report, report_file, indent=8, sort_keys=True)
     return report_file
 
 
-def main():
-    start = datetime.datetime.now()
-    time_stamp = '%04d.%02d.%02d.%02d.%02d.%02d' % (
-        start.year, start.month, start.day, start.hour, start.minute, start.second)
+def get_module_for_test(tests, test_name):
+    for k in tests:
+        if test_name in tests[k]:
+            return k
 
-    config = get_config()
 
-    # setup output directory
-    output_dir = config['output']
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+def run_filters_ahead(config, filters, tests, git_sha, checkout_dir, budget=None):
+    """Runs each (test_dir, test_name) in tests through the filters up front if they are run by workers or in
+    batches. Returns a dict of test name -> (status, name of the filter that did not pass or None) or None if each
+    test should be run through room_filter.run_filters when it is needed. Tests missing from the dict were not run,
+    e.g. because the scheduler.Budget was spent or no worker was alive."""
+    if work_queue.is_enabled(config):
+        return work_queue.run_filters(config, filters, tests, git_sha, checkout_dir, budget)
+    if room_filter.is_batched(filters):
+        return room_filter.run_filters_batched(filters, tests, room_filter.get_batch_size(config))
+    return None
 
-    level = logging.INFO
-    if '-debug' in sys.argv:
-        level = logging.DEBUG
 
-    setup_logging(output_dir, time_stamp, level)
+def clean_build(config, workspace=None):
+    """Deletes the checkout and resets the ivy and ant lib directories for -clean-build.
 
+    Configurations sharing a workspace clean the shared checkout only once. The ivy and ant lib directories are restored
+    from the dependency cache if it is enabled and has a snapshot, otherwise they are deleted.
+    """
+    checkout_dir = config['checkout']
+    if workspace is not None and workspace.is_checked_out(checkout_dir):
+        return
+    backend = build_backend.get_backend(config)
+    if os.path.exists(checkout_dir):
+        # a daemon would keep the build state of the deleted checkout
+        backend.stop()
+        logging.getLogger().warn('Deleting checkout directory: %s' % checkout_dir)
+        shutil.rmtree(checkout_dir)
+    # the ivy and ant directories are only used by ant
+    if backend.name == build_backend.ANT:
+        dependency_cache.clean(config)
+
+
+def do_work(config, workspace=None):
+    """Bootstraps the rooms of the configuration holding the lock on its checkout"""
+    metrics.reset_gauges()
+    with locks.lock(config['checkout'], timeout=locks.get_timeout(config)):
+        _do_work(config, workspace)
+
+
+def _do_work(config, workspace=None):
     logger = logging.getLogger()
     i = logger.info
     w = logger.warn
     e = logger.error
 
+    output_dir = config['output']
     checkout_dir = config['checkout']
 
     if '-clean-build' in sys.argv:
-        if os.path.exists(checkout_dir):
-            w('Deleting checkout directory: %s' % checkout_dir)
-            shutil.rmtree(checkout_dir)
-        if os.path.exists(constants.ANT_LIB_DIR):
-            print('Deleting ant lib directory: %s' % constants.ANT_LIB_DIR)
-            shutil.rmtree(constants.ANT_LIB_DIR)
-        if os.path.exists(constants.IVY_LIB_CACHE):
-            print('Deleting ivy lib directory: %s' % constants.IVY_LIB_CACHE)
-            shutil.rmtree(constants.IVY_LIB_CACHE)
+        clean_build(config, workspace)
 
     reports_dir = config['report']
     if not os.path.exists(reports_dir):
@@ -299,11 +347,15 @@ def main():
     include = config['include'].split('|') if config['include'] is not None else ['*.java']
     exclude = config['exclude'].split('|') if config['exclude'] is not None else []
 
-    # checkout project code
-    i('Checking out project source code from %s in %s revision: %s' % (config['repo'], checkout_dir, revision))
-    checkout = solr.LuceneSolrCheckout(config['repo'], checkout_dir, revision)
-    checkout.checkout()
-    git_sha, commit_date = checkout.get_git_rev()
+    with metrics.phase('checkout'):
+        # checkout project code
+        i('Checking out project source code from %s in %s revision: %s' % (config['repo'], checkout_dir, revision))
+        checkout = solr.get_checkout(config, revision)
+        if workspace is not None:
+            workspace.checkout(checkout)
+        else:
+            checkout.checkout()
+        git_sha, commit_date = checkout.get_git_rev()
     i('Checked out lucene/solr artifacts from GIT SHA %s with date %s' % (git_sha, commit_date))
 
     if revision is not 'LATEST' and git_sha != revision:
@@ -311,8 +363,12 @@ def main():
         exit(1)
 
     # todo make test directory configurable
-    i('Reading test names from test directories matching: src/test')
-    run_tests = gather_interesting_tests(checkout_dir, exclude, include)
+    with metrics.phase('gather_tests'):
+        i('Reading test names from test directories matching: src/test')
+        if workspace is not None:
+            run_tests = workspace.gather_interesting_tests(checkout_dir, git_sha, exclude, include)
+        else:
+            run_tests = gather_interesting_tests(checkout_dir, exclude, include)
 
     for test in clean_room_data['tests']:
         if 'module' not in clean_room_data['tests'][test]:
@@ -329,49 +385,79 @@ def main():
         num_tests += len(run_tests[k])
     i('Found %d tests in %d modules. Test names: %s' % (num_tests, len(run_tests), run_tests))
 
-    i('Compiling lucene/solr tests')
-    checkout.compile_tests()
+    with metrics.phase('compile'):
+        i('Compiling lucene/solr tests')
+        if workspace is not None:
+            workspace.compile_tests(checkout, git_sha)
+        else:
+            checkout.compile_tests()
+    if dependency_cache.is_enabled(config):
+        dependency_cache.snapshot(config, checkout_dir)
 
     if '-build-artifacts' in sys.argv:
-        i('Building lucene/solr artifacts')
-        checkout.build()
+        with metrics.phase('build'):
+            i('Building lucene/solr artifacts')
+            i('Artifacts at %s' % checkout.build())
 
     # Building filters
-    filters = []
-    for f in config['filters']:
-        ff = room_filter.Filter(f['name'], f['test'], tests_jvms=config['tests_jvms'])
-        filters.append(ff)
-
-    for test_module in run_tests:
-        i('Bootstrapping tests in %s' % test_module)
-        for test_name in run_tests[test_module]:
-            if not clean.has(test_name) and not detention.has(test_name):
-                promote = True
-                for f in filters:
-                    if not f.filter(test_module, test_name) == utils.GOOD_STATUS:
-                        promote = False
-                        break
-                date_str = commit_date.strftime('%Y-%m-%d %H:%M:%S')
-                if promote:
-                    i('Permitting test %s to clean-room' % test_name)
-                    clean.enter(test_name, test_module, date_str, git_sha)
-                    save_clean_room_data(config['name'], clean.get_data(), '%s/clean_room_data.json' % output_dir)
+    filters = room_filter.get_filters(config)
+
+    with metrics.phase('filters'):
+        ahead = run_filters_ahead(config, filters, [(m, t) for m in run_tests for t in run_tests[m] if
+                                                    not clean.has(t) and not detention.has(t)],
+                                  git_sha, checkout_dir)
+        for test_module in run_tests:
+            i('Bootstrapping tests in %s' % test_module)
+            for test_name in run_tests[test_module]:
+                if not clean.has(test_name) and not detention.has(test_name):
+                    if ahead is not None and test_name in ahead:
+                        status, _ = ahead[test_name]
+                    else:
+                        status, _ = room_filter.run_filters(filters, test_module, test_name)
+                    promote = status == utils.GOOD_STATUS
+                    date_str = commit_date.strftime('%Y-%m-%d %H:%M:%S')
+                    if promote:
+                        i('Permitting test %s to clean-room' % test_name)
+                        clean.enter(test_name, test_module, date_str, git_sha)
+                    else:
+                        i('Sending test %s to detention' % test_name)
+                        detention.enter(test_name, test_module, date_str, git_sha)
                 else:
-                    i('Sending test %s to detention' % test_name)
-                    detention.enter(test_name, test_module, date_str, git_sha)
-                    save_detention_data(config['name'], detention.get_data(), '%s/detention_data.json' % output_dir)
-            else:
-                i('Skipping test %s' % test_name)
+                    i('Skipping test %s' % test_name)
+
+    # serializing the rooms is linear in their size, so they are saved once rather than after every test
+    save_clean_room_data(config['name'], clean.get_data(), '%s/clean_room_data.json' % output_dir)
+    save_detention_data(config['name'], detention.get_data(), '%s/detention_data.json' % output_dir)
 
     report_file = write_report(config, clean, detention, commit_date)
+    metrics.record_rooms(clean, detention)
     i('Report written to: %s' % report_file)
 
 
-if __name__ == '__main__':
-    main()
+def main():
+    start = datetime.datetime.now()
+    time_stamp = '%04d.%02d.%02d.%02d.%02d.%02d' % (
+        start.year, start.month, start.day, start.hour, start.minute, start.second)
 
+    config = get_config()
 
-def get_module_for_test(tests, test_name):
-    for k in tests:
-        if test_name in tests[k]:
-            return k
\ No newline at end of file
+    # setup output directory
+    output_dir = config['output']
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    level = logging.INFO
+    if '-debug' in sys.argv:
+        level = logging.DEBUG
+
+    config['time_stamp'] = time_stamp
+    setup_logging(output_dir, time_stamp, level)
+    runner.install_signal_handlers()
+    try:
+        with metrics.phase('total'):
+            do_work(config)
+    finally:
+        metrics.write_metrics(config, 'bootstrap')
+
+if __name__ == '__main__':
+    main()
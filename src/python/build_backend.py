@@ -0,0 +1,161 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""The build tools that a checkout is built and its tests run with, chosen by build_backend in the configuration.
+
+A backend gives the command line of the build tool, the tasks that clean, compile and package a checkout, the files
+that make up the build (a change to them forces a clean rebuild and affects every test) and the variables, ${ant} or
+${gradle}, available to the filter commands.
+
+ant starts a new JVM and parses the whole build for every invocation. gradle is run through the wrapper of the checkout
+and keeps a daemon running between invocations, so only the first invocation pays for starting the JVM and
+configuring the projects, and task outputs are reused from the gradle build cache e.g. when a clean build compiles
+sources that were already compiled for another commit.
+"""
+
+import os
+import glob
+import logging
+
+import constants
+import utils
+
+ANT = 'ant'
+GRADLE = 'gradle'
+
+
+class AntBackend:
+    name = ANT
+    # a change to any of these files forces a clean rebuild in incremental mode
+    # because they change dependencies or the build itself for all modules
+    rebuild_patterns = ['build.xml', 'lucene/build.xml', 'solr/build.xml', '*common-build.xml',
+                        '*module-build.xml', '*contrib-build.xml', '*ivy.xml', '*ivy-*.xml', '*ivy-versions.properties',
+                        '*ivy-ignore-conflicts.properties', '*ivy-settings.xml', '*default-nested-ivy-settings.xml']
+    module_build_file = 'build.xml'
+    clean_tasks = ['clean', 'clean-jars']
+    module_clean_tasks = ['clean']
+    compile_tests_tasks = ['compile-test']
+    # create-package is run in package_module and writes the tgz into package_output, relative to the checkout
+    package_module = 'solr'
+    package_tasks = ['create-package']
+    package_output = 'solr/package'
+    reports_glob = constants.JUNIT_REPORTS_GLOB
+
+    def __init__(self, offline=False, logger=logging.getLogger()):
+        # if True, dependencies are resolved from the local ivy cache only
+        self.offline = offline
+        self.logger = logger
+
+    def get_command(self, *tasks):
+        return [constants.ANT_EXE] + (constants.ANT_OFFLINE_ARGS if self.offline else []) + list(tasks)
+
+    def get_variables(self):
+        """Returns the variables of the filter commands that run the build tool"""
+        return {'ant': ' '.join(self.get_command())}
+
+    def get_batch_variables(self, test_names):
+        return {'test_names': ','.join(test_names)}
+
+    def has_daemon(self):
+        return False
+
+    def bootstrap(self, timeout=None):
+        """Prepares a fresh clone for building, must be called with the checkout directory as the cwd"""
+        ivy_jars = glob.glob(os.path.join(constants.ANT_LIB_DIR, 'ivy-*.jar'))
+        if self.offline:
+            # the ivy jar comes from the restored dependency snapshot, ivy-bootstrap would download it again
+            if len(ivy_jars) == 0:
+                self.logger.warn('No ivy jar found in %s in offline mode, builds will fail' % constants.ANT_LIB_DIR)
+            return
+        for jar in ivy_jars:
+            self.logger.info('Removing previous ivy jar: %s' % jar)
+            try:
+                os.remove(jar)
+            except OSError:
+                self.logger.warn('Unable to remove previous ivy jar: %s' % jar)
+        utils.run_command(self.get_command('ivy-bootstrap'), timeout=timeout)
+
+    def stop(self):
+        pass
+
+
+class GradleBackend:
+    name = GRADLE
+    rebuild_patterns = ['settings.gradle', '*.gradle', 'gradle.properties', 'gradle/*', 'buildSrc/*',
+                        'versions.props', 'versions.lock', 'gradlew']
+    module_build_file = 'build.gradle'
+    # the build cache makes the compilation after a clean cheap when the sources were compiled before
+    clean_tasks = ['clean']
+    module_clean_tasks = ['clean']
+    compile_tests_tasks = ['testClasses']
+    package_module = '.'
+    package_tasks = [':solr:packaging:distTar']
+    package_output = 'solr/packaging/build/distributions'
+    # each module writes its reports into its own build directory
+    reports_glob = 'build/test-results/*/TEST-*.xml'
+
+    def __init__(self, checkout_dir, offline=False, daemon=True, build_cache=True, logger=logging.getLogger()):
+        # the wrapper is invoked by its absolute path so that it can be run from the directory of a module, which
+        # selects the module's project
+        self.wrapper = os.path.join(os.path.abspath(checkout_dir), constants.GRADLE_WRAPPER)
+        self.offline = offline
+        self.daemon = daemon
+        self.build_cache = build_cache
+        self.logger = logger
+
+    def get_command(self, *tasks):
+        cmd = [self.wrapper, '--console=plain', '--daemon' if self.daemon else '--no-daemon']
+        if self.build_cache:
+            cmd.append('--build-cache')
+        if self.offline:
+            cmd.append('--offline')
+        return cmd + list(tasks)
+
+    def get_variables(self):
+        return {'gradle': ' '.join(self.get_command())}
+
+    def get_batch_variables(self, test_names):
+        # gradle takes one --tests filter per test class
+        return {'test_names': ','.join(test_names), 'test_filters': ' '.join('--tests %s' % t for t in test_names)}
+
+    def has_daemon(self):
+        """The daemon detaches from the process group of the command that started it, so it survives the runs
+        being killed, but it is also the one that forks the test JVMs, see room_filter.find_daemon_test_jvms"""
+        return self.daemon
+
+    def bootstrap(self, timeout=None):
+        # downloads the gradle distribution of the wrapper unless offline, and starts the daemon
+        self.logger.info('Starting gradle%s with %s' % (' daemon' if self.daemon else '', self.wrapper))
+        utils.run_command(self.get_command('help'), timeout=timeout)
+
+    def stop(self):
+        """Stops the daemons of the gradle version of the checkout"""
+        if os.path.exists(self.wrapper):
+            utils.run_command([self.wrapper, '--stop'])
+
+
+def get_backend(config, checkout_dir=None, logger=logging.getLogger()):
+    """Returns the build backend of the configuration, checkout_dir defaults to the checkout of the configuration"""
+    name = config['build_backend'] if 'build_backend' in config else ANT
+    offline = config['offline_build'] if 'offline_build' in config else False
+    if name == ANT:
+        return AntBackend(offline, logger)
+    if name == GRADLE:
+        return GradleBackend(checkout_dir if checkout_dir is not None else config['checkout'], offline,
+                             daemon=config['gradle_daemon'] if 'gradle_daemon' in config else True,
+                             build_cache=config['gradle_build_cache'] if 'gradle_build_cache' in config else True,
+                             logger=logger)
+    raise ValueError('Unknown build_backend %s, expected %s or %s' % (name, ANT, GRADLE))
@@ -14,58 +14,104 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import sys
 import json
 
 
+class Entry:
+    """A test in a room. Module paths, dates and SHAs are shared by many tests so they are interned."""
+    __slots__ = ('name', 'entry_date', 'git_sha', 'module', 'extra_info')
+
+    def __init__(self, name, entry_date, git_sha, module, extra_info=None):
+        self.name = name
+        self.entry_date = _intern(entry_date)
+        self.git_sha = _intern(git_sha)
+        self.module = _intern(module)
+        self.extra_info = extra_info
+
+    @staticmethod
+    def from_dict(d):
+        return Entry(d['name'], d['entry_date'], d['git_sha'], d['module'] if 'module' in d else None,
+                     d['extra_info'] if 'extra_info' in d else None)
+
+    def to_dict(self):
+        d = {'name': self.name, 'entry_date': self.entry_date, 'git_sha': self.git_sha, 'module': self.module}
+        if self.extra_info is not None:
+            d['extra_info'] = self.extra_info
+        return d
+
+
+def _intern(s):
+    return sys.intern(s) if isinstance(s, str) else s
+
+
 class Room:
     def __init__(self, name, room_data):
         self.name = name
-        self.json_data = room_data
-        if 'tests' in self.json_data:
-            self.entry_log = self.json_data['tests']
-        else:
-            self.entry_log = {}
-            self.json_data['tests'] = self.entry_log
+        # everything in the room data except the tests e.g. the room name and last_updated
+        self.meta = {}
+        self.entry_log = {}
+        for k in room_data:
+            if k == 'tests':
+                for t in room_data[k]:
+                    self.entry_log[t] = Entry.from_dict(room_data[k][t])
+            else:
+                self.meta[k] = room_data[k]
         self.entered = {}
         self.exited = {}
 
     def as_json(self):
-        return json.dumps(self.json_data, sort_keys=True, indent=4)
+        return json.dumps(self.get_data(), sort_keys=True, indent=4)
 
     def enter(self, name, mod, date_s, git_sha, extra_info=None):
         # add or update the entry for the given name
-        self.entry_log[name] = {'name': name, 'entry_date': date_s, 'git_sha': git_sha, 'module': mod}
-        if extra_info is not None:
-            self.entry_log[name]['extra_info'] = extra_info
-        self.entered[name] = self.entry_log[name]
+        entry = Entry(name, date_s, git_sha, mod, extra_info)
+        self.entry_log[name] = entry
+        self.entered[name] = entry
 
     def exit(self, name):
-        if name in self.entry_log:
-            self.exited[name] = self.entry_log[name]
-            del self.entry_log[name]
-            return True
-        else:
+        entry = self.entry_log.pop(name, None)
+        if entry is None:
             return False
+        self.exited[name] = entry
+        return True
 
     def get_tests(self):
-        list = []
-        for t in self.entry_log:
-            list.append(t)
-        return list
+        """Returns an iterator over the names of the tests in the room. The room must not be modified while
+        iterating."""
+        return iter(self.entry_log)
+
+    def get_entries(self):
+        """Returns an iterator over the Entry of each test in the room"""
+        return iter(self.entry_log.values())
+
+    def get_entry(self, test_name):
+        return self.entry_log[test_name]
 
     def num_tests(self):
-        tests = self.json_data['tests']
-        return len(tests)
+        return len(self.entry_log)
 
     def has(self, test_name):
         return test_name in self.entry_log
 
     def get_data(self):
-        return self.json_data
+        """Returns the room as a json compatible dict in the same format as it is saved on disk"""
+        data = dict(self.meta)
+        data['tests'] = _to_dicts(self.entry_log)
+        return data
 
     def get_entered(self):
-        return self.entered
+        return _to_dicts(self.entered)
 
     def get_exited(self):
-        return self.exited
+        return _to_dicts(self.exited)
+
+    def num_entered(self):
+        return len(self.entered)
+
+    def num_exited(self):
+        return len(self.exited)
+
 
+def _to_dicts(entries):
+    return {name: entries[name].to_dict() for name in entries}
@@ -13,6 +13,15 @@
 # limitations under the License.
 
 ANT_EXE = 'ant'
+# the gradle wrapper script at the root of the checkout, used by the gradle build backend
+GRADLE_WRAPPER = 'gradlew'
 GIT_EXE = '/usr/bin/git'
+JSTACK_EXE = 'jstack'
 ANT_LIB_DIR = '/home/shalin/.ant/lib'
 IVY_LIB_CACHE = '/home/shalin/.ivy2/cache'
+# extra arguments passed to every ant invocation when the offline_build configuration is enabled
+# ivy will then use cached resolution results and jars without checking the remote repositories
+ANT_OFFLINE_ARGS = ['-Divy.offline=true', '-Divy.cache.ttl.default=eternal']
+# where the JUnit XML reports of a batched filter run are found, relative to the directory of the tested module
+# e.g. solr/core writes them into solr/build/solr-core/test
+JUNIT_REPORTS_GLOB = '../build/*/test/TEST-*.xml'
@@ -0,0 +1,267 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A long running process that keeps the configuration and the workspace (checkout state and the tests found at
+each revision) in memory, polls for new commits and failure reports and accepts commands over a unix socket.
+
+Start the daemon:
+python src/python/daemon.py -config /path/to/config.json [-socket /path/to/socket] [-poll-secs 600] [-workspace dir]
+
+Send a command to a running daemon, any parameters after the command are passed to it:
+python src/python/daemon.py -config /path/to/config.json -send process -test-date 2018.10.01.00.00.00
+python src/python/daemon.py -config /path/to/config.json -send blame -test-date 2018.10.01.00.00.00
+python src/python/daemon.py -config /path/to/config.json -send report
+python src/python/daemon.py -config /path/to/config.json -send status
+python src/python/daemon.py -config /path/to/config.json -send stop
+"""
+
+import os
+import sys
+import json
+import socket
+import logging
+import datetime
+import threading
+import socketserver
+
+import requests
+
+import blame
+import bootstrap
+import jenkins_clean_room
+import locks
+import metrics
+import reports
+import runner
+import solr
+import workspace
+
+
+def get_socket_path(config):
+    if '-socket' in sys.argv:
+        index = sys.argv.index('-socket')
+        return sys.argv[index + 1]
+    return os.path.join(config['output'], 'clean-room.sock')
+
+
+def get_time_stamp():
+    start = datetime.datetime.now()
+    return '%04d.%02d.%02d.%02d.%02d.%02d' % (
+        start.year, start.month, start.day, start.hour, start.minute, start.second)
+
+
+class Daemon:
+    """ws is the workspace.Workspace of the configuration or None for a plain checkout, whose state is not kept since
+    other processes e.g. cron runs change it"""
+
+    def __init__(self, config, ws, logger=logging.getLogger()):
+        self.config = config
+        self.workspace = ws
+        self.logger = logger
+        # only one command (or poll) runs at a time, they all share the checkout
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.state_path = os.path.join(config['output'], 'daemon_state.json')
+        self.state = {'last_processed_date': None, 'remote_sha': None}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, 'r') as f:
+                self.state.update(json.load(f))
+
+    def save_state(self):
+        locks.dump_json(self.state, self.state_path, indent=4)
+
+    def run_command(self, command, args):
+        with self.lock:
+            time_stamp = get_time_stamp()
+            config = dict(self.config)
+            config['time_stamp'] = time_stamp
+            file_handler = bootstrap.add_log_file(config['output'], time_stamp)
+            self.logger.info('Running command %s %s' % (command, args))
+            try:
+                if command == 'process':
+                    return self.process(config, args)
+                elif command == 'blame':
+                    return self.blame(config, args)
+                elif command == 'report':
+                    return reports.write_reports(config)
+                elif command == 'status':
+                    return self.status()
+                raise ValueError('Unknown command: %s' % command)
+            finally:
+                logging.getLogger().removeHandler(file_handler)
+                file_handler.close()
+
+    def process(self, config, args):
+        test_date = jenkins_clean_room.get_test_date(datetime.datetime.now(), args)
+        try:
+            with metrics.phase('total'):
+                jenkins_clean_room.do_work(test_date, config, self.workspace, args)
+        finally:
+            metrics.write_metrics(config, 'jenkins_clean_room')
+        date_s = test_date.strftime('%Y.%m.%d.%H.%M.%S')
+        if self.state['last_processed_date'] is None or date_s > self.state['last_processed_date']:
+            self.state['last_processed_date'] = date_s
+            self.save_state()
+        return date_s
+
+    def blame(self, config, args):
+        test_date = jenkins_clean_room.get_test_date(datetime.datetime.now(), args)
+        metrics.reset_gauges()
+        try:
+            with metrics.phase('total'):
+                if '-test' not in args:
+                    return blame.find_tests(config, test_date)
+                index = args.index('-test')
+                test_name = args[index + 1]
+                good_sha = args[args.index('-good-sha') + 1]
+                bad_sha = args[args.index('-bad-sha') + 1]
+                blame.blame(config, config['time_stamp'], test_date, test_name, good_sha, bad_sha,
+                            '-new-test' in args)
+                return test_name
+        finally:
+            metrics.write_metrics(config, 'blame')
+
+    def status(self):
+        if self.workspace is None:
+            return {'state': self.state}
+        return {'state': self.state,
+                'checkouts': dict((k, v[0]) for k, v in self.workspace.checked_out.items()),
+                'revisions_with_tests': len(self.workspace.tests),
+                'fetched': [list(f) for f in self.workspace.fetched]}
+
+    def failure_report_available(self, test_date):
+        name = '%s.method-failures.csv.gz' % test_date.strftime('%Y-%m-%d')
+        if os.path.exists(os.path.join(self.config['output'], 'jenkins-archive', name)):
+            return True
+        try:
+            return requests.head('%s/%s' % (self.config['failure_report_url'], name)).status_code == 200
+        except requests.RequestException as e:
+            self.logger.warn('Unable to check for failure report %s: %s' % (name, e))
+            return False
+
+    def poll(self):
+        """Fetches new commits on the configured branch and processes yesterday's failure report once it is
+        available, if it has not been processed yet"""
+        checkout = solr.get_checkout(self.config)
+        remote_sha = checkout.get_remote_sha()
+        # a command may be running and updating the workspace and the state
+        with self.lock:
+            if remote_sha != self.state['remote_sha']:
+                self.logger.info('New commits on branch %s, head is now %s' % (checkout.branch, remote_sha))
+                if self.workspace is not None:
+                    self.workspace.invalidate_fetches()
+                self.state['remote_sha'] = remote_sha
+                self.save_state()
+            last = self.state['last_processed_date']
+
+        yesterday = datetime.datetime.now() - datetime.timedelta(days=1)
+        date_s = yesterday.strftime('%Y.%m.%d.%H.%M.%S')
+        if last is not None and last[:10] >= date_s[:10]:
+            return
+        if self.failure_report_available(yesterday):
+            self.logger.info('Failure report for %s is available, processing it' % date_s)
+            self.run_command('process', ['-test-date', date_s])
+
+    def poll_forever(self, poll_secs):
+        while not self.stopped.wait(poll_secs):
+            try:
+                self.poll()
+            except (Exception, SystemExit):
+                # SystemExit is raised by do_work on validation errors, the daemon must keep running
+                self.logger.exception('Poll failed')
+
+
+class CommandHandler(socketserver.StreamRequestHandler):
+    """Reads one json request {"command": ..., "args": [...]} per connection and writes one json response"""
+
+    def handle(self):
+        daemon = self.server.clean_room_daemon
+        request = json.loads(self.rfile.readline().decode('utf-8'))
+        response = {'ok': True}
+        try:
+            if request['command'] == 'stop':
+                daemon.stopped.set()
+                threading.Thread(target=self.server.shutdown).start()
+            else:
+                response['result'] = daemon.run_command(request['command'], request['args'])
+        except (Exception, SystemExit) as e:
+            # SystemExit is raised by do_work on validation errors
+            daemon.logger.exception('Command %s failed' % request['command'])
+            response = {'ok': False, 'error': '%s: %s' % (type(e).__name__, e)}
+        self.wfile.write((json.dumps(response, default=str) + '\n').encode('utf-8'))
+
+
+def send(socket_path, command, args):
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(socket_path)
+        s.sendall((json.dumps({'command': command, 'args': args}) + '\n').encode('utf-8'))
+        f = s.makefile('rb')
+        return json.loads(f.readline().decode('utf-8'))
+    finally:
+        s.close()
+
+
+def main():
+    config = bootstrap.get_config()
+    socket_path = get_socket_path(config)
+
+    if '-send' in sys.argv:
+        index = sys.argv.index('-send')
+        response = send(socket_path, sys.argv[index + 1], sys.argv[index + 2:])
+        print(json.dumps(response, indent=4, default=str))
+        exit(0 if response['ok'] else 1)
+
+    output_dir = config['output']
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    level = logging.INFO
+    if '-debug' in sys.argv:
+        level = logging.DEBUG
+    bootstrap.setup_logging(output_dir, get_time_stamp(), level)
+    runner.install_signal_handlers()
+
+    ws = None
+    if '-workspace' in sys.argv:
+        index = sys.argv.index('-workspace')
+        ws = workspace.Workspace(sys.argv[index + 1])
+        config = ws.configure(config)
+    daemon = Daemon(config, ws)
+
+    poll_secs = 600.0
+    if '-poll-secs' in sys.argv:
+        index = sys.argv.index('-poll-secs')
+        poll_secs = float(sys.argv[index + 1])
+    if poll_secs > 0:
+        poller = threading.Thread(target=daemon.poll_forever, args=(poll_secs,), name='poller')
+        poller.daemon = True
+        poller.start()
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = socketserver.ThreadingUnixStreamServer(socket_path, CommandHandler)
+    server.clean_room_daemon = daemon
+    logging.info('Listening for commands on %s' % socket_path)
+    try:
+        server.serve_forever()
+    finally:
+        daemon.stopped.set()
+        server.server_close()
+        os.remove(socket_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import json
+import glob
+import shutil
+import hashlib
+import logging
+import datetime
+
+import bootstrap
+import constants
+import metrics
+import utils
+
+# files that decide which jars ivy resolves
+DEPENDENCY_FILES = ['*ivy.xml', '*ivy-versions.properties', '*ivy-settings.xml', '*ivy-ignore-conflicts.properties',
+                    '*common-build.xml']
+
+IVY_CACHE = 'ivy-cache'
+ANT_LIB = 'ant-lib'
+
+
+def get_cache_dir(config):
+    if 'dependency_cache_dir' in config:
+        return config['dependency_cache_dir']
+    return os.path.join(config['output'], 'dependency-cache')
+
+
+def get_version(checkout_dir):
+    """Returns a version id for the dependencies declared in the checkout i.e. a hash of all dependency files"""
+    x = os.getcwd()
+    try:
+        os.chdir(checkout_dir)
+        # the staged blob ids are as good as the contents and much cheaper to read
+        output, ret = utils.run_get_output([constants.GIT_EXE, 'ls-files', '-s', '--'] + DEPENDENCY_FILES)
+        if ret != 0:
+            raise RuntimeError('Unable to list dependency files in %s: %s' % (checkout_dir, output))
+        return hashlib.sha1(output.encode('utf-8')).hexdigest()[:16]
+    finally:
+        os.chdir(x)
+
+
+def list_snapshots(config):
+    """Returns the snapshots in the cache as a list of dicts sorted by creation time, oldest first"""
+    cache_dir = get_cache_dir(config)
+    snapshots = []
+    for info_path in glob.glob(os.path.join(cache_dir, '*', 'snapshot.json')):
+        with open(info_path, 'r') as f:
+            info = json.load(f)
+        info['path'] = os.path.dirname(info_path)
+        snapshots.append(info)
+    return sorted(snapshots, key=lambda s: s['created'])
+
+
+def snapshot(config, checkout_dir, keep=None):
+    """Copies the ivy cache and the ant lib directory into a snapshot versioned by the checkout's dependencies.
+
+    Does nothing if a snapshot for this version already exists. Only the newest `keep` snapshots are retained.
+    Returns the path to the snapshot.
+    """
+    logger = logging.getLogger()
+    version = get_version(checkout_dir)
+    cache_dir = get_cache_dir(config)
+    snapshot_dir = os.path.join(cache_dir, version)
+    if os.path.exists(os.path.join(snapshot_dir, 'snapshot.json')):
+        logger.info('Dependency snapshot %s already exists at %s' % (version, snapshot_dir))
+        return snapshot_dir
+    if not os.path.exists(constants.IVY_LIB_CACHE):
+        logger.warn('Ivy cache %s does not exist, not creating a dependency snapshot' % constants.IVY_LIB_CACHE)
+        return None
+
+    logger.info('Creating dependency snapshot %s at %s' % (version, snapshot_dir))
+    tmp_dir = '%s.%d.tmp' % (snapshot_dir, os.getpid())
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    shutil.copytree(constants.IVY_LIB_CACHE, os.path.join(tmp_dir, IVY_CACHE), symlinks=True)
+    if os.path.exists(constants.ANT_LIB_DIR):
+        shutil.copytree(constants.ANT_LIB_DIR, os.path.join(tmp_dir, ANT_LIB), symlinks=True)
+    with open(os.path.join(tmp_dir, 'snapshot.json'), 'w') as f:
+        json.dump({'version': version, 'created': datetime.datetime.now().strftime('%Y.%m.%d.%H.%M.%S')}, f)
+    if os.path.exists(snapshot_dir):
+        shutil.rmtree(snapshot_dir)
+    os.rename(tmp_dir, snapshot_dir)
+
+    if keep is None:
+        keep = int(config['dependency_cache_keep']) if 'dependency_cache_keep' in config else 3
+    snapshots = list_snapshots(config)
+    for s in snapshots[:max(len(snapshots) - keep, 0)]:
+        logger.info('Evicting dependency snapshot %s from %s' % (s['version'], s['path']))
+        shutil.rmtree(s['path'])
+    return snapshot_dir
+
+
+def _replace_dir(src, dest):
+    if os.path.exists(dest):
+        shutil.rmtree(dest)
+    parent = os.path.dirname(dest)
+    if not os.path.exists(parent):
+        os.makedirs(parent)
+    shutil.copytree(src, dest, symlinks=True)
+
+
+def restore(config, checkout_dir=None):
+    """Replaces the ivy cache and ant lib directory with the snapshot for the checkout's dependencies.
+
+    If there is no snapshot for the exact version (or no checkout_dir is given) the newest snapshot is restored
+    since it is still likely to contain most of the required jars. Returns the restored version or None if the
+    cache is empty.
+    """
+    logger = logging.getLogger()
+    snapshots = list_snapshots(config)
+    if len(snapshots) == 0:
+        logger.info('No dependency snapshots found in %s' % get_cache_dir(config))
+        metrics.inc('cache_misses_total', cache='dependencies')
+        return None
+    chosen = snapshots[-1]
+    if checkout_dir is not None and os.path.exists(checkout_dir):
+        version = get_version(checkout_dir)
+        exact = [s for s in snapshots if s['version'] == version]
+        if len(exact) > 0:
+            chosen = exact[0]
+            metrics.inc('cache_hits_total', cache='dependencies')
+        else:
+            logger.info('No dependency snapshot for version %s, using the newest one' % version)
+            metrics.inc('cache_misses_total', cache='dependencies')
+    logger.info('Restoring dependency snapshot %s from %s' % (chosen['version'], chosen['path']))
+    _replace_dir(os.path.join(chosen['path'], IVY_CACHE), constants.IVY_LIB_CACHE)
+    if os.path.exists(os.path.join(chosen['path'], ANT_LIB)):
+        _replace_dir(os.path.join(chosen['path'], ANT_LIB), constants.ANT_LIB_DIR)
+    return chosen['version']
+
+
+def is_enabled(config):
+    return 'dependency_cache' in config and config['dependency_cache']
+
+
+def clean(config, checkout_dir=None):
+    """Resets the ivy cache and ant lib directory for a clean build.
+
+    If the dependency cache is enabled, the directories are restored from a snapshot if one exists.
+    Otherwise they are deleted.
+    """
+    if is_enabled(config) and restore(config, checkout_dir) is not None:
+        return
+    for d in [constants.ANT_LIB_DIR, constants.IVY_LIB_CACHE]:
+        if os.path.exists(d):
+            logging.getLogger().warn('Deleting directory: %s' % d)
+            shutil.rmtree(d)
+
+
+def main():
+    config = bootstrap.get_config()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)-5.5s]  %(message)s')
+    checkout_dir = config['checkout']
+    if '-snapshot' in sys.argv:
+        print('Snapshot at %s' % snapshot(config, checkout_dir))
+    elif '-restore' in sys.argv:
+        print('Restored version %s' % restore(config, checkout_dir))
+    else:
+        for s in list_snapshots(config):
+            print('%s created on %s at %s' % (s['version'], s['created'], s['path']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""An indexed store of the daily Jenkins failure reports (<date>.method-failures.csv.gz).
+
+Test, method and job names are replaced by ids from a dictionary and each failure is stored as a fixed size record
+in the partition of its month. A manifest lists the dates folded into each partition and the tests that failed in it
+so that lookups by test or by date range only read the partitions that can match.
+
+Layout of the archive directory:
+    dictionary.json  the test, method and job names, a name's id is its index in the list
+    manifest.json    month -> {"dates": [...], "tests": [test ids]}
+    <YYYY-MM>.dat    the records of the month, sorted by day and test id
+
+Fold the raw reports in the jenkins-archive directory into the archive:
+python src/python/failure_archive.py -config /path/to/config.json [-delete-raw]
+
+Query it:
+python src/python/failure_archive.py -config /path/to/config.json -test TestName [-from 2018-01-01] [-to 2018-01-31]
+"""
+
+import os
+import re
+import sys
+import gzip
+import json
+import struct
+import logging
+import datetime
+
+import bootstrap
+import locks
+import utils
+
+ARCHIVE_DIR = 'failure-archive'
+RAW_ARCHIVE_DIR = 'jenkins-archive'
+RAW_SUFFIX = '.method-failures.csv.gz'
+DICTIONARY_FILE = 'dictionary.json'
+MANIFEST_FILE = 'manifest.json'
+# day of month, test id, method id, job id, build number (-1 if the job has none)
+RECORD = struct.Struct('<BIIIi')
+# thetaphi/Lucene-Solr-master-Linux/9562/
+re_job_build = re.compile(r'^(.*)/(\d+)/$')
+
+
+def get_archive_dir(config):
+    return os.path.join(config['output'], ARCHIVE_DIR)
+
+
+def is_enabled(config):
+    return 'failure_archive' in config and config['failure_archive']
+
+
+def get_window_days(config):
+    """The number of days of failures shown in the reports and logged by blame"""
+    return int(config['failure_archive_window_days']) if 'failure_archive_window_days' in config else 30
+
+
+class Dictionary:
+    def __init__(self, names=None):
+        self.names = names if names is not None else []
+        self.ids = dict((n, i) for i, n in enumerate(self.names))
+
+    def get_id(self, name):
+        idx = self.ids.get(name)
+        if idx is None:
+            idx = len(self.names)
+            self.ids[name] = idx
+            self.names.append(name)
+        return idx
+
+
+class FailureArchive:
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+        if not os.path.exists(archive_dir):
+            os.makedirs(archive_dir)
+        self.load()
+
+    def load(self):
+        data = self.read_json(DICTIONARY_FILE, {'tests': [], 'methods': [], 'jobs': []})
+        self.tests = Dictionary(data['tests'])
+        self.methods = Dictionary(data['methods'])
+        self.jobs = Dictionary(data['jobs'])
+        self.manifest = self.read_json(MANIFEST_FILE, {})
+        # simple test name -> ids of the fully qualified names in the reports
+        self.simple_names = {}
+        for i, name in enumerate(self.tests.names):
+            self.simple_names.setdefault(name.split('.')[-1], set()).add(i)
+
+    def read_json(self, name, default):
+        path = os.path.join(self.archive_dir, name)
+        if not os.path.exists(path):
+            return default
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def save(self):
+        # the dictionary first: the manifest must never refer to ids that are not saved
+        locks.write_atomic(os.path.join(self.archive_dir, DICTIONARY_FILE), json.dumps(
+            {'tests': self.tests.names, 'methods': self.methods.names, 'jobs': self.jobs.names}).encode('utf-8'))
+        locks.write_atomic(os.path.join(self.archive_dir, MANIFEST_FILE), json.dumps(self.manifest).encode('utf-8'))
+
+    def has_date(self, date):
+        month = date.strftime('%Y-%m')
+        return month in self.manifest and date.strftime('%Y-%m-%d') in self.manifest[month]['dates']
+
+    def read_partition(self, month):
+        path = os.path.join(self.archive_dir, '%s.dat' % month)
+        if not os.path.exists(path):
+            return []
+        with open(path, 'rb') as f:
+            return list(RECORD.iter_unpack(f.read()))
+
+    def fold(self, csv_path, date):
+        """Adds the failures in a daily report to the archive, returns the number of failures or None if the date
+        was already folded"""
+        with locks.lock(self.archive_dir):
+            # another process may have folded reports since they were loaded
+            self.load()
+            return self.fold_locked(csv_path, date)
+
+    def fold_locked(self, csv_path, date):
+        if self.has_date(date):
+            return None
+        records = []
+        with gzip.open(csv_path, 'rb') as f:
+            for line in f:
+                line = utils.to_str(line).strip()
+                if len(line) == 0:
+                    continue
+                test_name, method_name, jenkins = line.split(',')
+                m = re_job_build.match(jenkins)
+                job, build = (m.group(1), int(m.group(2))) if m is not None else (jenkins, -1)
+                test_id = self.tests.get_id(test_name)
+                self.simple_names.setdefault(test_name.split('.')[-1], set()).add(test_id)
+                records.append((date.day, test_id, self.methods.get_id(method_name), self.jobs.get_id(job), build))
+        month = date.strftime('%Y-%m')
+        partition = self.read_partition(month) + records
+        partition.sort()
+        entry = self.manifest.setdefault(month, {'dates': [], 'tests': []})
+        self.save()
+        locks.write_atomic(os.path.join(self.archive_dir, '%s.dat' % month), b''.join(RECORD.pack(*r) for r in partition))
+        entry['dates'] = sorted(set(entry['dates']) | {date.strftime('%Y-%m-%d')})
+        entry['tests'] = sorted(set(entry['tests']) | set(r[1] for r in records))
+        self.save()
+        return len(records)
+
+    def compact(self, raw_dir, delete_raw=False):
+        """Folds every daily report in raw_dir that is not in the archive yet, returns the number of reports folded"""
+        logger = logging.getLogger()
+        folded = 0
+        for name in sorted(os.listdir(raw_dir)):
+            if not name.endswith(RAW_SUFFIX):
+                continue
+            date = datetime.datetime.strptime(name[:-len(RAW_SUFFIX)], '%Y-%m-%d')
+            path = os.path.join(raw_dir, name)
+            n = self.fold(path, date)
+            if n is not None:
+                logger.info('Folded %d failures from %s into %s' % (n, path, self.archive_dir))
+                folded += 1
+            if delete_raw:
+                os.remove(path)
+        return folded
+
+    def get_failures(self, start_date, end_date, test_name=None, jenkins_jobs=None):
+        """Yields (date, test_name, method_name, jenkins) for each failure on the dates from start_date to end_date,
+        inclusive, in date order. test_name is the simple name of the test, as returned by
+        jenkins_clean_room.read_failure_report. Only failures of test_name and seen on any of jenkins_jobs are
+        returned if they are given."""
+        test_ids = None
+        if test_name is not None:
+            test_ids = self.simple_names.get(test_name, set())
+            if len(test_ids) == 0:
+                return
+        start_s, end_s = start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')
+        for month in sorted(self.manifest):
+            if month < start_s[:7] or month > end_s[:7]:
+                continue
+            if test_ids is not None and test_ids.isdisjoint(self.manifest[month]['tests']):
+                continue
+            for day, test_id, method_id, job_id, build in self.read_partition(month):
+                date_s = '%s-%02d' % (month, day)
+                if date_s < start_s or date_s > end_s:
+                    continue
+                if test_ids is not None and test_id not in test_ids:
+                    continue
+                job = self.jobs.names[job_id]
+                jenkins = '%s/%d/' % (job, build) if build >= 0 else job
+                if jenkins_jobs is not None and not any(jenkins.count(j) > 0 for j in jenkins_jobs):
+                    continue
+                yield (datetime.datetime.strptime(date_s, '%Y-%m-%d'), self.tests.names[test_id].split('.')[-1],
+                       self.methods.names[method_id], jenkins)
+
+
+def get_archive(config):
+    return FailureArchive(get_archive_dir(config))
+
+
+def count_failures(config, end_date, test_name=None):
+    """Returns test name -> number of failures on config['jenkins_jobs'] in the window of days ending on end_date"""
+    start_date = end_date - datetime.timedelta(days=get_window_days(config) - 1)
+    counts = {}
+    for date, t, method_name, jenkins in get_archive(config).get_failures(start_date, end_date, test_name,
+                                                                          config['jenkins_jobs']):
+        counts[t] = counts.get(t, 0) + 1
+    return counts
+
+
+def main():
+    config = bootstrap.get_config()
+    logging.basicConfig(level=logging.INFO, format=bootstrap.LOG_FORMAT)
+    archive = get_archive(config)
+    if '-test' not in sys.argv:
+        raw_dir = os.path.join(config['output'], RAW_ARCHIVE_DIR)
+        n = archive.compact(raw_dir, '-delete-raw' in sys.argv) if os.path.exists(raw_dir) else 0
+        print('Folded %d reports into %s' % (n, archive.archive_dir))
+        return
+    index = sys.argv.index('-test')
+    test_name = sys.argv[index + 1]
+    start_date = datetime.datetime(1970, 1, 1)
+    end_date = datetime.datetime.now()
+    if '-from' in sys.argv:
+        index = sys.argv.index('-from')
+        start_date = datetime.datetime.strptime(sys.argv[index + 1], '%Y-%m-%d')
+    if '-to' in sys.argv:
+        index = sys.argv.index('-to')
+        end_date = datetime.datetime.strptime(sys.argv[index + 1], '%Y-%m-%d')
+    for date, t, method_name, jenkins in archive.get_failures(start_date, end_date, test_name):
+        print('%s,%s,%s,%s' % (date.strftime('%Y-%m-%d'), t, method_name, jenkins))
+
+
+if __name__ == '__main__':
+    main()
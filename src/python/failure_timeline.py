@@ -0,0 +1,167 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import heapq
+import bisect
+import logging
+import datetime
+
+import locks
+
+DATE_FORMAT = '%Y-%m-%d %H-%M-%S'
+
+
+def normalize(date_s):
+    # bootstrap writes dates with ':' in the time, which would not sort correctly against '-'
+    return date_s.replace(':', '-')
+
+
+def format_date(date):
+    return date.strftime(DATE_FORMAT)
+
+
+class FailureTimeline:
+    """The sorted failure dates of every test along with a min-heap of tracked tests ordered by their last failure.
+
+    Dates are strings in DATE_FORMAT which sort in chronological order so they are never parsed. The heap is lazy:
+    an item is stale if its test is no longer tracked or has failed again since it was pushed. The tracked tests and
+    the heap are saved with the failures so that a run only pushes and pops the tests that changed.
+    """
+
+    def __init__(self, failures=None, tracked=None, heap=None):
+        # test name -> sorted list of failure dates
+        self.failures = failures if failures is not None else {}
+        self.tracked = set(tracked) if tracked is not None else set()
+        # a saved heap is still in heap order
+        self.heap = [tuple(item) for item in heap] if heap is not None else []
+        # False if the heap was not saved and has to be built with track_all
+        self.indexed = heap is not None
+
+    def record(self, test_name, date_s):
+        """Records a failure of the test. Recording the same date twice has no effect."""
+        date_s = normalize(date_s)
+        dates = self.failures.setdefault(test_name, [])
+        idx = bisect.bisect_left(dates, date_s)
+        if idx < len(dates) and dates[idx] == date_s:
+            return
+        dates.insert(idx, date_s)
+        if test_name in self.tracked and idx == len(dates) - 1:
+            heapq.heappush(self.heap, (date_s, test_name))
+
+    def get_failures(self, test_name):
+        return self.failures[test_name] if test_name in self.failures else []
+
+    def last_failure(self, test_name):
+        dates = self.get_failures(test_name)
+        return dates[-1] if len(dates) > 0 else None
+
+    def count_failures(self, test_name, since, until=None):
+        """Returns the number of failures of the test on or after since and before until (if given)"""
+        dates = self.get_failures(test_name)
+        lo = bisect.bisect_left(dates, normalize(since))
+        hi = bisect.bisect_left(dates, normalize(until)) if until is not None else len(dates)
+        return max(hi - lo, 0)
+
+    def track(self, test_name):
+        """Adds the test to the heap so that it is returned by pop_not_failed_since once it stops failing"""
+        last = self.last_failure(test_name)
+        if last is None:
+            raise ValueError('No failures recorded for %s' % test_name)
+        self.tracked.add(test_name)
+        heapq.heappush(self.heap, (last, test_name))
+
+    def untrack(self, test_name):
+        self.tracked.discard(test_name)
+
+    def is_tracked(self, test_name):
+        return test_name in self.tracked
+
+    def num_tracked(self):
+        return len(self.tracked)
+
+    def tracks_exactly(self, test_names):
+        """Returns whether the tracked tests are the given ones, the heap is out of sync otherwise"""
+        return self.tracked == set(test_names)
+
+    def compact(self):
+        """Drops the stale items once they outnumber the tracked tests"""
+        if len(self.heap) > 2 * len(self.tracked):
+            self.heap = [(self.last_failure(t), t) for t in self.tracked]
+            heapq.heapify(self.heap)
+
+    def track_all(self, test_names):
+        """Tracks exactly the given tests, building the heap in O(n)"""
+        self.tracked = set(t for t in test_names if self.last_failure(t) is not None)
+        self.heap = [(self.last_failure(t), t) for t in self.tracked]
+        heapq.heapify(self.heap)
+        self.indexed = True
+
+    def pop_not_failed_since(self, cutoff_s):
+        """Pops and returns the tracked tests whose last failure is before cutoff_s, oldest first.
+
+        The returned tests are no longer tracked; track them again if they should be considered later.
+        """
+        cutoff_s = normalize(cutoff_s)
+        result = []
+        while len(self.heap) > 0 and self.heap[0][0] < cutoff_s:
+            last, test_name = heapq.heappop(self.heap)
+            if test_name not in self.tracked or self.last_failure(test_name) != last:
+                # stale: either untracked or it failed again after this item was pushed
+                continue
+            self.tracked.discard(test_name)
+            result.append(test_name)
+        return result
+
+    def get_data(self):
+        return self.failures
+
+
+def get_path(config):
+    return os.path.join(config['output'], 'failure_timeline.json')
+
+
+def load(config):
+    """Loads the failure timeline of the configured name from the output directory"""
+    file_path = get_path(config)
+    if os.path.exists(file_path):
+        logging.info('Loading failure timeline from %s' % file_path)
+        with locks.lock(file_path, shared=True), open(file_path, 'r') as f:
+            data = json.load(f)
+        if config['name'] in data:
+            room = data[config['name']]
+            # saved before the heap was
+            return FailureTimeline(room['tests'], room['tracked'] if 'tracked' in room else None,
+                                   room['heap'] if 'heap' in room else None)
+    return FailureTimeline()
+
+
+def save(config, timeline):
+    file_path = get_path(config)
+    timeline.compact()
+    # other configurations save their timelines in the same file
+    with locks.lock(file_path):
+        data = {}
+        if os.path.exists(file_path):
+            with open(file_path, 'r') as f:
+                data = json.load(f)
+        start = datetime.datetime.now()
+        data[config['name']] = {'last_updated': '%04d.%02d.%02d.%02d.%02d.%02d' % (
+            start.year, start.month, start.day, start.hour, start.minute, start.second), 'tests': timeline.get_data(),
+            'tracked': sorted(timeline.tracked), 'heap': timeline.heap}
+        logging.info('Saving failure timeline at %s' % file_path)
+        locks.dump_json(data, file_path)
@@ -0,0 +1,122 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import re
+import sys
+import gzip
+import json
+
+# per-run directory (next to output.txt) holding the compressed output of each filter run
+FILTER_LOGS_DIR = 'filter-logs'
+INDEX_FILE = 'index.jsonl'
+
+# lines in ant output which point at the reason for a failure
+re_failure_marker = re.compile(r'Tests with failures|ERROR: JVM J\d+ ended with an exception|BUILD FAILED'
+                               r'|Not even a single test was executed|Beasting executed no tests|===== jstack')
+MAX_MARKERS = 50
+
+
+def get_log_dir(config):
+    """Returns the directory for the filter logs of the current run or None if the run has no time stamp"""
+    if 'time_stamp' not in config:
+        return None
+    return os.path.join(config['output'], config['time_stamp'], FILTER_LOGS_DIR)
+
+
+def find_markers(output):
+    """Returns the character offset, line number and text of the failure markers found in the output"""
+    markers = []
+    for m in re_failure_marker.finditer(output):
+        start = output.rfind('\n', 0, m.start()) + 1
+        end = output.find('\n', m.end())
+        markers.append({'offset': start, 'line': output.count('\n', 0, start) + 1,
+                        'text': output[start:end if end != -1 else len(output)].strip()})
+        if len(markers) == MAX_MARKERS:
+            break
+    return markers
+
+
+def write(log_dir, test_name, filter_name, status, duration, output, placement=None):
+    """Compresses the output of a filter run into its own file and appends an entry for it to the index.
+    placement, if given, is recorded in the entry as the cpus and cgroup the run was isolated in.
+
+    Returns the index entry, whose 'file' is relative to log_dir.
+    """
+    if not os.path.exists(log_dir):
+        try:
+            os.makedirs(log_dir)
+        except OSError:
+            # another filter run created it
+            if not os.path.isdir(log_dir):
+                raise
+    # filter runs in parallel log the same test and filter, the name is claimed by creating the file exclusively
+    n = 0
+    while True:
+        file_name = '%s.%s.%d.log.gz' % (test_name, filter_name, n)
+        try:
+            fd = os.open(os.path.join(log_dir, file_name), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            break
+        except FileExistsError:
+            n += 1
+    with os.fdopen(fd, 'wb') as raw:
+        with gzip.GzipFile(filename=file_name, mode='wb', fileobj=raw) as f:
+            f.write(output.encode('utf-8'))
+    entry = {'test': test_name, 'filter': filter_name, 'status': status, 'duration': round(duration, 3),
+             'file': file_name, 'markers': find_markers(output)}
+    if placement is not None:
+        entry['placement'] = placement
+    # a single write to a file opened for appending is not interleaved with the entries of other processes
+    fd = os.open(os.path.join(log_dir, INDEX_FILE), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        os.write(fd, (json.dumps(entry, sort_keys=True) + '\n').encode('utf-8'))
+    finally:
+        os.close(fd)
+    return entry
+
+
+def read_index(log_dir):
+    """Returns the index entries of all filter runs logged in log_dir in the order in which they ran"""
+    index_path = os.path.join(log_dir, INDEX_FILE)
+    entries = []
+    if os.path.exists(index_path):
+        with open(index_path, 'r') as f:
+            for line in f:
+                if line.strip() != '':
+                    entries.append(json.loads(line))
+    return entries
+
+
+def read_log(log_dir, entry):
+    with gzip.open(os.path.join(log_dir, entry['file']), 'rb') as f:
+        return f.read().decode('utf-8')
+
+
+def main():
+    # usage: filter_logs.py <log_dir> [test_name]
+    log_dir = sys.argv[1]
+    test_name = sys.argv[2] if len(sys.argv) > 2 else None
+    for entry in read_index(log_dir):
+        if test_name is not None and entry['test'] != test_name:
+            continue
+        print('%s %s %s %.1f sec %s' % (entry['test'], entry['filter'], entry['status'], entry['duration'],
+                                         os.path.join(log_dir, entry['file'])))
+        for m in entry['markers']:
+            print('    line %d: %s' % (m['line'], m['text']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Finds the tests that may be affected by the changes between two revisions.
+
+A class dependency graph is built by parsing the package, imports and class name references of every java file in
+the checkout. A test is affected if its class depends, directly or transitively, on a class whose source changed.
+Any other change inside a module's src directory (resources, test-files etc.) affects every class of the module. A
+change to a build file (see the rebuild_patterns of the build backend) or to any other file outside the src directories
+of the modules, e.g. the configsets of the solr server, the test security policy or dev-tools, affects every test.
+
+python src/python/impact.py -config /path/to/config.json -old-sha sha
+"""
+
+import os
+import re
+import sys
+import fnmatch
+import logging
+import collections
+
+import bootstrap
+import solr
+
+re_package = re.compile(r'^\s*package\s+([\w.]+)\s*;', re.MULTILINE)
+re_import = re.compile(r'^\s*import\s+(static\s+)?([\w.]+?)(\.\*)?\s*;', re.MULTILINE)
+re_class_name = re.compile(r'\b[A-Z]\w*\b')
+# comments and string literals mention class names that are not dependencies
+re_comment_or_string = re.compile(r'/\*.*?\*/|//[^\n]*|"(?:\\.|[^"\\])*"', re.DOTALL)
+
+
+# files outside the src directories of the modules that no test reads
+IGNORED_PATTERNS = ['*CHANGES.txt', '*.md']
+
+
+def get_module(path):
+    """Returns the module of a path relative to the checkout e.g. solr/core for solr/core/src/java/... or None"""
+    idx = path.find('/src/')
+    return path[:idx] if idx != -1 else None
+
+
+def affects_all_tests(checkout, path):
+    """Returns True if a change to the path, relative to the checkout, may affect any test"""
+    if checkout.is_build_file(path):
+        return True
+    return get_module(path) is None and not any(fnmatch.fnmatch(path, p) for p in IGNORED_PATTERNS)
+
+
+class DependencyGraph:
+    def __init__(self):
+        # fully qualified class name -> path relative to the checkout
+        self.paths = {}
+        # path -> fully qualified class name
+        self.classes = {}
+        # package -> simple class name -> fully qualified class name
+        self.packages = collections.defaultdict(dict)
+        # module -> fully qualified class names
+        self.modules = collections.defaultdict(set)
+        # fully qualified class name -> fully qualified class names that depend on it
+        self.dependents = collections.defaultdict(set)
+        # fully qualified class name -> fully qualified class names that it depends on
+        self.dependencies = collections.defaultdict(set)
+
+    def resolve(self, name):
+        """Returns the class that a (possibly nested or static member) name refers to or None if it is not known"""
+        while name is not None and name not in self.paths:
+            name = name.rsplit('.', 1)[0] if '.' in name else None
+        return name
+
+    def add_files(self, sources):
+        """Adds (path, source) pairs to the graph. All files must be added at once so that same package and
+        wildcard references between them can be resolved."""
+        parsed = []
+        for path, source in sources:
+            m = re_package.search(source)
+            package = m.group(1) if m is not None else ''
+            simple_name = os.path.basename(path)[:-len('.java')]
+            fqn = '%s.%s' % (package, simple_name) if package != '' else simple_name
+            self.paths[fqn] = path
+            self.classes[path] = fqn
+            self.packages[package][simple_name] = fqn
+            self.modules[get_module(path)].add(fqn)
+            parsed.append((fqn, package, re_import.findall(source),
+                           set(re_class_name.findall(re_comment_or_string.sub(' ', source)))))
+
+        for fqn, package, imports, names in parsed:
+            depends_on = set()
+            wildcards = [package]
+            for static, name, wildcard in imports:
+                if wildcard:
+                    # import a.b.* or import static a.b.C.*
+                    if name in self.packages:
+                        wildcards.append(name)
+                    else:
+                        depends_on.add(self.resolve(name))
+                else:
+                    depends_on.add(self.resolve(name))
+            for p in wildcards:
+                for simple_name in names.intersection(self.packages[p]):
+                    depends_on.add(self.packages[p][simple_name])
+            depends_on.discard(None)
+            depends_on.discard(fqn)
+            for d in depends_on:
+                self.dependents[d].add(fqn)
+            self.dependencies[fqn] = depends_on
+
+    def get_closure(self, classes, edges=None):
+        """Returns the given classes along with every class that depends on them, directly or transitively, or
+        with every class that they depend on if edges is self.dependencies"""
+        edges = edges if edges is not None else self.dependents
+        closure = set(classes)
+        queue = collections.deque(classes)
+        while len(queue) > 0:
+            for d in edges[queue.popleft()]:
+                if d not in closure:
+                    closure.add(d)
+                    queue.append(d)
+        return closure
+
+    def get_dependencies(self, classes):
+        return self.get_closure(classes, self.dependencies)
+
+    def find_tests(self, test_name):
+        """Returns the fully qualified names of the test classes with the given simple name"""
+        return sorted(fqn for fqn in self.paths if fqn.split('.')[-1] == test_name and '/src/test/' in self.paths[fqn])
+
+
+def build_graph(checkout_dir):
+    """Parses every java file in the src directory of a module in the checkout"""
+    sources = []
+    for root, dirs, files in os.walk(checkout_dir):
+        if '.git' in dirs:
+            dirs.remove('.git')
+        for name in files:
+            if not name.endswith('.java'):
+                continue
+            path = os.path.relpath(os.path.join(root, name), checkout_dir)
+            if get_module(path) is None:
+                continue
+            with open(os.path.join(root, name), 'r', encoding='utf-8', errors='replace') as f:
+                sources.append((path, f.read()))
+    graph = DependencyGraph()
+    graph.add_files(sources)
+    return graph
+
+
+class ImpactAnalyzer:
+    """Computes the tests affected by the changes since a revision, for the revision checked out in the checkout"""
+
+    def __init__(self, checkout, git_sha, logger=logging.getLogger()):
+        self.checkout = checkout
+        self.git_sha = git_sha
+        self.logger = logger
+        self.graph = None
+        # old sha -> simple names of the affected tests or None if all tests are affected
+        self.affected = {}
+
+    def get_graph(self):
+        if self.graph is None:
+            self.graph = build_graph(self.checkout.checkout_dir)
+            self.logger.info('Built dependency graph of %d classes in %d modules at git sha %s'
+                             % (len(self.graph.paths), len(self.graph.modules), self.git_sha))
+        return self.graph
+
+    def get_affected_tests(self, old_sha):
+        """Returns the simple names of the tests affected by the changes between old_sha and the checked out
+        revision or None if every test has to be considered affected"""
+        if old_sha not in self.affected:
+            self.affected[old_sha] = self.compute_affected_tests(old_sha)
+        return self.affected[old_sha]
+
+    def compute_affected_tests(self, old_sha):
+        x = os.getcwd()
+        try:
+            os.chdir(self.checkout.checkout_dir)
+            if not self.checkout.has_commit(old_sha):
+                self.logger.info('Git sha %s is not in the checkout, all tests are affected' % old_sha)
+                return None
+            changed = self.checkout.get_changed_files(old_sha, self.git_sha)
+        finally:
+            os.chdir(x)
+        if changed is None:
+            return None
+        graph = self.get_graph()
+        changed_classes = set()
+        for path in changed:
+            if affects_all_tests(self.checkout, path):
+                self.logger.info('%s changed since %s and is not in the src directory of a module, all tests are '
+                                 'affected' % (path, old_sha))
+                return None
+            module = get_module(path)
+            if module is None:
+                continue
+            if path in graph.classes:
+                changed_classes.add(graph.classes[path])
+            elif path.endswith('.java'):
+                # removed since old_sha, the classes that used it have changed too
+                continue
+            else:
+                changed_classes.update(graph.modules[module])
+        affected = set()
+        for fqn in graph.get_closure(changed_classes):
+            if '/src/test/' in graph.paths[fqn]:
+                affected.add(fqn.split('.')[-1])
+        self.logger.info('%d files changed between %s and %s affecting %d classes and %d tests'
+                         % (len(changed), old_sha, self.git_sha, len(changed_classes), len(affected)))
+        return affected
+
+    def is_affected(self, test_name, old_sha):
+        affected = self.get_affected_tests(old_sha)
+        return affected is None or test_name in affected
+
+
+def is_enabled(config):
+    return 'impact_analysis' in config and config['impact_analysis']
+
+
+def main():
+    config = bootstrap.get_config()
+    logging.basicConfig(level=logging.INFO, format=bootstrap.LOG_FORMAT)
+    if '-old-sha' not in sys.argv:
+        print('No -old-sha specified, exiting.')
+        exit(1)
+    index = sys.argv.index('-old-sha')
+    old_sha = sys.argv[index + 1]
+    checkout = solr.get_checkout(config)
+    x = os.getcwd()
+    try:
+        os.chdir(checkout.checkout_dir)
+        new_sha = checkout.get_head_sha()
+    finally:
+        os.chdir(x)
+    affected = ImpactAnalyzer(checkout, new_sha).get_affected_tests(old_sha)
+    if affected is None:
+        print('All tests are affected')
+    else:
+        for test_name in sorted(affected):
+            print(test_name)
+
+
+if __name__ == '__main__':
+    main()
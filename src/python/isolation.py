@@ -0,0 +1,268 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Isolation of concurrent filter runs on the same host.
+
+The CPUs available for filter runs are divided into slots of isolation_cores_per_run CPUs. A slot is held with a
+flock on a file in isolation_slot_dir, which is shared by all processes on the host (workers, cron runs, blame), and
+the command of a run is pinned to the CPUs of its slot before it is executed so that the JVMs it forks inherit them.
+If isolation_cgroup is the path of a cgroup v2 directory writable by this user, each run is also started in a child
+cgroup of its own with the isolation_cpu_limit and isolation_memory_limit of the configuration. The placement of a
+run (slot, CPUs, cgroup, limits and OOM kills) is recorded with its result in the filter logs.
+"""
+
+import os
+import time
+import errno
+import fcntl
+import logging
+import tempfile
+import contextlib
+
+DEFAULT_SLOT_DIR = '/tmp/clean-room-isolation'
+# cgroup v2 cpu.max period in microseconds
+CPU_PERIOD_USECS = 100000
+# seconds between attempts to find a free slot when all are held
+POLL_SECS = 1.0
+
+
+def parse_cpu_list(s):
+    """Parses a cpu list such as 0-3,8,10-11"""
+    cpus = []
+    for part in str(s).split(','):
+        part = part.strip()
+        if part == '':
+            continue
+        if '-' in part:
+            lo, hi = part.split('-')
+            cpus.extend(range(int(lo), int(hi) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+class Placement:
+    def __init__(self, slot, cpus, cgroup=None, cpu_max=None, memory_max=None):
+        self.slot = slot
+        self.cpus = cpus
+        self.cgroup = cgroup
+        self.cpu_max = cpu_max
+        self.memory_max = memory_max
+        self.oom_kills = None
+        self.attached = cgroup is not None
+
+    def preexec(self):
+        """Moves the child process into the cgroup and pins it to the CPUs before the command is executed, so that
+        every process it forks is limited too"""
+        if self.cgroup is not None:
+            try:
+                with open(os.path.join(self.cgroup, 'cgroup.procs'), 'w') as f:
+                    f.write('0')
+            except (IOError, OSError):
+                # the child cannot log, attach finds out that it is not in the cgroup
+                pass
+        if self.cpus is not None:
+            os.sched_setaffinity(0, self.cpus)
+
+    def attach(self, pid, logger=logging.getLogger()):
+        """Checks that the started command moved itself into the cgroup"""
+        if self.cgroup is None:
+            return
+        try:
+            with open('/proc/%d/cgroup' % pid, 'r') as f:
+                # 0::/clean-room/run-123-0 on cgroup v2
+                paths = [line.strip().split(':', 2)[2] for line in f if line.startswith('0::')]
+        except (IOError, OSError):
+            # the command already exited
+            return
+        if not any(p.endswith('/' + os.path.basename(self.cgroup)) for p in paths):
+            logger.warn('Process %d could not move itself into cgroup %s, the run will not be limited'
+                        % (pid, self.cgroup))
+            self.attached = False
+
+    def get_data(self):
+        if not self.attached:
+            return {'slot': self.slot, 'cpus': self.cpus, 'cgroup': None, 'cpu_max': None, 'memory_max': None,
+                    'oom_kills': None}
+        return {'slot': self.slot, 'cpus': self.cpus, 'cgroup': self.cgroup, 'cpu_max': self.cpu_max,
+                'memory_max': self.memory_max, 'oom_kills': self.oom_kills}
+
+
+class Isolation:
+    def __init__(self, cores_per_run=None, cpus=None, slot_dir=DEFAULT_SLOT_DIR, cgroup=None, cpu_limit=None,
+                 memory_limit=None, logger=logging.getLogger()):
+        self.logger = logger
+        self.slots = []
+        if cores_per_run is not None:
+            if not hasattr(os, 'sched_setaffinity'):
+                logger.warn('CPU affinity is not supported on this platform, filter runs will not be pinned')
+            else:
+                cpus = sorted(cpus if cpus is not None else os.sched_getaffinity(0))
+                self.slots = [cpus[i:i + cores_per_run] for i in range(0, len(cpus) - cores_per_run + 1,
+                                                                        cores_per_run)]
+                if len(self.slots) == 0:
+                    logger.warn('Fewer than %d CPUs available, filter runs will not be pinned' % cores_per_run)
+        self.slot_dir = slot_dir
+        self.cgroup = cgroup
+        self.cpu_max = '%d %d' % (int(float(cpu_limit) * CPU_PERIOD_USECS), CPU_PERIOD_USECS) \
+            if cpu_limit is not None else None
+        self.memory_max = str(memory_limit) if memory_limit is not None else None
+        if cgroup is not None and not self.init_cgroup():
+            self.cgroup = None
+        if self.cgroup is None:
+            # the limits are only enforced by the cgroup
+            self.cpu_max, self.memory_max = None, None
+
+    def init_cgroup(self):
+        if not os.path.exists(os.path.join(os.path.dirname(self.cgroup.rstrip('/')), 'cgroup.controllers')):
+            self.logger.warn('%s is not in a cgroup v2 hierarchy, filter runs will not be started in cgroups'
+                             % self.cgroup)
+            return False
+        try:
+            if not os.path.exists(self.cgroup):
+                os.makedirs(self.cgroup)
+            controllers = []
+            if self.cpu_max is not None:
+                controllers.append('+cpu')
+            if self.memory_max is not None:
+                controllers.append('+memory')
+            if len(controllers) > 0:
+                with open(os.path.join(self.cgroup, 'cgroup.subtree_control'), 'w') as f:
+                    f.write(' '.join(controllers))
+            return True
+        except (IOError, OSError) as e:
+            self.logger.warn('Unable to use cgroup %s, filter runs will not be started in cgroups: %s'
+                             % (self.cgroup, e))
+            return False
+
+    def try_acquire_slot(self):
+        """Returns (slot index, open slot file) of a free slot or (None, None) if all slots are held"""
+        if not os.path.exists(self.slot_dir):
+            os.makedirs(self.slot_dir)
+        for idx, cpus in enumerate(self.slots):
+            f = open(os.path.join(self.slot_dir, 'cpus-%s.lock' % '-'.join(str(c) for c in cpus)), 'a')
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return idx, f
+            except (IOError, OSError) as e:
+                f.close()
+                if e.errno not in (errno.EAGAIN, errno.EACCES):
+                    raise
+        return None, None
+
+    def create_cgroup(self):
+        """Returns the path of a new child cgroup for a run or None if it cannot be created"""
+        try:
+            # unique among the runs of all processes and of all Isolation instances in this one
+            path = tempfile.mkdtemp(dir=self.cgroup, prefix='run-%d-' % os.getpid())
+        except (IOError, OSError) as e:
+            self.logger.warn('Unable to create a cgroup in %s, the run will not be limited: %s' % (self.cgroup, e))
+            return None
+        try:
+            if self.cpu_max is not None:
+                with open(os.path.join(path, 'cpu.max'), 'w') as f:
+                    f.write(self.cpu_max)
+            if self.memory_max is not None:
+                with open(os.path.join(path, 'memory.max'), 'w') as f:
+                    f.write(self.memory_max)
+            return path
+        except (IOError, OSError) as e:
+            self.logger.warn('Unable to create cgroup %s, the run will not be limited: %s' % (path, e))
+            self.remove_cgroup(path)
+            return None
+
+    def remove_cgroup(self, path):
+        # the process group has been killed but its processes may take a moment to exit
+        for attempt in range(10):
+            try:
+                if os.path.exists(path):
+                    os.rmdir(path)
+                return
+            except OSError as e:
+                if e.errno != errno.EBUSY:
+                    break
+                time.sleep(0.1)
+        self.logger.warn('Unable to remove cgroup %s' % path)
+
+    def read_oom_kills(self, path):
+        try:
+            with open(os.path.join(path, 'memory.events'), 'r') as f:
+                for line in f:
+                    if line.startswith('oom_kill '):
+                        return int(line.split()[1])
+        except (IOError, OSError):
+            pass
+        return None
+
+    def begin(self, slot):
+        placement = Placement(slot, self.slots[slot] if slot is not None else None,
+                              self.create_cgroup() if self.cgroup is not None else None, self.cpu_max,
+                              self.memory_max)
+        self.logger.info('Placing filter run on cpus %s in cgroup %s' % (placement.cpus, placement.cgroup))
+        return placement
+
+    def end(self, placement, slot_file):
+        if placement.cgroup is not None:
+            placement.oom_kills = self.read_oom_kills(placement.cgroup)
+            if placement.oom_kills:
+                self.logger.warn('%d processes of the run were killed for exceeding the memory limit of %s'
+                                 % (placement.oom_kills, placement.cgroup))
+            self.remove_cgroup(placement.cgroup)
+        if slot_file is not None:
+            slot_file.close()
+
+    def wait_message(self):
+        self.logger.info('All %d cpu slots in %s are in use, waiting for one to be free'
+                         % (len(self.slots), self.slot_dir))
+
+    @contextlib.contextmanager
+    def place(self, timeout=None):
+        """Holds a slot, and a cgroup, for a run and yields its Placement. If no slot is free within timeout seconds,
+        the run is not pinned rather than failed, a slow run is still better than a filter result made up by the
+        wait."""
+        slot, slot_file = None, None
+        if len(self.slots) > 0:
+            t0 = time.time()
+            slot, slot_file = self.try_acquire_slot()
+            if slot is None:
+                self.wait_message()
+            while slot is None:
+                if timeout is not None and time.time() - t0 >= timeout:
+                    self.logger.warn('No cpu slot in %s was free for %d seconds, the run will not be pinned'
+                                     % (self.slot_dir, timeout))
+                    break
+                time.sleep(POLL_SECS)
+                slot, slot_file = self.try_acquire_slot()
+        placement = self.begin(slot)
+        try:
+            yield placement
+        finally:
+            self.end(placement, slot_file)
+
+
+def get_isolation(config, logger=logging.getLogger()):
+    """Returns the Isolation of the configuration or None if filter runs are not isolated"""
+    cores_per_run = int(config['isolation_cores_per_run']) if 'isolation_cores_per_run' in config else None
+    cgroup = config['isolation_cgroup'] if 'isolation_cgroup' in config else None
+    if cores_per_run is None and cgroup is None:
+        return None
+    return Isolation(cores_per_run=cores_per_run,
+                     cpus=parse_cpu_list(config['isolation_cpus']) if 'isolation_cpus' in config else None,
+                     slot_dir=config['isolation_slot_dir'] if 'isolation_slot_dir' in config else DEFAULT_SLOT_DIR,
+                     cgroup=cgroup,
+                     cpu_limit=config['isolation_cpu_limit'] if 'isolation_cpu_limit' in config else None,
+                     memory_limit=config['isolation_memory_limit'] if 'isolation_memory_limit' in config else None,
+                     logger=logger)
@@ -22,6 +22,9 @@ import json
 
 import bootstrap
 import jenkins_clean_room
+import locks
+import metrics
+import runner
 
 
 def main():
@@ -61,6 +64,7 @@ def main():
         level = logging.DEBUG
 
     bootstrap.setup_logging(output_dir, time_stamp, level)
+    runner.install_signal_handlers()
 
     back_test_path = os.path.join(output_dir, 'jenkins_back_test.json')
     if not os.path.exists(back_test_path):
@@ -69,8 +73,7 @@ def main():
         while st < end_date:
             dates.append(st.strftime(date_format))
             st = st + delta_days
-        with open(back_test_path, 'w') as f:
-            json.dump(dates, f)
+        locks.dump_json(dates, back_test_path)
 
     with open(back_test_path, 'r') as f:
         dates = json.load(f)
@@ -85,10 +88,13 @@ def main():
 
     logging.info('Selected date %s' % test_date)
     config['time_stamp'] = time_stamp
-    jenkins_clean_room.do_work(test_date, config)
+    try:
+        with metrics.phase('total'):
+            jenkins_clean_room.do_work(test_date, config)
+    finally:
+        metrics.write_metrics(config, 'jenkins_clean_room')
     dates.remove(test_date.strftime(date_format))
-    with open(back_test_path, 'w') as f:
-        json.dump(dates, f)
+    locks.dump_json(dates, back_test_path)
 
 
 if __name__ == '__main__':
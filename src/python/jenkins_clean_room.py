@@ -18,7 +18,6 @@ import sys
 import datetime
 import os
 import logging
-import shutil
 import requests
 import gzip
 
@@ -28,6 +27,14 @@ import solr
 import constants
 import utils
 import room_filter
+import failure_timeline
+import impact
+import metrics
+import runner
+import dependency_cache
+import failure_archive
+import locks
+import scheduler
 from bootstrap import get_module_for_test
 
 
@@ -40,7 +47,7 @@ def generate_shas(start_date, end_date, checkout):
                'rev-list',
                '--after="%s"' % start_date.strftime('%Y-%m-%d %H:%M:%S'),
                '--before="%s"' % end_date.strftime('%Y-%m-%d %H:%M:%S'),
-               'master']
+               'origin/%s' % checkout.branch]
         output, _ = utils.run_get_output(cmd)
         for line in output.split('\n'):
             logging.debug(line)
@@ -51,25 +58,90 @@ def generate_shas(start_date, end_date, checkout):
         os.chdir(x)
 
 
-def do_work(test_date, config):
+def format_filter_status(status, failed_filter):
+    status_name = utils.STATUS_NAMES.get(status, status)
+    return status_name if status == utils.GOOD_STATUS else '%s:%s' % (failed_filter, status_name)
+
+
+def get_reproduction_status(test_name, result, methods=None):
+    """Returns (reproducible, filter status, method name -> status or None) for the result of reproducing the failure
+    of a test, the result of room_filter.reproduce_methods if the failed methods are given else of run_filters"""
+    if methods is None:
+        filter_result, failed_filter = result
+        if filter_result != utils.GOOD_STATUS:
+            return True, format_filter_status(filter_result, failed_filter), None
+        return False, None, None
+    reproducible = False
+    filter_status = None
+    method_statuses = {}
+    for m in methods:
+        filter_result, failed_filter = result[m]
+        method_status = format_filter_status(filter_result, failed_filter)
+        if filter_result != utils.GOOD_STATUS and not reproducible:
+            reproducible = True
+            filter_status = method_status
+        logging.info('test %s method %s: %s' % (test_name, m, method_status))
+        method_statuses[m] = method_status
+    return reproducible, filter_status, method_statuses
+
+
+def get_last_filtered(entry):
+    """Returns {'git_sha': ..., 'status': ...} of the last filter run of a detained test or None"""
+    if entry.extra_info is None or 'last_filtered' not in entry.extra_info:
+        return None
+    return entry.extra_info['last_filtered']
+
+
+def read_failure_report(fail_report_path, jenkins_jobs):
+    """Yields (test_name, method_name, jenkins) for each failure in the given report seen on any of jenkins_jobs"""
+    with gzip.open(fail_report_path, 'rb') as f:
+        for line in f:
+            test_name, method_name, jenkins = utils.to_str(line).strip().split(',')
+            test_name = str(test_name)
+            test_name = test_name.split('.')[-1]
+            for j in jenkins_jobs:
+                if jenkins.count(j) > 0:
+                    yield test_name, method_name, jenkins
+                    break
+
+
+def do_work(test_date, config, workspace=None, args=None):
+    """Moves the tests between the rooms for the failures on test_date holding the lock on the checkout. args are the
+    command line parameters, sys.argv by default."""
+    metrics.reset_gauges()
+    with locks.lock(config['checkout'], timeout=locks.get_timeout(config)):
+        _do_work(test_date, config, workspace, args if args is not None else sys.argv)
+
+
+def _do_work(test_date, config, workspace, args):
     logger = logging.getLogger()
     i = logger.info
     w = logger.warn
     e = logger.error
+    budget = scheduler.get_budget(config)
 
     test_date_str = test_date.strftime('%Y-%m-%d %H-%M-%S')
 
     fail_report_path = None
-    if '-fail-report-path' in sys.argv:
-        index = sys.argv.index('-fail-report-path')
-        fail_report_path = sys.argv[index + 1]
+    # failures are read from the failure archive instead of the raw report once it has been folded in
+    archive = None
+    if '-fail-report-path' in args:
+        index = args.index('-fail-report-path')
+        fail_report_path = args[index + 1]
     else:
+        archive = failure_archive.get_archive(config) if failure_archive.is_enabled(config) else None
+    if archive is not None and archive.has_date(test_date):
+        metrics.inc('cache_hits_total', cache='jenkins_report')
+    elif fail_report_path is None:
         # download the jenkins failure report if not exists
         jenkins_archive = os.path.join(config['output'], 'jenkins-archive')
         if not os.path.exists(jenkins_archive):
             os.makedirs(jenkins_archive)
         fail_report_path = os.path.join(jenkins_archive, '%s.method-failures.csv.gz' % test_date.strftime('%Y-%m-%d'))
-        if not os.path.exists(fail_report_path):
+        if os.path.exists(fail_report_path):
+            metrics.inc('cache_hits_total', cache='jenkins_report')
+        else:
+            metrics.inc('cache_misses_total', cache='jenkins_report')
             # http://fucit.org/solr-jenkins-reports/reports/archive/daily/2017-11-21.method-failures.csv.gz
             failure_report_url = '%s/%s.method-failures.csv.gz' \
                                  % (config['failure_report_url'], test_date.strftime('%Y-%m-%d'))
@@ -77,63 +149,83 @@ def do_work(test_date, config):
             with open(fail_report_path, 'wb') as f:
                 f.write(r.content)
 
-    if fail_report_path is None or not os.path.exists(fail_report_path):
-        e('Report at %s does not exist' % fail_report_path)
-        exit(0)
+    if archive is None or not archive.has_date(test_date):
+        if fail_report_path is None or not os.path.exists(fail_report_path):
+            e('Report at %s does not exist' % fail_report_path)
+            exit(0)
+        if archive is not None:
+            n = archive.fold(fail_report_path, test_date)
+            i('Folded %d failures from %s into the failure archive' % (n, fail_report_path))
 
     checkout_dir = config['checkout']
     output_dir = config['output']
     reports_dir = config['report']
 
-    if '-clean-build' in sys.argv:
-        if os.path.exists(checkout_dir):
-            w('Deleting checkout directory: %s' % checkout_dir)
-            shutil.rmtree(checkout_dir)
+    if '-clean-build' in args:
+        bootstrap.clean_build(config, workspace)
 
     if not os.path.exists(reports_dir):
         i('Make directory: %s' % reports_dir)
         os.makedirs(reports_dir)
 
     revision = 'LATEST'
-    if '-revision' in sys.argv:
-        index = sys.argv.index('-revision')
-        revision = sys.argv[index + 1]
+    if '-revision' in args:
+        index = args.index('-revision')
+        revision = args[index + 1]
 
     run_filters = True
-    if '-skip-filters' in sys.argv:
+    if '-skip-filters' in args:
         run_filters = False
 
-    # checkout project code
-    i('Checking out project source code from %s in %s revision: %s' % (config['repo'], checkout_dir, revision))
-    checkout = solr.LuceneSolrCheckout(config['repo'], checkout_dir, revision)
-    checkout.checkout()
-
-    # find the sha for the given test_date and check it out
-    start_date = test_date.replace(hour=0, minute=0, second=0)
-    end_date = test_date.replace(hour=23, minute=59, second=59)
-    i('Finding commits between %s and %s' % (start_date.strftime('%Y-%m-%d %H:%M:%S'),
-                                             end_date.strftime('%Y-%m-%d %H:%M:%S')))
-    shas = generate_shas(start_date, end_date, checkout)
-    i('Found SHAs: %s' % ','.join(shas))
-    if len(shas) == 0:
-        i('No commits found on test_date %s, skipping.' % test_date_str)
-        return
-    revision = shas[-1]
-    i('Generated shas:  %s' % shas)
-    i('Using revision %s for test_date %s' % (revision, test_date_str))
-
-    checkout = solr.LuceneSolrCheckout(config['repo'], checkout_dir, revision)
-    checkout.checkout()
-    git_sha, commit_date = checkout.get_git_rev()
-    i('Checked out lucene/solr artifacts from GIT SHA %s with date %s' % (git_sha, commit_date))
+    with metrics.phase('checkout'):
+        # checkout project code
+        i('Checking out project source code from %s in %s revision: %s' % (config['repo'], checkout_dir, revision))
+        checkout = solr.get_checkout(config, revision)
+        if workspace is not None:
+            workspace.checkout(checkout)
+        else:
+            checkout.checkout()
+
+        # find the sha for the given test_date and check it out
+        start_date = test_date.replace(hour=0, minute=0, second=0)
+        end_date = test_date.replace(hour=23, minute=59, second=59)
+        i('Finding commits between %s and %s' % (start_date.strftime('%Y-%m-%d %H:%M:%S'),
+                                                 end_date.strftime('%Y-%m-%d %H:%M:%S')))
+        shas = generate_shas(start_date, end_date, checkout)
+        i('Found SHAs: %s' % ','.join(shas))
+        if len(shas) == 0:
+            i('No commits found on test_date %s, skipping.' % test_date_str)
+            return
+        revision = shas[-1]
+        i('Generated shas:  %s' % shas)
+        i('Using revision %s for test_date %s' % (revision, test_date_str))
+
+        checkout = solr.get_checkout(config, revision)
+        if workspace is not None:
+            workspace.checkout(checkout)
+        else:
+            checkout.checkout()
+        git_sha, commit_date = checkout.get_git_rev()
+        i('Checked out lucene/solr artifacts from GIT SHA %s with date %s' % (git_sha, commit_date))
 
     include = config['include'].split('|') if 'include' in config else ['*.java']
     exclude = config['exclude'].split('|') if 'exclude' in config else []
 
-    i('Reading test names from test directories matching: src/test')
-    run_tests = bootstrap.gather_interesting_tests(checkout_dir, exclude, include)
-
-    clean_room_data, detention_data = bootstrap.load_validate_room_data(config, output_dir, revision)
+    with metrics.phase('gather_tests'):
+        i('Reading test names from test directories matching: src/test')
+        if workspace is not None:
+            run_tests = workspace.gather_interesting_tests(checkout_dir, git_sha, exclude, include)
+        else:
+            run_tests = bootstrap.gather_interesting_tests(checkout_dir, exclude, include)
+
+    with metrics.phase('load_rooms'):
+        clean_room_data, detention_data = bootstrap.load_validate_room_data(config, output_dir, revision)
+        timeline = failure_timeline.load(config)
+        deferred = scheduler.load_deferred(config)
+    # (kind, test name) -> record of the jobs deferred by the previous run, the jobs deferred by this run
+    previous = dict(((d['kind'], d['test']), d) for d in deferred)
+    # jobs are only deferred when filters are run, otherwise the deferred jobs are kept for the next run that does
+    next_deferred = [] if run_filters else deferred
 
     for test in clean_room_data['tests']:
         if 'module' not in clean_room_data['tests'][test]:
@@ -146,10 +238,7 @@ def do_work(test_date, config):
     detention = clean_room.Room('detention', detention_data)
 
     # Building filters
-    filters = []
-    for f in config['filters']:
-        ff = room_filter.Filter(f['name'], f['test'], tests_jvms=config['tests_jvms'])
-        filters.append(ff)
+    filters = room_filter.get_filters(config)
 
     num_tests = 0
     for k in run_tests:
@@ -176,62 +265,184 @@ def do_work(test_date, config):
                     clean.enter(t, m, commit_date_str, git_sha)
                     new_tests.append((m, t))
 
-    with gzip.open(fail_report_path, 'rb') as f:
-        jenkins_jobs = config['jenkins_jobs']
+    with metrics.phase('demotions'):
+        if archive is not None:
+            failures = [(t, m, j) for d, t, m, j in
+                        archive.get_failures(test_date, test_date, jenkins_jobs=config['jenkins_jobs'])]
+        else:
+            failures = list(read_failure_report(fail_report_path, config['jenkins_jobs']))
+        # test name -> failed methods, reproduced one method at a time if any filter has a method command
+        failed_methods = {}
+        if room_filter.has_method_filters(filters):
+            for test_name, method_name, jenkins in failures:
+                if method_name.strip() != '':
+                    methods = failed_methods.setdefault(test_name, [])
+                    if method_name.strip() not in methods:
+                        methods.append(method_name.strip())
+        # test name -> result of reproducing its failure, tests missing from it were deferred to the next run
+        reproductions = {}
+        carried_over = []
+        if run_filters:
+            # the tests leaving the clean room today come first, then the reproductions deferred by the previous
+            # runs, oldest first, and last the new failures of tests that are already in detention
+            demoted, failed_again = [], []
+            for test_name in sorted(set(f[0] for f in failures)):
+                job = (get_module_for_test(run_tests, test_name), test_name)
+                (demoted if clean.has(test_name) else failed_again).append(job)
+            failed_today = set(f[0] for f in failures)
+            for d in sorted(deferred, key=lambda d: d['since']):
+                if d['kind'] == scheduler.REPRODUCE and d['test'] not in failed_today and detention.has(d['test']):
+                    carried_over.append((d['module'], d['test']))
+                    if 'methods' in d and room_filter.has_method_filters(filters):
+                        failed_methods[d['test']] = d['methods']
+
+            def reproduce(test_module, test_name):
+                if test_name in failed_methods:
+                    i('running filters on failed methods %s of test %s to see if we can reproduce the failure seen '
+                      'on jenkins' % (failed_methods[test_name], test_name))
+                    return room_filter.reproduce_methods(filters, test_module, test_name, failed_methods[test_name])
+                i('running filters on test %s to see if we can reproduce the failure seen on jenkins' % test_name)
+                return room_filter.run_filters(filters, test_module, test_name)
+
+            jobs = demoted + carried_over + failed_again
+            reproductions, not_run = scheduler.run_jobs(
+                budget, jobs, reproduce,
+                lambda chunk: bootstrap.run_filters_ahead(config, filters, [j for j in chunk
+                                                                            if j[1] not in failed_methods],
+                                                          git_sha, checkout_dir, budget),
+                scheduler.get_chunk_size(config))
+            for test_module, test_name in not_run:
+                next_deferred.append(scheduler.defer(scheduler.REPRODUCE, test_module, test_name, commit_date_str,
+                                                     previous.get((scheduler.REPRODUCE, test_name)),
+                                                     failed_methods.get(test_name)))
         uniq_failed_tests = set()
-        for line in f:
-            test_name, method_name, jenkins = line.strip().split(',')
-            test_name = str(test_name)
-            test_name = test_name.split('.')[-1]
-            for j in jenkins_jobs:
-                if jenkins.count(j) > 0:
-                    good_sha = None
-                    if clean.exit(test_name):
-                        i('test %s exited clean room on %s on git sha %s' % (test_name, commit_date_str, git_sha))
-                        good_sha = clean.get_exited()[test_name]['git_sha']
-                    test_module = get_module_for_test(run_tests, test_name)
-                    if test_name not in uniq_failed_tests:
-                        reproducible = False
-                        if run_filters:
-                            i('test %s set to enter detention, running filters to see '
-                              'if we can reproduce the failure seen on jenkins' % test_name)
-                            for ff in filters:
-                                filter_result = ff.filter(test_module, test_name)
-                                if filter_result != utils.GOOD_STATUS:
-                                    reproducible = True
-                                    break
-                        i('test %s entering detention on %s on git sha %s' % (test_name, commit_date_str, git_sha))
-                        i('test %s failure is %s' % (test_name, 'reproducible' if reproducible else 'not reproducible'))
-                        uniq_failed_tests.add(test_name)
-                        detention.enter(test_name, test_module, commit_date_str, git_sha,
-                                        extra_info={'reproducible': reproducible, 'good_sha': good_sha})
-
-    # a test that hasn't failed in N days, should be promoted to clean room
-    i('Finding tests that have not failed for the past %d days since %s'
-      % (config['promote_if_not_failed_days'], test_date_str))
-    detained = detention.get_data()['tests']
-    promote = []
-    for test in detained:
-        # {'name': name, 'entry_date': date_s, 'git_sha' : git_sha, 'module': test_module}
-        data = detained[test]
-        entry_date = datetime.datetime.strptime(data['entry_date'], '%Y-%m-%d %H-%M-%S')
-        if entry_date < test_date - datetime.timedelta(days=config['promote_if_not_failed_days']):
+        for test_name, method_name, jenkins in failures:
+            good_sha = None
+            if clean.has(test_name):
+                good_sha = clean.get_entry(test_name).git_sha
+                clean.exit(test_name)
+                i('test %s exited clean room on %s on git sha %s' % (test_name, commit_date_str, git_sha))
+            test_module = get_module_for_test(run_tests, test_name)
+            if test_name not in uniq_failed_tests:
+                reproducible = False
+                filter_status = None
+                extra_info = {}
+                if run_filters and test_name not in reproductions:
+                    # whether it is reproducible is unknown until the next run reproduces it
+                    reproducible = None
+                    extra_info['deferred'] = True
+                elif run_filters:
+                    reproducible, filter_status, method_statuses = get_reproduction_status(
+                        test_name, reproductions[test_name], failed_methods.get(test_name))
+                    if method_statuses is not None:
+                        extra_info['methods'] = method_statuses
+                i('test %s entering detention on %s on git sha %s' % (test_name, commit_date_str, git_sha))
+                i('test %s failure is %s' % (test_name, 'deferred to the next run' if reproducible is None
+                                             else 'reproducible' if reproducible else 'not reproducible'))
+                uniq_failed_tests.add(test_name)
+                timeline.record(test_name, commit_date_str)
+                if timeline.indexed and not timeline.is_tracked(test_name):
+                    timeline.track(test_name)
+                extra_info.update({'reproducible': reproducible, 'good_sha': good_sha, 'filter_status': filter_status})
+                if run_filters and reproducible is not None:
+                    extra_info['last_filtered'] = {'git_sha': git_sha, 'status': filter_status or 'good'}
+                detention.enter(test_name, test_module, commit_date_str, git_sha, extra_info=extra_info)
+
+        # the reproductions deferred by the previous runs update the entries of the tests, still in detention
+        for test_module, test_name in carried_over:
+            if test_name not in reproductions:
+                continue
+            entry = detention.get_entry(test_name)
+            if entry.extra_info is None:
+                entry.extra_info = {}
+            reproducible, filter_status, method_statuses = get_reproduction_status(
+                test_name, reproductions[test_name], failed_methods.get(test_name))
+            i('deferred reproduction of test %s on git sha %s is %s'
+              % (test_name, git_sha, 'reproducible' if reproducible else 'not reproducible'))
+            entry.extra_info.pop('deferred', None)
+            entry.extra_info.update({'reproducible': reproducible, 'filter_status': filter_status,
+                                     'last_filtered': {'git_sha': git_sha, 'status': filter_status or 'good'}})
+            if method_statuses is not None:
+                entry.extra_info['methods'] = method_statuses
+
+    with metrics.phase('promotions'):
+        # a test that hasn't failed in N days, should be promoted to clean room
+        i('Finding tests that have not failed for the past %d days since %s'
+          % (config['promote_if_not_failed_days'], test_date_str))
+        cutoff = failure_timeline.format_date(
+            test_date - datetime.timedelta(days=config['promote_if_not_failed_days']))
+        # the saved heap already holds the tests in detention, it is only rebuilt if it was not saved or is out of
+        # sync with the detention data e.g. after the data was edited by hand
+        if not timeline.indexed or not timeline.tracks_exactly(detention.get_tests()):
+            i('Rebuilding the failure timeline of %d tests in detention' % detention.num_tests())
+            # the entry date of a detained test is its last failure, also covers tests detained before the timeline
+            # existed
+            for data in detention.get_entries():
+                timeline.record(data.name, data.entry_date)
+            timeline.track_all(detention.get_tests())
+        promote = []
+        for test_name in timeline.pop_not_failed_since(cutoff):
+            data = detention.get_entry(test_name)
             promote.append(data)
-            i('%s last failed at %s' % (data['name'], data['entry_date']))
-
-    for p in promote:
-        promotable = True
+            i('%s last failed at %s, %d failures on record' % (test_name, data.entry_date,
+                                                                len(timeline.get_failures(test_name))))
+
+        # test name -> whether the last filter run passed, for tests not affected by any change since that run
+        unaffected = {}
+        if run_filters and impact.is_enabled(config):
+            analyzer = impact.ImpactAnalyzer(checkout, git_sha)
+            for p in promote:
+                last_filtered = get_last_filtered(p)
+                if last_filtered is None:
+                    i('test %s has no filter run on record, running filters' % p.name)
+                elif analyzer.is_affected(p.name, last_filtered['git_sha']):
+                    i('test %s is affected by changes since its last filter run on git sha %s, running filters'
+                      % (p.name, last_filtered['git_sha']))
+                else:
+                    i('test %s is not affected by any change since its last filter run on git sha %s which was %s, '
+                      'skipping filters' % (p.name, last_filtered['git_sha'], last_filtered['status']))
+                    metrics.inc('filter_skips_total', reason='unaffected')
+                    unaffected[p.name] = last_filtered['status'] == utils.STATUS_NAMES[utils.GOOD_STATUS]
+
+        # test name -> (status, failed filter), tests missing from it were deferred to the next run
+        checks = {}
         if run_filters:
-            i('test %s set to exit detention, running filters to see if it is worthy' % p['name'])
-            for f in filters:
-                if not f.filter(p['module'], p['name']) == utils.GOOD_STATUS:
-                    promotable = False
-                    break
-        if promotable:
-            i('test %s exiting detention on %s on git sha %s' % (p['name'], commit_date_str, git_sha))
-            detention.exit(p['name'])
-            clean.enter(p['name'], p['module'], commit_date_str, git_sha)
-            i('test %s entering clean room on %s on git sha %s' % (p['name'], commit_date_str, git_sha))
+            # the tests are popped in order of their last failure, so the ones detained the longest are checked first
+            def check(test_module, test_name):
+                i('test %s set to exit detention, running filters to see if it is worthy' % test_name)
+                return room_filter.run_filters(filters, test_module, test_name)
+
+            checks, not_run = scheduler.run_jobs(
+                budget, [(p.module, p.name) for p in promote if p.name not in unaffected], check,
+                lambda chunk: bootstrap.run_filters_ahead(config, filters, chunk, git_sha, checkout_dir, budget),
+                scheduler.get_chunk_size(config))
+            for test_module, test_name in not_run:
+                next_deferred.append(scheduler.defer(scheduler.PROMOTE, test_module, test_name, commit_date_str,
+                                                     previous.get((scheduler.PROMOTE, test_name))))
+        for p in promote:
+            promotable = True
+            if p.name in unaffected:
+                promotable = unaffected[p.name]
+            elif run_filters and p.name not in checks:
+                i('test %s stays in detention, checking whether it is worthy is deferred to the next run' % p.name)
+                promotable = False
+            elif run_filters:
+                status, failed_filter = checks[p.name]
+                promotable = status == utils.GOOD_STATUS
+                if not promotable:
+                    # stays in detention, remember the verdict so that it is reused until the test is affected
+                    if p.extra_info is None:
+                        p.extra_info = {}
+                    p.extra_info['last_filtered'] = {'git_sha': git_sha,
+                                                     'status': format_filter_status(status, failed_filter)}
+            if not promotable:
+                # popped from the timeline, it is checked again on the next run
+                timeline.track(p.name)
+            else:
+                i('test %s exiting detention on %s on git sha %s' % (p.name, commit_date_str, git_sha))
+                detention.exit(p.name)
+                clean.enter(p.name, p.module, commit_date_str, git_sha)
+                i('test %s entering clean room on %s on git sha %s' % (p.name, commit_date_str, git_sha))
 
     # to be extra safe, assert that no test clean room is also in detention and vice-versa
     for t in clean.get_tests():
@@ -244,26 +455,34 @@ def do_work(test_date, config):
             e('test %s is in both clean room and detention. This isn\'t supposed to happen' % t)
             exit(1)
 
-    bootstrap.save_detention_data(config['name'], detention.get_data(), '%s/detention_data.json' % output_dir)
-    bootstrap.save_clean_room_data(config['name'], clean.get_data(), '%s/clean_room_data.json' % output_dir)
+    if dependency_cache.is_enabled(config):
+        dependency_cache.snapshot(config, checkout_dir)
 
-    report_file = bootstrap.write_report(config, clean, detention, test_date, [x[1] for x in new_tests])
+    with metrics.phase('save'):
+        bootstrap.save_detention_data(config['name'], detention.get_data(), '%s/detention_data.json' % output_dir)
+        bootstrap.save_clean_room_data(config['name'], clean.get_data(), '%s/clean_room_data.json' % output_dir)
+        failure_timeline.save(config, timeline)
+        scheduler.save_deferred(config, next_deferred)
+
+        report_file = bootstrap.write_report(config, clean, detention, test_date, [x[1] for x in new_tests],
+                                             next_deferred)
+    metrics.record_rooms(clean, detention, new_tests)
+    for kind in (scheduler.REPRODUCE, scheduler.PROMOTE):
+        metrics.set_gauge('deferred_jobs', len([d for d in next_deferred if d['kind'] == kind]), kind=kind)
     i('Report written to: %s' % report_file)
     run_log_dir = '%s/%s' % (output_dir, config['time_stamp'])
     run_log_file = '%s/output.txt' % run_log_dir
     i('Logs written to: %s' % run_log_file)
 
 
-def main():
-    start = datetime.datetime.now()
-    time_stamp = '%04d.%02d.%02d.%02d.%02d.%02d' % (
-        start.year, start.month, start.day, start.hour, start.minute, start.second)
-
+def get_test_date(start, args=None):
+    """Returns the -test-date given in args, the command line by default, or the day before start"""
+    args = args if args is not None else sys.argv
     # in the format 2017-11-21
     test_date = None
-    if '-test-date' in sys.argv:
-        index = sys.argv.index('-test-date')
-        test_date = sys.argv[index + 1]
+    if '-test-date' in args:
+        index = args.index('-test-date')
+        test_date = args[index + 1]
         test_date = datetime.datetime.strptime(test_date, '%Y.%m.%d.%H.%M.%S')
     else:
         # set to now - 1DAY so that we can capture changes correctly
@@ -274,6 +493,15 @@ def main():
         # leaves a tiny window where test failures aren't processed at all.
         # so we choose the previous day for which we know all commits have already happened
         test_date = start - datetime.timedelta(days=1)
+    return test_date
+
+
+def main():
+    start = datetime.datetime.now()
+    time_stamp = '%04d.%02d.%02d.%02d.%02d.%02d' % (
+        start.year, start.month, start.day, start.hour, start.minute, start.second)
+
+    test_date = get_test_date(start)
 
     config = bootstrap.get_config()
 
@@ -288,7 +516,12 @@ def main():
 
     config['time_stamp'] = time_stamp
     bootstrap.setup_logging(output_dir, time_stamp, level)
-    do_work(test_date, config)
+    runner.install_signal_handlers()
+    try:
+        with metrics.phase('total'):
+            do_work(test_date, config)
+    finally:
+        metrics.write_metrics(config, 'jenkins_clean_room')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,148 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Advisory locks and atomic writes for the files and directories shared by the scripts.
+
+The lock on a resource (the checkout, a room data file, the report directory) is a flock on <resource>.lock, which
+is never deleted, so that a jenkins_clean_room run from cron, a blame and a reports run can safely be started on the
+same directories at the same time. Readers of a file take a shared lock and writers an exclusive one. A thread may
+acquire a lock it already holds, e.g. for configurations sharing a workspace checkout, other threads of the same
+process wait for it like other processes do. A shared lock cannot be upgraded: flock converts it by releasing it
+first, so a writer that reads the file takes the exclusive lock from the start. Files are written to a temporary file in the same directory and renamed over the old one so
+that readers always see either the old or the new contents, never a partial file.
+"""
+
+import os
+import json
+import time
+import tempfile
+import errno
+import fcntl
+import logging
+import threading
+import contextlib
+
+# seconds between attempts to acquire a lock held by another process
+POLL_SECS = 1.0
+
+# (thread id, lock path) -> [open lock file, number of times acquired, shared] of the locks held by each thread
+# flock locks belong to the open file, so a thread opening the lock file again waits for the other threads
+_held = {}
+_held_lock = threading.Lock()
+
+
+def get_lock_path(path):
+    return '%s.lock' % os.path.abspath(path).rstrip(os.sep)
+
+
+def get_timeout(config):
+    """Seconds to wait for a lock held by another process before giving up, None to wait forever"""
+    return float(config['lock_timeout']) if 'lock_timeout' in config and config['lock_timeout'] else None
+
+
+def _flock(f, lock_path, shared, timeout, logger):
+    mode = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    t0 = time.time()
+    waiting = False
+    while True:
+        try:
+            fcntl.flock(f.fileno(), mode | fcntl.LOCK_NB)
+            break
+        except (IOError, OSError) as e:
+            if e.errno not in (errno.EAGAIN, errno.EACCES):
+                raise
+        if not waiting:
+            logger.info('Waiting for %s lock on %s held by another process' % ('shared' if shared else 'exclusive',
+                                                                                lock_path))
+            waiting = True
+        if timeout is not None and time.time() - t0 >= timeout:
+            raise RuntimeError('Timed out after %d seconds waiting for lock on %s' % (timeout, lock_path))
+        time.sleep(POLL_SECS)
+    if waiting:
+        logger.info('Acquired lock on %s after %.1f seconds' % (lock_path, time.time() - t0))
+
+
+@contextlib.contextmanager
+def lock(path, shared=False, timeout=None, logger=logging.getLogger()):
+    """Holds an exclusive, or shared, lock on the resource at path for the duration of the with block"""
+    lock_path = get_lock_path(path)
+    key = (threading.get_ident(), lock_path)
+    with _held_lock:
+        held = _held.get(key)
+        if held is not None:
+            held[1] += 1
+    if held is not None:
+        try:
+            if held[2] and not shared:
+                raise RuntimeError('Cannot take an exclusive lock on %s while holding a shared one' % lock_path)
+            yield
+        finally:
+            with _held_lock:
+                held[1] -= 1
+        return
+
+    parent = os.path.dirname(lock_path)
+    if not os.path.exists(parent):
+        os.makedirs(parent)
+    f = open(lock_path, 'a')
+    try:
+        _flock(f, lock_path, shared, timeout, logger)
+    except BaseException:
+        f.close()
+        raise
+    with _held_lock:
+        _held[key] = [f, 1, shared]
+    try:
+        yield
+    finally:
+        with _held_lock:
+            del _held[key]
+        # closing the file releases the flock
+        f.close()
+
+
+def write_atomic(path, data):
+    """Replaces the file at path with data, str or bytes"""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='%s.' % os.path.basename(path),
+                               suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb' if isinstance(data, bytes) else 'w') as f:
+            f.write(data)
+        # mkstemp creates the file readable by its owner only
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def dump_json(data, path, **kwargs):
+    """Replaces the file at path with data as json, kwargs are passed to json.dumps"""
+    write_atomic(path, json.dumps(data, **kwargs))
+
+
+def load_json(path, default=None):
+    """Returns the json in the file at path or default if the file does not exist e.g. because another process
+    renamed or removed it"""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (IOError, OSError):
+        return default
+    except ValueError:
+        # never mistaken for a missing file, saving the default would wipe the data
+        logging.error('Corrupt json in %s' % path)
+        raise
@@ -0,0 +1,186 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import re
+import time
+import logging
+import resource
+from contextlib import contextmanager
+
+import locks
+
+PREFIX = 'clean_room_'
+
+# name -> (type, help)
+_METRICS = {
+    'runs_total': ('counter', 'Number of completed runs'),
+    'room_tests': ('gauge', 'Number of tests in each room at the end of the last run'),
+    'promotions_total': ('counter', 'Tests promoted from detention to the clean room'),
+    'demotions_total': ('counter', 'Tests demoted from the clean room to detention'),
+    'new_tests_total': ('counter', 'New tests that entered the clean room'),
+    'filter_invocations_total': ('counter', 'Filter runs by filter name and result'),
+    'filter_seconds_total': ('counter', 'Wall clock seconds spent running filters'),
+    'filter_skips_total': ('counter', 'Filter runs skipped by reason'),
+    'cache_hits_total': ('counter', 'Cache hits by cache name'),
+    'cache_misses_total': ('counter', 'Cache misses by cache name'),
+    'deferred_jobs': ('gauge', 'Filter jobs deferred to the next run by kind of job'),
+    'phase_duration_seconds': ('gauge', 'Wall clock seconds spent in each phase of the last run'),
+    'subprocesses_total': ('counter', 'Subprocesses launched'),
+    'child_cpu_seconds_total': ('counter', 'User plus system CPU seconds consumed by child processes'),
+    'last_run_timestamp_seconds': ('gauge', 'Unix time at which the last run finished'),
+}
+
+# (name, ((label, value), ...)) -> value
+_values = {}
+# child CPU seconds already accounted for by a previous write_metrics call in this process
+_child_cpu_seconds = [0.0]
+
+# some_metric{a="b",c="d"} 1.0
+re_sample = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)$')
+re_label = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+re_escape = re.compile(r'\\(.)')
+
+
+def _key(name, labels):
+    if name not in _METRICS:
+        raise ValueError('Unknown metric: %s' % name)
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """Increments the counter with the given name and labels by value"""
+    k = _key(name, labels)
+    _values[k] = _values.get(k, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    k = _key(name, labels)
+    _values[k] = value
+
+
+def reset_gauges():
+    """Forgets the gauges of the previous run so that a process running several configurations or commands does not
+    write them into the metrics of the next one"""
+    for k in [k for k in _values if _METRICS[k[0]][0] == 'gauge']:
+        del _values[k]
+
+
+@contextmanager
+def phase(name):
+    """Records the wall clock time spent inside the with block as the duration of the given phase"""
+    t0 = time.time()
+    try:
+        yield
+    finally:
+        set_gauge('phase_duration_seconds', time.time() - t0, phase=name)
+
+
+def record_rooms(clean, detention, new_tests=None):
+    set_gauge('room_tests', clean.num_tests(), room=clean.name)
+    set_gauge('room_tests', detention.num_tests(), room=detention.name)
+    # see the comments in bootstrap.write_report on why exits are used here
+    inc('promotions_total', detention.num_exited())
+    inc('demotions_total', clean.num_exited())
+    if new_tests is not None:
+        inc('new_tests_total', len(new_tests))
+
+
+def _escape(v):
+    return v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _unescape(v):
+    # in one pass, an escaped backslash followed by n is not a newline
+    return re_escape.sub(lambda m: '\n' if m.group(1) == 'n' else m.group(1), v)
+
+
+def load_counters(file_path, common_labels):
+    """Reads counter values from a previously written metrics file so that counters keep growing across runs"""
+    counters = {}
+    if not os.path.exists(file_path):
+        return counters
+    common = set((k, str(v)) for k, v in common_labels.items())
+    with open(file_path, 'r') as f:
+        for line in f:
+            m = re_sample.match(line.strip())
+            if m is None:
+                continue
+            name = m.group(1)[len(PREFIX):] if m.group(1).startswith(PREFIX) else None
+            if name not in _METRICS or _METRICS[name][0] != 'counter':
+                continue
+            labels = set((k, _unescape(v)) for k, v in re_label.findall(m.group(2) or ''))
+            try:
+                counters[(name, tuple(sorted(labels - common)))] = float(m.group(3))
+            except ValueError:
+                logging.warn('Ignoring malformed sample in %s: %s' % (file_path, line.strip()))
+    return counters
+
+
+def get_metrics_path(config, job):
+    metrics_dir = config['metrics_dir'] if 'metrics_dir' in config else os.path.join(config['output'], 'metrics')
+    return os.path.join(metrics_dir, 'clean_room_%s_%s.prom' % (job, config['name'].strip().replace(' ', '_')))
+
+
+def write_metrics(config, job):
+    """Writes all metrics recorded by this process in the Prometheus text format.
+
+    Counters are added to the values found in the previous metrics file for the same job and room, under the lock on
+    the file. The file is written to a temporary file first and then renamed so that the node-exporter textfile
+    collector never reads a partially written file.
+    """
+    file_path = get_metrics_path(config, job)
+    metrics_dir = os.path.dirname(file_path)
+    if not os.path.exists(metrics_dir):
+        os.makedirs(metrics_dir)
+
+    inc('runs_total')
+    # RUSAGE_CHILDREN includes the forked test JVMs as long as ant waited for them
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    child_cpu_seconds = usage.ru_utime + usage.ru_stime
+    inc('child_cpu_seconds_total', child_cpu_seconds - _child_cpu_seconds[0])
+    _child_cpu_seconds[0] = child_cpu_seconds
+    set_gauge('last_run_timestamp_seconds', time.time())
+
+    common_labels = {'job': job, 'config': config['name']}
+    # runs of other configurations or processes may write the same file
+    with locks.lock(file_path):
+        values = load_counters(file_path, common_labels)
+        for k in _values:
+            if _METRICS[k[0]][0] == 'counter':
+                values[k] = values.get(k, 0) + _values[k]
+            else:
+                values[k] = _values[k]
+
+        lines = []
+        for name in sorted(_METRICS):
+            samples = sorted(k for k in values if k[0] == name)
+            if len(samples) == 0:
+                continue
+            metric_type, help_text = _METRICS[name]
+            lines.append('# HELP %s%s %s' % (PREFIX, name, help_text))
+            lines.append('# TYPE %s%s %s' % (PREFIX, name, metric_type))
+            for k in samples:
+                labels = sorted(common_labels.items()) + list(k[1])
+                label_str = ','.join('%s="%s"' % (l, _escape(str(v))) for l, v in labels)
+                lines.append('%s%s{%s} %s' % (PREFIX, name, label_str, repr(float(values[k]))))
+
+        locks.write_atomic(file_path, '\n'.join(lines) + '\n')
+    # counters have been persisted, start counting afresh in case we are asked to write again
+    for k in [k for k in _values if _METRICS[k[0]][0] == 'counter']:
+        del _values[k]
+    logging.info('Metrics written to: %s' % file_path)
+    return file_path
@@ -0,0 +1,100 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import json
+import logging
+import datetime
+
+import bootstrap
+import jenkins_clean_room
+import metrics
+import runner
+import workspace
+
+
+def get_configs(argv):
+    """Loads the configuration for every -config in argv, applying the other parameters as overrides"""
+    configs = []
+    for index, p in enumerate(argv):
+        if p == '-config':
+            config = bootstrap.load_config(argv[index + 1])
+            configs.append(bootstrap.load_overrides(config, argv[1:]))
+    return configs
+
+
+def main():
+    start = datetime.datetime.now()
+    time_stamp = '%04d.%02d.%02d.%02d.%02d.%02d' % (
+        start.year, start.month, start.day, start.hour, start.minute, start.second)
+
+    print('Running with parameters: %s' % sys.argv)
+    configs = get_configs(sys.argv)
+    if len(configs) == 0:
+        print('No -config specified, exiting.')
+        exit(1)
+    if '-workspace' not in sys.argv:
+        print('No -workspace specified, exiting.')
+        exit(1)
+    index = sys.argv.index('-workspace')
+    ws = workspace.Workspace(sys.argv[index + 1])
+
+    level = logging.INFO
+    if '-debug' in sys.argv:
+        level = logging.DEBUG
+    root_logger = logging.getLogger()
+    root_logger.setLevel(level)
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(bootstrap.LOG_FORMAT))
+    root_logger.addHandler(console_handler)
+    runner.install_signal_handlers()
+
+    run_bootstrap = '-bootstrap' in sys.argv
+    test_date = jenkins_clean_room.get_test_date(start)
+    failed = []
+    for config in configs:
+        config = ws.configure(config)
+        config['time_stamp'] = time_stamp
+        print('Running with configuration: %s' % json.dumps(config, indent=4))
+        if not os.path.exists(config['output']):
+            os.makedirs(config['output'])
+        file_handler = bootstrap.add_log_file(config['output'], time_stamp)
+        try:
+            with metrics.phase('total'):
+                if run_bootstrap:
+                    bootstrap.do_work(config, ws)
+                else:
+                    jenkins_clean_room.do_work(test_date, config, ws)
+        except SystemExit as e:
+            # do_work exits on validation errors, which should not stop the other configurations
+            if e.code is not None and e.code != 0:
+                failed.append(config['name'])
+        except Exception as e:
+            root_logger.exception('Run for configuration %s failed' % config['name'])
+            failed.append(config['name'])
+        finally:
+            metrics.write_metrics(config, 'bootstrap' if run_bootstrap else 'jenkins_clean_room')
+            root_logger.removeHandler(file_handler)
+            file_handler.close()
+
+    if len(failed) > 0:
+        root_logger.error('Runs failed for configurations: %s' % ', '.join(failed))
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Bisection for flaky tests.
+
+git bisect trusts every verdict, so a single lucky pass of a flaky test sends it after the wrong commit. Instead a
+probability for each candidate commit being the first bad one is kept and updated with Bayes' rule after every probe,
+where a probe compiles a commit and runs the test through the filters a number of times. A run at a commit at or after
+the culprit fails with probability failure_rate and a run before it with probability false_failure_rate. The commit and
+the number of runs of each probe are chosen to maximize the expected information gained per second, and probing stops
+once one commit is the culprit with the configured confidence.
+"""
+
+import math
+import time
+import logging
+
+import bootstrap
+import constants
+import room_filter
+import utils
+
+
+def _xlogx(x):
+    return x * math.log(x) if x > 0 else 0.0
+
+
+class Posterior:
+    """The probability of each of the candidate commits, ordered from oldest to newest, being the first bad one"""
+
+    def __init__(self, n, failure_rate, false_failure_rate=0.0):
+        self.weights = [1.0 / n] * n
+        self.failure_rate = failure_rate
+        self.false_failure_rate = false_failure_rate
+
+    def pass_likelihoods(self, runs):
+        """Returns the probability of all runs passing at a commit at or after the culprit and before it"""
+        return (1.0 - self.failure_rate) ** runs, (1.0 - self.false_failure_rate) ** runs
+
+    def update(self, idx, runs, failed):
+        """Updates the distribution with the result of runs at commit idx, failed if any of the runs failed"""
+        bad_pass, good_pass = self.pass_likelihoods(runs)
+        bad, good = (1.0 - bad_pass, 1.0 - good_pass) if failed else (bad_pass, good_pass)
+        # the commit is at or after the culprit if the culprit is at or before it
+        for j in range(len(self.weights)):
+            self.weights[j] *= bad if j <= idx else good
+        total = sum(self.weights)
+        if total <= 0:
+            raise ValueError('Result at commit %d contradicts all candidates' % idx)
+        self.weights = [w / total for w in self.weights]
+
+    def entropy(self):
+        return -sum(_xlogx(w) for w in self.weights)
+
+    def best(self):
+        """Returns (index, probability) of the most likely culprit"""
+        idx = max(range(len(self.weights)), key=lambda j: self.weights[j])
+        return idx, self.weights[idx]
+
+    def information_gains(self, runs):
+        """Returns the expected reduction of entropy, in nats, of probing each commit with the given number of runs.
+
+        The posterior after an outcome scales the weights at or before the probed commit by one likelihood and the rest
+        by another, so its entropy follows from prefix sums of w and w log w in O(1) per commit.
+        """
+        bad_pass, good_pass = self.pass_likelihoods(runs)
+        h = self.entropy()
+        gains = []
+        s, l = 0.0, 0.0
+        total_s = 1.0
+        total_l = sum(_xlogx(w) for w in self.weights)
+        for w in self.weights:
+            s += w
+            l += _xlogx(w)
+            gain = h
+            for a, b in ((bad_pass, good_pass), (1.0 - bad_pass, 1.0 - good_pass)):
+                # probability of the outcome and the entropy of the posterior given the outcome
+                z = a * s + b * (total_s - s)
+                if z <= 0:
+                    continue
+                inner = a * (l + s * math.log(a) if a > 0 else 0.0) + b * (
+                    (total_l - l) + (total_s - s) * math.log(b) if b > 0 else 0.0)
+                gain -= z * (math.log(z) - inner / z)
+            gains.append(max(gain, 0.0))
+        return gains
+
+
+def choose_probe(posterior, compile_secs, run_secs, current, max_runs, testable):
+    """Returns (index, runs) of the probe with the highest expected information per second. A probe at the current
+    (already compiled) commit costs only the runs."""
+    best = None
+    for runs in range(1, max_runs + 1):
+        gains = posterior.information_gains(runs)
+        for idx, gain in enumerate(gains):
+            if not testable[idx]:
+                continue
+            cost = runs * run_secs + (0.0 if idx == current else compile_secs)
+            score = gain / cost
+            if best is None or score > best[0]:
+                best = (score, idx, runs)
+    return (best[1], best[2]) if best is not None else (None, None)
+
+
+def get_confidence(config):
+    return float(config['noisy_bisect_confidence']) if 'noisy_bisect_confidence' in config else 0.95
+
+
+class NoisyBisect:
+    def __init__(self, config, checkout, test_name, logger=logging.getLogger()):
+        self.config = config
+        self.checkout = checkout
+        self.test_name = test_name
+        self.logger = logger
+        self.failure_rate = float(config['noisy_bisect_failure_rate']) \
+            if 'noisy_bisect_failure_rate' in config else None
+        self.false_failure_rate = float(config['noisy_bisect_false_failure_rate']) \
+            if 'noisy_bisect_false_failure_rate' in config else 0.0
+        self.confidence = get_confidence(config)
+        self.max_runs = int(config['noisy_bisect_max_runs']) if 'noisy_bisect_max_runs' in config else 10
+        self.max_probes = int(config['noisy_bisect_max_probes']) if 'noisy_bisect_max_probes' in config else 50
+        self.confirm_runs = int(config['noisy_bisect_confirm_runs']) if 'noisy_bisect_confirm_runs' in config else 10
+        self.filters = room_filter.get_filters(config, logger)
+        self.compiled = None
+        # module of the test at the compiled commit
+        self.test_module = None
+        # running averages, start with guesses until the first compile and run are measured
+        self.compile_secs = []
+        self.run_secs = []
+
+    def average(self, durations, default):
+        return sum(durations) / len(durations) if len(durations) > 0 else default
+
+    def compile(self, sha):
+        """Checks out and compiles the commit, returns False if it cannot be tested"""
+        if self.compiled == sha:
+            return True
+        t0 = time.time()
+        utils.run_command([constants.GIT_EXE, 'checkout', '-q', sha])
+        backend = self.checkout.backend
+        output, ret = utils.run_get_output(backend.get_command(*(backend.clean_tasks + backend.compile_tests_tasks)),
+                                           timeout=self.checkout.build_timeout)
+        self.compile_secs.append(time.time() - t0)
+        if ret != 0:
+            self.logger.warn('Unable to compile %s, it will not be probed again' % sha)
+            self.logger.debug(output)
+            self.compiled = None
+            return False
+        include = self.config['include'].split('|') if 'include' in self.config else ['*.java']
+        exclude = self.config['exclude'].split('|') if 'exclude' in self.config else []
+        self.test_module = bootstrap.get_module_for_test(
+            bootstrap.gather_interesting_tests(self.checkout.checkout_dir, exclude, include), self.test_name)
+        if self.test_module is None:
+            self.logger.warn('Test %s does not exist at %s, it will not be probed again' % (self.test_name, sha))
+            self.compiled = None
+            return False
+        self.compiled = sha
+        return True
+
+    def run_once(self):
+        """Runs the test through the filters once at the compiled commit, returns its status"""
+        t0 = time.time()
+        status, _ = room_filter.run_filters(self.filters, self.test_module, self.test_name)
+        self.run_secs.append(time.time() - t0)
+        return status
+
+    def probe(self, sha, runs):
+        """Returns (failures, completed runs) or None if the commit cannot be tested"""
+        if not self.compile(sha):
+            return None
+        failures = 0
+        for r in range(runs):
+            status = self.run_once()
+            if status == utils.SKIP_STATUS or status == utils.ABORT_STATUS:
+                return None
+            if status != utils.GOOD_STATUS:
+                failures += 1
+        return failures, runs
+
+    def confirm(self, bad_sha):
+        """Runs the test at the bad commit until it fails twice or confirm_runs times. Returns the estimated failure
+        rate or None if it never failed."""
+        failures, runs = 0, 0
+        if not self.compile(bad_sha):
+            return None
+        while runs < self.confirm_runs and failures < 2:
+            status = self.run_once()
+            if status == utils.SKIP_STATUS or status == utils.ABORT_STATUS:
+                return None
+            runs += 1
+            if status != utils.GOOD_STATUS:
+                failures += 1
+        self.logger.info('Test %s failed %d of %d runs at bad sha %s' % (self.test_name, failures, runs, bad_sha))
+        if failures == 0:
+            return None
+        # smoothed so that a failure in every run does not make a single pass impossible
+        return (failures + 0.5) / (runs + 1.0)
+
+    def bisect(self, commits, bad_sha):
+        """Finds the first bad commit among commits, ordered from oldest to newest and ending with bad_sha.
+        Returns (sha, probability) or None if the failure could not be reproduced at bad_sha."""
+        i = self.logger.info
+        estimated = self.confirm(bad_sha)
+        if estimated is None:
+            i('Unable to reproduce the failure of %s at bad sha %s, not bisecting' % (self.test_name, bad_sha))
+            return None
+        failure_rate = self.failure_rate if self.failure_rate is not None else estimated
+        i('Bisecting %d commits assuming a failure rate of %.2f per run' % (len(commits), failure_rate))
+        posterior = Posterior(len(commits), failure_rate, self.false_failure_rate)
+        testable = [True] * len(commits)
+        for probe_count in range(self.max_probes):
+            idx, p = posterior.best()
+            if p >= self.confidence:
+                break
+            current = commits.index(self.compiled) if self.compiled in commits else None
+            idx, runs = choose_probe(posterior, self.average(self.compile_secs, 60.0),
+                                     self.average(self.run_secs, 60.0), current, self.max_runs, testable)
+            if idx is None:
+                i('No commit left to probe')
+                break
+            result = self.probe(commits[idx], runs)
+            if result is None:
+                testable[idx] = False
+                continue
+            failures, runs = result
+            posterior.update(idx, runs, failures > 0)
+            best, p = posterior.best()
+            i('Probe %d: %d of %d runs failed at %s, most likely culprit is now %s with probability %.3f'
+              % (probe_count + 1, failures, runs, commits[idx], commits[best], p))
+        idx, p = posterior.best()
+        return commits[idx], p
+
+
+def get_commits(good_sha, bad_sha):
+    """Returns the commits in good_sha..bad_sha from oldest to newest, must be run in the checkout"""
+    output, ret = utils.run_get_output([constants.GIT_EXE, 'rev-list', '--reverse', '--first-parent',
+                                        '%s..%s' % (good_sha, bad_sha)])
+    if ret != 0:
+        raise RuntimeError('Unable to list the commits between %s and %s: %s' % (good_sha, bad_sha, output))
+    return [c.strip() for c in output.split('\n') if len(c.strip()) > 0]
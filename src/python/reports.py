@@ -19,6 +19,9 @@ import json
 import datetime
 
 import bootstrap
+import failure_archive
+import filter_logs
+import locks
 
 
 def html_escape(s):
@@ -61,11 +64,23 @@ def footer(w, config):
 
 def main():
     config = bootstrap.get_config()
-    reports_dir = config['report']
-    if not os.path.exists(reports_dir):
+    if write_reports(config) is None:
         print('Nothing to report')
         exit(1)
 
+
+def write_reports(config):
+    """Writes consolidated.json and the html report, returns the path to the html report or None if there
+    are no reports"""
+    reports_dir = config['report']
+    if not os.path.exists(reports_dir):
+        return None
+    # no report.json is written while the reports are read
+    with locks.lock(reports_dir, timeout=locks.get_timeout(config)):
+        return _write_reports(config, reports_dir)
+
+
+def _write_reports(config, reports_dir):
     reports = []
     for root, dirs, files in os.walk(reports_dir):
         if 'report.json' in files:
@@ -85,12 +100,11 @@ def main():
                 'delta_clean_detention': data['num_clean'] - data['num_detention'],
                 'time_stamp': data['time_stamp']
             }
-    with open(os.path.join(reports_dir, 'consolidated.json'), 'w') as f:
-        json.dump(consolidated, f, indent=8, sort_keys=True)
+    locks.dump_json(consolidated, os.path.join(reports_dir, 'consolidated.json'), indent=8, sort_keys=True)
 
     report_path = '%s/%s_report.html' % (reports_dir, config['name'].strip().replace(' ', '_'))
-    f = open(report_path, 'w')
-    w = f.write
+    html = []
+    w = html.append
     header(w, 'Lucene/Solr Clean Room Status: %s' % config['name'])
     w('<h1>Lucene/Solr Clean Room Status: %s</h1>\n' % config['name'])
     w('<br>')
@@ -104,13 +118,33 @@ def main():
         data = consolidated[k]
         test_date = datetime.datetime.strptime(data['test_date'], '%Y-%m-%d %H-%M-%S')
         test_date_str = test_date.strftime('%Y.%m.%d.%H.%M.%S')
-        w('<li>%s: <a href="../output/%s/output.txt">Logs</a>, '
+        num_filter_runs = len(filter_logs.read_index(get_filter_log_dir(config, data['time_stamp'])))
+        filter_runs = ''
+        if num_filter_runs > 0:
+            filter_runs = ', Filter runs: <a href="../output/%s/%s/%s">%d</a>' \
+                          % (data['time_stamp'], filter_logs.FILTER_LOGS_DIR, filter_logs.INDEX_FILE, num_filter_runs)
+        w('<li>%s: <a href="../output/%s/output.txt">Logs</a>%s, '
           'Report: <a href="./%s/report.json">JSON</a></li>'
-          % (test_date, data['time_stamp'], test_date_str))
+          % (test_date, data['time_stamp'], filter_runs, test_date_str))
     w('</ul>')
     footer(w, config)
-    f.close()
+    locks.write_atomic(report_path, ''.join(html))
     print('Report written to: %s' % report_path)
+    return report_path
+
+
+def get_filter_log_dir(config, time_stamp):
+    return filter_logs.get_log_dir({'output': config['output'], 'time_stamp': time_stamp})
+
+
+def get_filter_log_links(config, time_stamp):
+    """Returns a map of test name to html links to the compressed output of its filter runs in the given run"""
+    links = {}
+    for entry in filter_logs.read_index(get_filter_log_dir(config, time_stamp)):
+        link = "<a href='../output/%s/%s/%s'>%s:%s</a>" % (time_stamp, filter_logs.FILTER_LOGS_DIR, entry['file'],
+                                                          entry['filter'], entry['status'])
+        links[entry['test']] = '%s %s' % (links[entry['test']], link) if entry['test'] in links else link
+    return links
 
 
 def write_room_tables(config, consolidated, w, reports_dir):
@@ -154,21 +188,28 @@ def write_room_tables(config, consolidated, w, reports_dir):
         cleanTable.setData(cleanRoomData);
         
         var detentionTable = new Tabulator("#detention-table", {
-            height:"40%",
+            height:"40%%",
             layout:"fitData",
             columns:[
             {title:"Test name", field:"test", headerFilter:true},
             {title:"Entry Date", field:"entry_date", sorter:"date", headerFilter:true},
             {title:"Reproducible", field:"reproducible", headerFilter:true},
+            {title:"Failed methods", field:"methods", headerFilter:true},
+            {title:"Jenkins failures (%d days)", field:"jenkins_failures", sorter:"number"},
             {title:"Bad SHA", field:"git_sha", headerFilter:true},
             {title:"Good SHA", field:"good_sha", headerFilter:true},
             {title:"Module", field:"module", headerFilter:true},            
+            {title:"Filter logs", field:"logs", formatter:"html"},
             ],
         });
         
         var detentionData = [
-    """)
+    """ % failure_archive.get_window_days(config))
     test_data = report['detention']['tests']
+    jenkins_failures = {}
+    if failure_archive.is_enabled(config):
+        jenkins_failures = failure_archive.count_failures(config, last_test_date)
+    log_links = get_filter_log_links(config, report['time_stamp'])
     for t in test_data:
         test = test_data[t]
         module = test['module'] if 'module' in test and test['module'] is not None else ''
@@ -176,15 +217,29 @@ def write_room_tables(config, consolidated, w, reports_dir):
         if idx != -1:
             module = module[idx + len(config['checkout']) + 1:]
         reproducible = str(test['extra_info']['reproducible']) if 'extra_info' in test and 'reproducible' in test['extra_info'] else 'Unknown'
+        if 'extra_info' in test and 'deferred' in test['extra_info']:
+            reproducible = 'Deferred'
         good_sha = test['extra_info']['good_sha'] if 'extra_info' in test and 'good_sha' in test['extra_info'] and test['extra_info']['good_sha'] is not None else 'Unknown'
-        w('{test:"%s", entry_date: "%s", git_sha: "%s", module: "%s", good_sha: "%s", reproducible: "%s"},\n'
-          % (test['name'], test['entry_date'], test['git_sha'], module, good_sha, reproducible))
+        methods = ''
+        if 'extra_info' in test and 'methods' in test['extra_info']:
+            methods = ', '.join('%s (%s)' % (m, s) for m, s in sorted(test['extra_info']['methods'].items()))
+        logs = log_links[test['name']] if test['name'] in log_links else ''
+        failures = jenkins_failures[test['name']] if test['name'] in jenkins_failures else ''
+        w('{test:"%s", entry_date: "%s", git_sha: "%s", module: "%s", good_sha: "%s", reproducible: "%s", methods: "%s", jenkins_failures: "%s", logs: "%s"},\n'
+          % (test['name'], test['entry_date'], test['git_sha'], module, good_sha, reproducible, methods, failures, logs))
     w("""
         ];
         
         detentionTable.setData(detentionData);
     """)
     w('</script>')
+    deferred = report['deferred'] if 'deferred' in report else []
+    if len(deferred) > 0:
+        w('<h3>Filter jobs deferred to the next run as on %s</h3>' % last_test_date)
+        w('<ul>')
+        for d in deferred:
+            w('<li>%s %s, deferred %d times since %s</li>' % (d['kind'], d['test'], d['deferrals'], d['since']))
+        w('</ul>')
 
 
 def draw_graph(consolidated, w):
@@ -15,28 +15,55 @@
 # limitations under the License.
 
 import os
+import glob
 import logging
 import time
 import re
+import uuid
+import signal
+import collections
+import xml.etree.ElementTree as ElementTree
 from string import Template
 
 import utils
 import constants
+import build_backend
+import filter_logs
+import isolation
+import metrics
+import runner
+
+# set to a new id for every filter run through a build daemon: the daemon takes the environment of the client for each
+# build and its test JVMs inherit it, so the JVMs of one run are told apart from those of concurrent runs
+RUN_ID_VARIABLE = 'CLEAN_ROOM_RUN_ID'
 
 
 class Filter:
     re_no_test_executed = re.compile('Not even a single test was executed')
     re_beast_no_test_executed = re.compile('Beasting executed no tests')
+    # gradle test --tests NoSuchTest
+    re_gradle_no_test_executed = re.compile('No tests found for given includes')
     
     # [junit4] ERROR: JVM J1 ended with an exception, command line: [...]
     # [junit4] ERROR: JVM J1 ended with an exception: Forked process returned with error code: 134. Very likely a JVM crash.  See process stdout at: [...]
     re_jvm_exception = re.compile(r'ERROR: JVM J\d+ ended with an exception')
+    # Process 'Gradle Test Executor 3' finished with non-zero exit value 134
+    re_gradle_jvm_exception = re.compile(r"Process 'Gradle Test Executor \d+' finished with non-zero exit value")
 
-    def __init__(self, name, filter_command, log_command_output_level=logging.INFO, beast_iters=None, tests_jvms=None, tests_dups=None, tests_iters=None, logger = logging.getLogger()):
+    def __init__(self, name, filter_command, log_command_output_level=logging.INFO, beast_iters=None, tests_jvms=None, tests_dups=None, tests_iters=None, logger = logging.getLogger(), offline=False, timeout=None, silence_timeout=None, log_dir=None, batch_command=None, reports_glob=constants.JUNIT_REPORTS_GLOB, method_command=None, isolation=None, backend=None, batch_timeout=None):
         self.name = name
         self.filter_command = filter_command
+        # runs many tests of a module in one invocation, ${test_names} is replaced by the comma separated test names
+        self.batch_command = batch_command
+        # the JUnit XML reports written by a run, relative to the module directory
+        self.reports_glob = reports_glob
+        # runs a single method of a test, ${method_name} is replaced by the name of the method
+        self.method_command = method_command
         self.log_command_output_level = log_command_output_level
-        m = {'ant': constants.ANT_EXE, 'beast_iters': beast_iters, 'tests_dups' : tests_dups, 'tests_jvms': tests_jvms, 'tests_iters': tests_iters}
+        # the build tool the commands run, see build_backend.py
+        self.backend = backend if backend is not None else build_backend.AntBackend(offline, logger)
+        m = dict(self.backend.get_variables())
+        m.update({'beast_iters': beast_iters, 'tests_dups' : tests_dups, 'tests_jvms': tests_jvms, 'tests_iters': tests_iters})
         rm = []
         for k in m:
             if m[k] is None:
@@ -45,46 +72,413 @@ class Filter:
             m.pop(k)
         self.variables = m
         self.logger = logger
+        # wall clock seconds after which a filter run is killed along with all the JVMs it forked
+        self.timeout = timeout
+        # the most wall clock seconds a batch run gets however many tests it runs
+        self.batch_timeout = batch_timeout
+        # seconds without any output after which a filter run is considered hung, its JVMs' stacks are dumped
+        # into the log and it is killed
+        self.silence_timeout = silence_timeout
+        # if set, the output of each run is compressed into its own file in this directory instead of the main log
+        self.log_dir = log_dir
+        # if set, each run is pinned to its own cpus and limited by its own cgroup, see isolation.py
+        self.isolation = isolation
 
-    def filter(self, test_dir, test_name):
-        self.logger.info('Running module: %s test: %s through filter: %s' % (test_dir, test_name, self.name))
+    def filter(self, test_dir, test_name, method_name=None):
+        """Runs the test through the filter or, if method_name is given, only that method of the test through the
+        filter's method command"""
+        self.logger.info('Running module: %s test: %s%s through filter: %s'
+                         % (test_dir, test_name, ' method: %s' % method_name if method_name else '', self.name))
         x = os.getcwd()
+        t0 = time.time()
+        status = utils.BAD_STATUS
         try:
             self.logger.info('Changing cwd to %s' % test_dir)
             os.chdir(test_dir)
-            return self.__filter__(test_name)
+            status = self.__filter__(test_name, method_name)
+            return status
         except Exception as e:
             self.logger.exception(e)
             return utils.BAD_STATUS
         finally:
             self.logger.info('Changing cwd back to %s' % x)
             os.chdir(x)
+            self.record(status, t0)
 
-    def __filter__(self, test_name):
-        template = Template(self.filter_command.strip())
-        variables = {'test_name': test_name}
+    def record(self, status, t0):
+        metrics.inc('filter_invocations_total', filter=self.name, status=utils.STATUS_NAMES.get(status, status))
+        metrics.inc('filter_seconds_total', time.time() - t0, filter=self.name)
+
+    def filter_batch(self, test_dir, test_names):
+        """Runs all the given tests of the module in one invocation of the batch command. Returns a dict of
+        test name -> status for each test whose JUnit XML report was written by the run. A test without a report
+        e.g. because the run was killed or a JVM crashed is missing from the dict."""
+        self.logger.info('Running module: %s %d tests: %s through filter: %s in one batch'
+                         % (test_dir, len(test_names), test_names, self.name))
+        t0 = time.time()
+        status = utils.BAD_STATUS
+        statuses = {}
+        try:
+            cmd = self.substitute(self.batch_command, self.backend.get_batch_variables(test_names))
+            self.logger.info('RUN: %s in %s' % (cmd, test_dir))
+            # the tests run one after the other on each JVM, so the timeout is for a single test. The tests without a
+            # report when a capped run is killed are run on their own.
+            timeout = self.timeout * len(test_names) if self.timeout is not None else None
+            if self.batch_timeout is not None:
+                timeout = min(timeout, self.batch_timeout) if timeout is not None else self.batch_timeout
+            # a report left behind by an earlier run must not be taken for the result of this one
+            reports_glob = os.path.join(test_dir, self.reports_glob)
+            for file_path in find_junit_reports(reports_glob, test_names):
+                os.remove(file_path)
+            result, placement = self.run(cmd, timeout, test_dir)
+            status = self.get_status(result)
+            self.log_output('%s+%d' % (test_names[0], len(test_names) - 1), result, status, placement)
+            # allow for file systems that store modification times in whole seconds
+            statuses = read_junit_reports(reports_glob, test_names, t0 - 1)
+            for test_name in test_names:
+                self.logger.info('Filter %s batch result for %s: %s' % (
+                    self.name, test_name, utils.STATUS_NAMES.get(statuses[test_name], statuses[test_name])
+                    if test_name in statuses else 'no report'))
+            return statuses
+        except Exception as e:
+            self.logger.exception(e)
+            return statuses
+        finally:
+            self.record(status, t0)
+
+    def run(self, cmd, timeout, cwd=None):
+        """Returns (CommandResult, Placement or None) of running the command, isolated if configured"""
+        run_id = uuid.uuid4().hex if self.backend.has_daemon() else None
+        env = None
+        if run_id is not None:
+            env = dict(os.environ)
+            env[RUN_ID_VARIABLE] = run_id
+        on_silence = self.get_on_silence(run_id)
+        if self.isolation is None:
+            result = runner.run(cmd, timeout=timeout, cwd=cwd, env=env, silence_timeout=self.silence_timeout,
+                                on_silence=on_silence)
+            self.kill_daemon_jvms(result, run_id)
+            return result, None
+        with self.isolation.place(timeout) as placement:
+            result = runner.run(cmd, timeout=timeout, cwd=cwd, env=env, silence_timeout=self.silence_timeout,
+                                on_silence=on_silence, preexec_fn=placement.preexec, on_start=placement.attach)
+            self.kill_daemon_jvms(result, run_id)
+        return result, placement
+
+    def get_on_silence(self, run_id):
+        if run_id is None:
+            return capture_jstacks
+        return lambda pgid: capture_jstacks(pgid) + capture_daemon_jstacks(run_id)
+
+    def kill_daemon_jvms(self, result, run_id):
+        """Killing the process group of a run only reaches the client of a build daemon, the test JVMs forked by the
+        daemon for a run that was killed are killed here"""
+        if run_id is None or not (result.timed_out or result.silent or result.cancelled):
+            return
+        for pid in find_daemon_test_jvms(run_id):
+            self.logger.warn('Killing test JVM %d left behind by the %s daemon' % (pid, self.backend.name))
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+
+    def substitute(self, command, variables):
+        template = Template(command.strip())
+        variables = dict(variables)
         variables.update(self.variables)
         command = template.substitute(variables)
-        cmd = command.strip().split(' ')
+        return command.strip().split(' ')
+
+    def get_command(self, test_name):
+        return self.substitute(self.filter_command, {'test_name': test_name})
+
+    def __filter__(self, test_name, method_name=None):
+        if method_name is not None:
+            cmd = self.substitute(self.method_command, {'test_name': test_name, 'method_name': method_name})
+            test_name = '%s.%s' % (test_name, method_name)
+        else:
+            cmd = self.get_command(test_name)
         self.logger.info('RUN: %s' % cmd)
-        t0 = time.time()
-        output = ''
-        exitcode = None
+        result = None
+        placement = None
         try:
-            output, exitcode = utils.run_get_output(cmd)
+            result, placement = self.run(cmd, self.timeout)
         except Exception as e:
             self.logger.exception('Exception running command %s' % cmd, e)
-        self.logger.info('Took %.1f sec' % (time.time() - t0))
-        if self.log_command_output_level is not None and output != '':
-            self.logger.log(self.log_command_output_level, output)
-        if self.re_no_test_executed.search(output) is not None or self.re_beast_no_test_executed.search(output) is not None:
+        if result is None:
+            return utils.BAD_STATUS
+        status = self.get_status(result)
+        self.log_output(test_name, result, status, placement)
+        return status
+
+    def get_status(self, result):
+        output = result.output
+        if result.timed_out:
+            self.logger.warn('Filter %s timed out after %s seconds and was killed' % (self.name, self.timeout))
+            return utils.BAD_STATUS
+        if result.silent:
+            self.logger.warn('Filter %s produced no output for %s seconds and was killed as hung'
+                             % (self.name, self.silence_timeout))
+            return utils.HUNG_STATUS
+        if self.re_no_test_executed.search(output) is not None or self.re_beast_no_test_executed.search(output) is not None \
+                or self.re_gradle_no_test_executed.search(output) is not None:
             self.logger.warn('No tests were executed.  Skipping this revision.')
             return utils.SKIP_STATUS
-        if self.re_jvm_exception.search(output) is not None:
+        if self.re_jvm_exception.search(output) is not None or self.re_gradle_jvm_exception.search(output) is not None:
             self.logger.warn("A filter's JVM ended with an exception.  Skipping this revision.")
             return utils.SKIP_STATUS
 
-        return utils.GOOD_STATUS if exitcode == 0 else utils.BAD_STATUS
+        return utils.GOOD_STATUS if result.returncode == 0 else utils.BAD_STATUS
+
+    def log_output(self, test_name, result, status, placement=None):
+        status_name = utils.STATUS_NAMES.get(status, status)
+        if placement is not None:
+            self.logger.info('Ran on cpus %s in cgroup %s' % (placement.cpus, placement.get_data()['cgroup']))
+        if self.log_dir is None:
+            self.logger.info('Took %.1f sec' % result.duration)
+            if self.log_command_output_level is not None and result.output != '':
+                self.logger.log(self.log_command_output_level, result.output)
+            return
+        entry = filter_logs.write(self.log_dir, test_name, self.name, status_name, result.duration, result.output,
+                                  placement.get_data() if placement is not None else None)
+        self.logger.info('Filter %s on %s: %s in %.1f sec, %d failure markers, log: %s'
+                         % (self.name, test_name, status_name, result.duration, len(entry['markers']),
+                            os.path.join(self.log_dir, entry['file'])))
+
+
+def read_junit_report(file_path):
+    """Returns (simple class name of the suite, status) from a JUnit XML report"""
+    suite = ElementTree.parse(file_path).getroot()
+    if suite.tag == 'testsuites':
+        suite = suite.find('testsuite')
+    cases = suite.findall('testcase')
+
+    def count(attribute, tag):
+        if attribute in suite.attrib:
+            return int(suite.attrib[attribute])
+        return len([c for c in cases if c.find(tag) is not None])
+
+    tests = int(suite.attrib['tests']) if 'tests' in suite.attrib else len(cases)
+    name = suite.attrib['name'].split('.')[-1]
+    if count('failures', 'failure') > 0 or count('errors', 'error') > 0:
+        return name, utils.BAD_STATUS
+    if tests == 0 or count('skipped', 'skipped') >= tests:
+        # same as 'Not even a single test was executed' when the test is run on its own
+        return name, utils.SKIP_STATUS
+    return name, utils.GOOD_STATUS
+
+
+def find_junit_reports(pattern, test_names):
+    """Returns the reports matching pattern that are named after one of the tests i.e. TEST-<package>.<test>.xml"""
+    names = set(test_names)
+    reports = []
+    for file_path in glob.glob(pattern):
+        file_name = os.path.basename(file_path)
+        if file_name.startswith('TEST-') and file_name.endswith('.xml') \
+                and file_name[len('TEST-'):-len('.xml')].split('.')[-1] in names:
+            reports.append(file_path)
+    return reports
+
+
+def read_junit_reports(pattern, test_names, since):
+    """Returns a dict of test name -> status for the reports of the tests matching pattern that were modified after
+    since"""
+    logger = logging.getLogger()
+    names = set(test_names)
+    statuses = {}
+    for file_path in find_junit_reports(pattern, test_names):
+        try:
+            if os.path.getmtime(file_path) < since:
+                # left behind by an earlier run
+                continue
+            name, status = read_junit_report(file_path)
+        except (OSError, ValueError, KeyError, ElementTree.ParseError) as e:
+            logger.warn('Unable to read JUnit report %s: %s' % (file_path, e))
+            continue
+        if name in names:
+            statuses[name] = status
+    return statuses
+
+
+def find_jvms(pgid):
+    """Returns the pids of all java processes in the given process group"""
+    pids = []
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open('/proc/%s/stat' % name, 'r') as f:
+                stat = f.read()
+        except (IOError, OSError):
+            # the process exited in the meantime
+            continue
+        # pid (comm) state ppid pgrp ... where comm may itself contain spaces and parentheses
+        comm = stat[stat.index('(') + 1:stat.rindex(')')]
+        fields = stat[stat.rindex(')') + 2:].split(' ')
+        if int(fields[2]) == pgid and comm == 'java':
+            pids.append(int(name))
+    return sorted(pids)
+
+
+def find_daemon_test_jvms(run_id):
+    """Returns the pids of the test JVMs that a gradle daemon forked for the filter run with the given id. They are
+    not in the process group of the run, they are found by their Gradle Test Executor argument and the RUN_ID_VARIABLE
+    in their environment."""
+    tag = ('%s=%s' % (RUN_ID_VARIABLE, run_id)).encode('utf-8')
+    pids = []
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open('/proc/%s/cmdline' % name, 'rb') as f:
+                args = f.read().split(b'\0')
+            if not any(a.startswith(b'Gradle Test Executor') for a in args):
+                continue
+            with open('/proc/%s/environ' % name, 'rb') as f:
+                environ = f.read().split(b'\0')
+        except (IOError, OSError):
+            # the process exited in the meantime or belongs to another user
+            continue
+        if tag in environ:
+            pids.append(int(name))
+    return sorted(pids)
+
+
+def capture_daemon_jstacks(run_id):
+    """Returns the thread dumps of the test JVMs forked by a gradle daemon for the hung filter run with the given id"""
+    return jstack_all(find_daemon_test_jvms(run_id))
+
+
+def jstack_all(pids):
+    logger = logging.getLogger()
+    dumps = []
+    for pid in pids:
+        logger.warn('Capturing thread dump of hung JVM %d' % pid)
+        try:
+            output, ret = utils.run_get_output([constants.JSTACK_EXE, str(pid)], timeout=60)
+        except Exception as e:
+            output, ret = str(e), -1
+        dumps.append('\n===== jstack %d (exit code %s) =====\n%s' % (pid, ret, output))
+    return ''.join(dumps)
+
+
+def capture_jstacks(pgid):
+    """Returns the thread dumps of all JVMs in the given process group, used to diagnose hung filter runs"""
+    dumps = jstack_all(find_jvms(pgid))
+    if len(dumps) == 0:
+        logging.getLogger().warn('No JVMs found in hung process group %d' % pgid)
+    return dumps
+
+
+def run_filters(filters, test_dir, test_name):
+    """Runs the test through the filters in order until one of them does not pass.
+    Returns (status, name of the filter that did not pass or None)"""
+    for f in filters:
+        status = f.filter(test_dir, test_name)
+        if status != utils.GOOD_STATUS:
+            return status, f.name
+    return utils.GOOD_STATUS, None
+
+
+def reproduce_methods(filters, test_dir, test_name, method_names):
+    """Runs each of the given methods of the test through the filters in order until one of them does not pass.
+    Filters with a method command run just the method, the others run the whole test once for all methods.
+    Returns a dict of method name -> (status, name of the filter that did not pass or None)"""
+    results = {}
+    # filter name -> status of the whole test
+    suite_statuses = {}
+    for method_name in method_names:
+        results[method_name] = (utils.GOOD_STATUS, None)
+        for f in filters:
+            if f.method_command is not None:
+                status = f.filter(test_dir, test_name, method_name)
+            else:
+                if f.name not in suite_statuses:
+                    suite_statuses[f.name] = f.filter(test_dir, test_name)
+                status = suite_statuses[f.name]
+            if status != utils.GOOD_STATUS:
+                results[method_name] = (status, f.name)
+                break
+    return results
+
+
+def has_method_filters(filters):
+    return any(f.method_command is not None for f in filters)
+
+
+def is_batched(filters):
+    return any(f.batch_command is not None for f in filters)
+
+
+def get_batch_size(config):
+    return int(config['batch_size']) if 'batch_size' in config else 20
+
+
+def run_filters_batched(filters, tests, batch_size=20):
+    """Runs each (test_dir, test_name) in tests through the filters, running up to batch_size tests of a module in
+    one invocation of each filter that has a batch command. A test that failed in a batch or whose result could not
+    be read from the JUnit XML reports is run through the filter on its own to confirm.
+
+    Like run_filters, the next filter is only run for a test if the previous one passed.
+    Returns a dict of test name -> (status, name of the filter that did not pass or None).
+    """
+    logger = logging.getLogger()
+    results = {}
+    remaining = list(tests)
+    for f in filters:
+        statuses = []
+        if f.batch_command is None:
+            for test_dir, test_name in remaining:
+                statuses.append((test_dir, test_name, f.filter(test_dir, test_name)))
+        else:
+            modules = collections.OrderedDict()
+            for test_dir, test_name in remaining:
+                modules.setdefault(test_dir, []).append(test_name)
+            for test_dir in modules:
+                test_names = modules[test_dir]
+                for idx in range(0, len(test_names), batch_size):
+                    batch = test_names[idx:idx + batch_size]
+                    batch_statuses = f.filter_batch(test_dir, batch)
+                    for test_name in batch:
+                        status = batch_statuses.get(test_name)
+                        if status is None or status == utils.BAD_STATUS:
+                            logger.info('Confirming %s result of %s by running it on its own'
+                                        % ('missing' if status is None else 'bad', test_name))
+                            status = f.filter(test_dir, test_name)
+                        statuses.append((test_dir, test_name, status))
+        remaining = []
+        for test_dir, test_name, status in statuses:
+            if status == utils.GOOD_STATUS:
+                remaining.append((test_dir, test_name))
+            else:
+                results[test_name] = (status, f.name)
+    for test_dir, test_name in remaining:
+        results[test_name] = (utils.GOOD_STATUS, None)
+    return results
+
+
+def get_filters(config, logger=logging.getLogger()):
+    """Builds the filters listed in the given configuration in the order in which they should be run"""
+    filters = []
+    offline = config['offline_build'] if 'offline_build' in config else False
+    timeout = float(config['filter_timeout_secs']) if 'filter_timeout_secs' in config else None
+    silence_timeout = float(config['filter_silence_timeout_secs']) if 'filter_silence_timeout_secs' in config else None
+    batch_timeout = float(config['filter_batch_timeout_secs']) if 'filter_batch_timeout_secs' in config else 3600.0
+    log_dir = filter_logs.get_log_dir(config)
+    # shared by the filters, a run of any filter holds one of the cpu slots
+    run_isolation = isolation.get_isolation(config, logger)
+    backend = build_backend.get_backend(config, logger=logger)
+    if run_isolation is not None and backend.has_daemon():
+        logger.warn('The test JVMs are forked by the %s daemon and not by the filter runs, they are not isolated. '
+                    'Disable the daemon to isolate them.' % backend.name)
+    for f in config['filters']:
+        filters.append(Filter(f['name'], f['test'], tests_jvms=config['tests_jvms'], logger=logger, offline=offline,
+                              timeout=timeout, silence_timeout=silence_timeout, log_dir=log_dir,
+                              batch_command=f['batch'] if 'batch' in f else None,
+                              reports_glob=f['reports'] if 'reports' in f else backend.reports_glob,
+                              method_command=f['method'] if 'method' in f else None, isolation=run_isolation,
+                              backend=backend, batch_timeout=batch_timeout))
+    return filters
 
 
 def main():
@@ -0,0 +1,205 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import time
+import codecs
+import signal
+import atexit
+import asyncio
+import logging
+import subprocess
+
+import metrics
+
+# seconds to wait after SIGTERM before the process group is killed with SIGKILL
+TERMINATE_GRACE_SECS = 10
+
+# pid -> process for every process started by this module which has not been reaped yet
+# each process leads its own process group so the pid is also the process group id
+_live = {}
+
+
+class CommandResult:
+    def __init__(self, command):
+        self.command = command
+        self.output = ''
+        self.returncode = None
+        self.timed_out = False
+        # True if the command was terminated because it produced no output for too long
+        self.silent = False
+        self.cancelled = False
+        self.duration = 0.0
+
+    def __repr__(self):
+        return 'CommandResult(command=%s, returncode=%s, timed_out=%s, silent=%s, cancelled=%s, duration=%.1f)' \
+               % (self.command, self.returncode, self.timed_out, self.silent, self.cancelled, self.duration)
+
+
+def kill_process_group(pgid, sig=signal.SIGKILL):
+    try:
+        os.killpg(pgid, sig)
+        return True
+    except (ProcessLookupError, PermissionError):
+        return False
+
+
+async def _terminate(process, grace=TERMINATE_GRACE_SECS):
+    """Terminates the whole process group led by the given process, escalating to SIGKILL after grace seconds"""
+    kill_process_group(process.pid, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(process.wait(), grace)
+    except asyncio.TimeoutError:
+        logging.getLogger().warn('Process group %d did not exit %d seconds after SIGTERM, killing it'
+                                 % (process.pid, grace))
+    kill_process_group(process.pid, signal.SIGKILL)
+    await process.wait()
+
+
+async def run_async(command, timeout=None, cwd=None, env=None, on_output=None, silence_timeout=None,
+                    on_silence=None, preexec_fn=None, on_start=None):
+    """Runs the command in its own process group and returns a CommandResult with its combined stdout and stderr.
+
+    If the command does not finish within timeout seconds or the calling task is cancelled, the entire process group
+    (e.g. ant and the test JVMs forked by it) is terminated. Any process left behind in the group after the command
+    exits is killed too. on_output, if given, is called with each chunk of decoded output as it is produced.
+
+    If the command produces no output for silence_timeout seconds, on_silence (if given) is called with the process
+    group id from a worker thread and the process group is terminated. Any string returned by on_silence is added to
+    the output and the result is marked as silent.
+
+    preexec_fn, if given, is called in the child process before the command is executed and on_start with the pid
+    of the command as soon as it has been started.
+    """
+    metrics.inc('subprocesses_total')
+    result = CommandResult(command)
+    t0 = time.time()
+    process = await asyncio.create_subprocess_exec(*command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                                   cwd=cwd, env=env, start_new_session=True,
+                                                   preexec_fn=preexec_fn)
+    _live[process.pid] = process
+    if on_start is not None:
+        on_start(process.pid)
+    decoder = codecs.getincrementaldecoder('utf-8')('replace')
+    chunks = []
+    last_output = [time.time()]
+
+    async def communicate():
+        while True:
+            data = await process.stdout.read(65536)
+            if not data:
+                break
+            last_output[0] = time.time()
+            s = decoder.decode(data)
+            chunks.append(s)
+            if on_output is not None:
+                on_output(s)
+        return await process.wait()
+
+    async def watchdog():
+        while True:
+            silent_for = time.time() - last_output[0]
+            if silent_for >= silence_timeout:
+                return silent_for
+            await asyncio.sleep(min(silence_timeout - silent_for, 1.0))
+
+    tasks = [asyncio.ensure_future(communicate())]
+    if silence_timeout is not None:
+        tasks.append(asyncio.ensure_future(watchdog()))
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        if tasks[0] in done:
+            result.returncode = tasks[0].result()
+        else:
+            if len(done) > 0:
+                result.silent = True
+                logging.getLogger().warn('Command %s produced no output for %.0f seconds, terminating it'
+                                         % (command, tasks[1].result()))
+                if on_silence is not None:
+                    diagnostics = await asyncio.get_event_loop().run_in_executor(None, on_silence, process.pid)
+                    if diagnostics:
+                        chunks.append(diagnostics)
+            else:
+                result.timed_out = True
+            await _terminate(process)
+            result.returncode = process.returncode
+    except asyncio.CancelledError:
+        result.cancelled = True
+        # do not let a second cancellation interrupt the cleanup
+        await asyncio.shield(_terminate(process))
+        raise
+    finally:
+        for task in tasks:
+            task.cancel()
+        kill_process_group(process.pid)
+        _live.pop(process.pid, None)
+        chunks.append(decoder.decode(b'', True))
+        result.output = ''.join(chunks)
+        result.duration = time.time() - t0
+    return result
+
+
+def run(command, timeout=None, cwd=None, env=None, on_output=None, silence_timeout=None, on_silence=None,
+        preexec_fn=None, on_start=None):
+    """Synchronous version of run_async"""
+    return asyncio.run(run_async(command, timeout=timeout, cwd=cwd, env=env, on_output=on_output,
+                                 silence_timeout=silence_timeout, on_silence=on_silence, preexec_fn=preexec_fn,
+                                 on_start=on_start))
+
+
+async def run_all_async(commands, concurrency=4, timeout=None):
+    """Runs the given commands with at most concurrency of them at a time.
+
+    Each command is either a list of arguments or a (command, cwd) tuple. Returns the CommandResults in the same
+    order as the commands.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(c):
+        command, cwd = c if isinstance(c, tuple) else (c, None)
+        async with semaphore:
+            return await run_async(command, timeout=timeout, cwd=cwd)
+
+    return await asyncio.gather(*[run_one(c) for c in commands])
+
+
+def run_all(commands, concurrency=4, timeout=None):
+    """Synchronous version of run_all_async"""
+    return asyncio.run(run_all_async(commands, concurrency=concurrency, timeout=timeout))
+
+
+def kill_all():
+    """Kills the process groups of all commands still running, called on exit so that no JVMs are left behind"""
+    for pid in list(_live):
+        if kill_process_group(pid):
+            logging.getLogger().warn('Killed process group %d of command %s' % (pid, _live[pid]))
+    _live.clear()
+
+
+def install_signal_handlers():
+    """Makes SIGTERM and SIGHUP exit the process normally so that running process groups are cleaned up"""
+
+    def handler(signum, frame):
+        logging.getLogger().error('Received signal %d, exiting' % signum)
+        kill_all()
+        sys.exit(128 + signum)
+
+    for sig in [signal.SIGTERM, signal.SIGHUP]:
+        signal.signal(sig, handler)
+
+
+atexit.register(kill_all)
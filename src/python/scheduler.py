@@ -0,0 +1,125 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Time budgeted scheduling of the filter runs of a Jenkins clean room run.
+
+A run is given time_budget_secs from its start. Its filter jobs are run in order of priority and once the budget is
+spent the remaining jobs are deferred: their state is saved in $output/deferred_jobs.json and they are picked up by
+the next run. Jobs are (test module, test name) pairs. The caller orders them and decides what a job runs.
+"""
+
+import os
+import json
+import time
+import logging
+
+import locks
+
+REPRODUCE = 'reproduce'
+PROMOTE = 'promote'
+DEFERRED_FILE = 'deferred_jobs.json'
+
+
+class Budget:
+    def __init__(self, secs=None, start=None):
+        # None for no limit
+        self.secs = secs
+        self.start = start if start is not None else time.time()
+
+    def elapsed(self):
+        return time.time() - self.start
+
+    def exhausted(self):
+        return self.secs is not None and self.elapsed() >= self.secs
+
+
+def get_budget(config, start=None):
+    return Budget(float(config['time_budget_secs']) if 'time_budget_secs' in config and config['time_budget_secs']
+                  else None, start)
+
+
+def get_chunk_size(config):
+    """The number of jobs handed at once to the work queue or batched filters, the budget is checked in between"""
+    return int(config['time_budget_chunk_size']) if 'time_budget_chunk_size' in config else 20
+
+
+def run_jobs(budget, jobs, run_one, run_ahead=None, chunk_size=20, logger=logging.getLogger()):
+    """Runs the (test module, test name) jobs in order until the budget is exhausted.
+
+    run_one(test_module, test_name) runs a single job and returns its result. run_ahead, if given, is called with a
+    list of jobs and returns a dict of test name -> result for those of them it ran (e.g. through the work queue or
+    in batches) or None, the others are run with run_one. Without a budget all jobs are handed to run_ahead at once.
+    Returns (dict of test name -> result, list of the jobs that were not started).
+    """
+    results = {}
+    idx = 0
+    while idx < len(jobs):
+        if budget.exhausted():
+            break
+        chunk = jobs[idx:idx + chunk_size] if budget.secs is not None else jobs[idx:]
+        ahead = run_ahead(chunk) if run_ahead is not None else None
+        for test_module, test_name in chunk:
+            if ahead is not None and test_name in ahead:
+                results[test_name] = ahead[test_name]
+            elif budget.exhausted():
+                break
+            else:
+                results[test_name] = run_one(test_module, test_name)
+            idx += 1
+    deferred = jobs[idx:]
+    if len(deferred) > 0:
+        logger.warn('Time budget of %d seconds exhausted after %.0f seconds, deferring %d of %d jobs to the next run'
+                    % (budget.secs, budget.elapsed(), len(deferred), len(jobs)))
+    return results, deferred
+
+
+def get_path(config):
+    return os.path.join(config['output'], DEFERRED_FILE)
+
+
+def load_deferred(config):
+    """Returns the jobs of the configuration deferred by the previous run, a list of dicts with the kind of job,
+    test, module, the date it was first deferred on and the number of times it was deferred"""
+    file_path = get_path(config)
+    if not os.path.exists(file_path):
+        return []
+    with locks.lock(file_path, shared=True), open(file_path, 'r') as f:
+        data = json.load(f)
+    return data[config['name']] if config['name'] in data else []
+
+
+def save_deferred(config, deferred):
+    file_path = get_path(config)
+    # other configurations save their jobs in the same file
+    with locks.lock(file_path):
+        data = {}
+        if os.path.exists(file_path):
+            with open(file_path, 'r') as f:
+                data = json.load(f)
+        data[config['name']] = deferred
+        logging.info('Saving %d deferred jobs at %s' % (len(deferred), file_path))
+        locks.dump_json(data, file_path, indent=4)
+
+
+def defer(kind, test_module, test_name, date_s, previous=None, methods=None):
+    """Returns the record of a deferred job, carrying over when it was first deferred from its previous record.
+    methods are the failed methods to reproduce, if any."""
+    record = {'kind': kind, 'test': test_name, 'module': test_module,
+              'since': previous['since'] if previous is not None else date_s,
+              'deferrals': previous['deferrals'] + 1 if previous is not None else 1}
+    if methods is not None:
+        record['methods'] = methods
+    return record
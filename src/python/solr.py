@@ -18,16 +18,45 @@ import os
 import utils
 import constants
 import glob
+import fnmatch
 import datetime
 import logging
 
+import artifact_cache
+import build_backend
+
 
 class LuceneSolrCheckout:
-    def __init__(self, git_repo, checkout_dir, revision='LATEST', logger=logging.getLogger()):
+    def __init__(self, git_repo, checkout_dir, revision='LATEST', logger=logging.getLogger(), branch='master',
+                 reference_repo=None, clone_filter=None, sparse_include=None, sparse_exclude=None, sparse_extra=None,
+                 incremental=False, offline=False, git_timeout=None, build_timeout=None, shared_repo=None,
+                 artifact_cache=None, backend=None):
         self.git_repo = git_repo
         self.checkout_dir = checkout_dir
         self.revision = revision
         self.logger = logger
+        self.branch = branch
+        # an existing local clone whose objects are borrowed instead of being downloaded again
+        self.reference_repo = reference_repo
+        # partial clone filter e.g. blob:none so that file contents are downloaded only when checked out
+        self.clone_filter = clone_filter
+        # if set, only modules containing tests matching these patterns (plus sparse_extra paths) are checked out
+        self.sparse_include = sparse_include
+        self.sparse_exclude = sparse_exclude if sparse_exclude is not None else []
+        self.sparse_extra = sparse_extra if sparse_extra is not None else []
+        # if True, build outputs are kept across revisions and only modules with changed sources are cleaned
+        self.incremental = incremental
+        # if True, dependencies are resolved from the local ivy cache only
+        self.offline = offline
+        # the build tool, see build_backend.py
+        self.backend = backend if backend is not None else build_backend.AntBackend(offline, logger)
+        # wall clock timeouts in seconds for git commands that may hit the network and for builds
+        self.git_timeout = git_timeout
+        self.build_timeout = build_timeout
+        # a bare repository holding the objects of all checkouts, the checkout is created as a worktree of it
+        self.shared_repo = shared_repo
+        # if set, an ArtifactCache of the packages built for each source tree
+        self.artifact_cache = artifact_cache
 
     def checkout(self):
         logger = self.logger
@@ -41,54 +70,214 @@ class LuceneSolrCheckout:
         try:
             os.chdir(self.checkout_dir)
             if len(f) == 0:
-                # clone
-                utils.run_command([constants.GIT_EXE, 'clone', self.git_repo, '.'])
-                if not self.revision == 'LATEST':
-                    self.update_to_revision()
-                try:
-                    utils.run_command(['rm', '-r', '~/.ant/lib/ivy-*.jar'])
-                except:
-                    logger.warn('Unable to remove previous ivy-2.3.0.jar')
-                utils.run_command([constants.ANT_EXE, 'ivy-bootstrap'])
+                if self.shared_repo is not None:
+                    self.add_worktree()
+                else:
+                    # clone
+                    cmd = [constants.GIT_EXE, 'clone', '--single-branch', '--branch', self.branch, '--no-checkout']
+                    if self.reference_repo is not None:
+                        cmd.extend(['--reference-if-able', self.reference_repo])
+                    if self.clone_filter is not None:
+                        cmd.append('--filter=%s' % self.clone_filter)
+                    cmd.extend([self.git_repo, '.'])
+                    utils.run_command(cmd, timeout=self.git_timeout)
+                self.update_to_revision(fetch=False)
+                self.backend.bootstrap(self.build_timeout)
             else:
                 self.update_to_revision()
         finally:
             os.chdir(x)
 
-    def update_to_revision(self):
-        # resets any staged changes (there shouldn't be any though)
-        utils.run_command([constants.GIT_EXE, 'reset', '--hard'])
-        # clean ANY files not tracked in the repo -- this effectively restores pristine state
-        utils.run_command([constants.GIT_EXE, 'clean', '-xfd', '.'])
-        utils.run_command([constants.GIT_EXE, 'checkout', 'origin/master'])
-        if self.revision == 'LATEST':
-            utils.run_command([constants.GIT_EXE, 'pull', 'origin', 'master'])
+    def fetch(self):
+        # a single fetch of the configured branch, we never need anything else from the remote
+        utils.run_command([constants.GIT_EXE, 'fetch', 'origin',
+                           '+refs/heads/%s:refs/remotes/origin/%s' % (self.branch, self.branch)],
+                          timeout=self.git_timeout)
+
+    def get_remote_sha(self):
+        """Returns the SHA of the head of the configured branch in the remote repository without fetching it"""
+        output, ret = utils.run_get_output([constants.GIT_EXE, 'ls-remote', self.git_repo,
+                                            'refs/heads/%s' % self.branch], timeout=self.git_timeout)
+        if ret != 0 or len(output.strip()) == 0:
+            raise RuntimeError('Unable to find branch %s in %s: %s' % (self.branch, self.git_repo, output))
+        return output.split()[0]
+
+    def update_to_revision(self, fetch=True):
+        if fetch and (self.revision == 'LATEST' or not self.has_commit(self.revision)):
+            self.fetch()
+        target = 'origin/%s' % self.branch if self.revision == 'LATEST' else self.revision
+        # a fresh clone has no build outputs to preserve
+        old_sha = self.get_head_sha() if fetch and self.incremental else None
+        if self.sparse_include is not None:
+            self.update_sparse_checkout(target)
+        elif self.is_sparse():
+            utils.run_command([constants.GIT_EXE, 'sparse-checkout', 'disable'])
+        # a forced checkout discards any local changes to tracked files
+        utils.run_command([constants.GIT_EXE, 'checkout', '--force', '--detach', target], timeout=self.git_timeout)
+        if old_sha is None:
+            # clean ANY files not tracked in the repo -- this effectively restores pristine state
+            utils.run_command([constants.GIT_EXE, 'clean', '-xfd', '.'])
+        else:
+            self.clean_changed_modules(old_sha)
+
+    def add_worktree(self):
+        """Creates the (empty) checkout directory as a worktree of the shared repository. The shared repository is
+        created if it does not exist and the configured branch is fetched into it."""
+        git = [constants.GIT_EXE, '--git-dir', self.shared_repo]
+        if not os.path.exists(self.shared_repo):
+            self.logger.info('Creating shared repository %s for %s' % (self.shared_repo, self.git_repo))
+            utils.run_command([constants.GIT_EXE, 'init', '--bare', '-q', self.shared_repo])
+            utils.run_command(git + ['remote', 'add', 'origin', self.git_repo])
+            if self.clone_filter is not None:
+                utils.run_command(git + ['config', 'remote.origin.promisor', 'true'])
+                utils.run_command(git + ['config', 'remote.origin.partialclonefilter', self.clone_filter])
+            if self.reference_repo is not None:
+                objects = os.path.join(self.reference_repo, '.git', 'objects')
+                if not os.path.exists(objects):
+                    objects = os.path.join(self.reference_repo, 'objects')
+                if os.path.exists(objects):
+                    with open(os.path.join(self.shared_repo, 'objects', 'info', 'alternates'), 'a') as f:
+                        f.write(os.path.abspath(objects) + '\n')
         else:
-            utils.run_command([constants.GIT_EXE, 'checkout', self.revision])
+            remote, _ = utils.run_get_output(git + ['config', '--get', 'remote.origin.url'])
+            if remote.strip() != self.git_repo:
+                self.logger.warn('Shared repository %s fetches from %s and not from %s'
+                                 % (self.shared_repo, remote.strip(), self.git_repo))
+        utils.run_command(git + ['fetch', 'origin', '+refs/heads/%s:refs/remotes/origin/%s' % (self.branch, self.branch)],
+                          timeout=self.git_timeout)
+        # forget worktrees whose directories were deleted e.g. by -clean-build
+        utils.run_command(git + ['worktree', 'prune'])
+        utils.run_command(git + ['worktree', 'add', '--detach', '--no-checkout', os.path.abspath(self.checkout_dir),
+                                 'origin/%s' % self.branch], timeout=self.git_timeout)
+
+    def get_head_sha(self):
+        output, ret = utils.run_get_output([constants.GIT_EXE, 'rev-parse', '--verify', '-q', 'HEAD'])
+        return output.strip() if ret == 0 else None
+
+    def get_changed_files(self, old_sha, new_sha):
+        """Returns the paths of the files that changed between the two revisions or None if they cannot be diffed.
+        Must be called with the checkout directory as the cwd."""
+        output, ret = utils.run_get_output([constants.GIT_EXE, 'diff', '--name-only', old_sha, new_sha])
+        if ret != 0:
+            self.logger.warn('Unable to diff %s and %s: %s' % (old_sha, new_sha, output))
+            return None
+        return [f.strip() for f in output.split('\n') if len(f.strip()) > 0]
+
+    def is_build_file(self, path):
+        return any(fnmatch.fnmatch(path, p) for p in self.backend.rebuild_patterns)
+
+    def get_changed_modules(self, old_sha, new_sha):
+        """Returns (rebuild, modules) where rebuild is True if any build file of the backend changed
+        between the two revisions and modules is the sorted list of modules whose sources changed"""
+        changed = self.get_changed_files(old_sha, new_sha)
+        if changed is None:
+            self.logger.warn('Assuming a clean rebuild is needed')
+            return True, []
+        modules = set()
+        for f in changed:
+            if self.is_build_file(f):
+                self.logger.info('Build file %s changed between %s and %s' % (f, old_sha, new_sha))
+                return True, []
+            # lucene/core/src/java/... belongs to module lucene/core, changes outside src (docs etc.) are ignored
+            idx = f.find('/src/')
+            if idx != -1:
+                modules.add(f[:idx])
+        return False, sorted(modules)
+
+    def clean_changed_modules(self, old_sha):
+        new_sha = self.get_head_sha()
+        rebuild, modules = self.get_changed_modules(old_sha, new_sha)
+        if rebuild:
+            self.logger.info('Build files changed, doing a clean rebuild')
+            utils.run_command([constants.GIT_EXE, 'clean', '-xfd', '.'])
+            return
+        # removes untracked files but keeps ignored ones i.e. build outputs
+        utils.run_command([constants.GIT_EXE, 'clean', '-fd', '.'])
+        self.logger.info('Sources changed in %d modules between %s and %s: %s'
+                         % (len(modules), old_sha, new_sha, modules))
+        x = os.getcwd()
+        for m in modules:
+            if not os.path.exists(os.path.join(m, self.backend.module_build_file)):
+                self.logger.info('No %s found in module %s, nothing to clean' % (self.backend.module_build_file, m))
+                continue
+            try:
+                os.chdir(m)
+                utils.run_command(self.backend.get_command(*self.backend.module_clean_tasks),
+                                  timeout=self.build_timeout)
+            finally:
+                os.chdir(x)
+
+    def has_commit(self, sha):
+        _, ret = utils.run_get_output([constants.GIT_EXE, 'cat-file', '-e', '%s^{commit}' % sha])
+        return ret == 0
+
+    def is_sparse(self):
+        output, ret = utils.run_get_output([constants.GIT_EXE, 'config', '--get', 'core.sparseCheckout'])
+        return ret == 0 and output.strip() == 'true'
+
+    def get_sparse_paths(self, target):
+        """Returns the module directories at the given revision that contain tests matched by sparse_include"""
+        output, ret = utils.run_get_output([constants.GIT_EXE, 'ls-tree', '-r', '--name-only', target])
+        if ret != 0:
+            raise RuntimeError('Unable to list files at revision %s: %s' % (target, output))
+        # match against full paths just like bootstrap.gather_interesting_tests does
+        prefix = os.path.abspath(self.checkout_dir)
+        paths = set(self.sparse_extra)
+        for f in output.split('\n'):
+            idx = f.find('src/test/')
+            if idx == -1:
+                continue
+            full_path = os.path.join(prefix, f)
+            if any(fnmatch.fnmatch(full_path, p) for p in self.sparse_include) \
+                    and not any(fnmatch.fnmatch(full_path, p) for p in self.sparse_exclude):
+                paths.add(f[:idx].rstrip('/'))
+        return sorted(paths)
+
+    def update_sparse_checkout(self, target):
+        paths = self.get_sparse_paths(target)
+        self.logger.info('Sparse checkout of %d paths: %s' % (len(paths), paths))
+        utils.run_command([constants.GIT_EXE, 'sparse-checkout', 'set', '--cone'] + paths)
 
     def compile_tests(self):
         x = os.getcwd()
         try:
             os.chdir('%s' % self.checkout_dir)
-            utils.run_command([constants.ANT_EXE, 'compile-test'])
+            utils.run_command(self.backend.get_command(*self.backend.compile_tests_tasks), timeout=self.build_timeout)
         finally:
             os.chdir(x)
 
     def build(self):
+        """Returns the path to the solr package tgz of the checked out revision, building it unless the artifact
+        cache has one for the same sources"""
         x = os.getcwd()
         try:
             os.chdir('%s' % self.checkout_dir)
-            utils.run_command([constants.ANT_EXE, 'clean', 'clean-jars'])
-            os.chdir('%s/solr' % self.checkout_dir)
-            utils.run_command([constants.ANT_EXE, 'create-package'])
-            packaged = os.path.join(os.getcwd(), "package")
+            key = None
+            packaged = os.path.join(self.checkout_dir, self.backend.package_output)
+            # a sparse checkout does not contain all the sources of its tree
+            if self.artifact_cache is not None and not self.is_sparse():
+                build_digest = artifact_cache.get_build_digest(
+                    self.backend.get_command(*self.backend.package_tasks), self.checkout_dir,
+                    artifact_cache.get_java_version())
+                key = self.artifact_cache.get_key(self.checkout_dir, self.backend.name, build_digest)
+                if key is not None:
+                    if not os.path.exists(packaged):
+                        os.makedirs(packaged)
+                    cached = self.artifact_cache.get(key, packaged)
+                    if cached is not None:
+                        return cached
+            git_sha = self.get_head_sha()
+            utils.run_command(self.backend.get_command(*self.backend.clean_tasks), timeout=self.build_timeout)
+            os.chdir(os.path.join(self.checkout_dir, self.backend.package_module))
+            utils.run_command(self.backend.get_command(*self.backend.package_tasks), timeout=self.build_timeout)
             files = glob.glob(os.path.join(packaged, '*.tgz'))
             if len(files) == 0:
                 raise RuntimeError('No tgz file found at %s' % packaged)
             elif len(files) > 1:
                 raise RuntimeError('More than 1 tgz file found at %s' % packaged)
-            else:
-                return files[0]
+            if key is not None:
+                self.artifact_cache.put(key, files[0], git_sha)
+            return files[0]
         finally:
             os.chdir(x)
 
@@ -102,3 +291,26 @@ class LuceneSolrCheckout:
             return sha, datetime.datetime.strptime('%s %s' % (date_parts[0], date_parts[1]), '%Y-%m-%d %H:%M:%S')
         finally:
             os.chdir(x)
+
+
+def get_checkout(config, revision='LATEST', logger=logging.getLogger()):
+    """Creates a LuceneSolrCheckout for the repository, branch and clone options in the given configuration"""
+    sparse_include = None
+    sparse_exclude = None
+    if 'sparse_checkout' in config and config['sparse_checkout']:
+        sparse_include = config['include'].split('|') if 'include' in config and config['include'] else ['*.java']
+        sparse_exclude = config['exclude'].split('|') if 'exclude' in config and config['exclude'] else []
+    return LuceneSolrCheckout(config['repo'], config['checkout'], revision, logger,
+                              branch=config['branch'] if 'branch' in config else 'master',
+                              reference_repo=config['reference_repo'] if 'reference_repo' in config else None,
+                              clone_filter=config['clone_filter'] if 'clone_filter' in config else None,
+                              sparse_include=sparse_include,
+                              sparse_exclude=sparse_exclude,
+                              sparse_extra=config['sparse_checkout_extra'] if 'sparse_checkout_extra' in config else None,
+                              incremental=config['incremental_build'] if 'incremental_build' in config else False,
+                              offline=config['offline_build'] if 'offline_build' in config else False,
+                              git_timeout=float(config['git_timeout_secs']) if 'git_timeout_secs' in config else None,
+                              build_timeout=float(config['build_timeout_secs']) if 'build_timeout_secs' in config else None,
+                              shared_repo=config['shared_repo'] if 'shared_repo' in config else None,
+                              artifact_cache=artifact_cache.get_cache(config, logger),
+                              backend=build_backend.get_backend(config, logger=logger))
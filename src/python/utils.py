@@ -18,27 +18,42 @@ import subprocess
 import time
 import logging
 
+import runner
+
 GOOD_STATUS = 0
 BAD_STATUS = 1
+# the filter run produced no output for too long and was killed, counts as bad for git bisect
+HUNG_STATUS = 2
 SKIP_STATUS = 125
 ABORT_STATUS = 128
 
+STATUS_NAMES = {GOOD_STATUS: 'good', BAD_STATUS: 'bad', HUNG_STATUS: 'hung', SKIP_STATUS: 'skip', ABORT_STATUS: 'abort'}
 
-def run_get_output(command):
-    try:
-        return str(subprocess.check_output(command, stderr=subprocess.STDOUT)), 0
-    except subprocess.CalledProcessError as exception:
-        return exception.output, exception.returncode
+
+def to_str(output):
+    if output is not None and not isinstance(output, str):
+        return output.decode('utf-8', 'replace')
+    return output
+
+
+def run_get_output(command, timeout=None, cwd=None):
+    """Returns a (output, returncode) tuple. If the command times out, its process group is killed and the
+    returncode is the negative number of the signal that killed it."""
+    result = runner.run(command, timeout=timeout, cwd=cwd)
+    if result.timed_out:
+        logging.getLogger().error('Command %s timed out after %s seconds' % (command, timeout))
+    return result.output, result.returncode
 
 
-def run_command(command, logger=logging.getLogger()):
+def run_command(command, logger=logging.getLogger(), timeout=None, cwd=None):
     logger.info('RUN: %s' % command)
     t0 = time.time()
     try:
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        output, _ = process.communicate()
-        logger.info(output)
-    except (OSError, subprocess.CalledProcessError) as exception:
+        result = runner.run(command, timeout=timeout, cwd=cwd)
+        logger.info(result.output)
+        if result.timed_out:
+            raise subprocess.TimeoutExpired(command, timeout, result.output)
+    except (OSError, subprocess.CalledProcessError, subprocess.TimeoutExpired) as exception:
         logger.error('Exception occurred: ' + str(exception))
         logger.error('Subprocess failed')
         raise exception
@@ -0,0 +1,364 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A work queue in a (shared) directory which lets worker processes run filters on behalf of a coordinator.
+
+The coordinator (bootstrap or jenkins_clean_room with work_queue_dir configured) publishes one job per
+(SHA, module, test, filter) and workers, each with their own checkout, run them through room_filter.Filter:
+
+python src/python/work_queue.py -config /path/to/config.json -queue /path/to/queue [-worker-id id] [-exit-when-idle secs]
+
+Layout of the queue directory:
+    pending/<job>.json  jobs waiting for a worker, claimed by atomically renaming them into leased/
+    leased/<job>.json   jobs being run, with the id of the worker that claimed them
+    results/<job>.json  the status returned by the filter
+    workers/<id>.json   heartbeat of each worker, its modification time is refreshed while the worker is alive
+
+A leased job whose worker has not sent a heartbeat for lease_secs is returned to pending/ and retried on another
+worker, at most max_attempts times. The coordinator stops waiting once its time budget is spent or no worker has sent
+a heartbeat for lease_secs, and cancels the jobs left, whose tests are then run by the coordinator or deferred.
+
+A worker holds the lock on its checkout while it checks out, compiles and runs a job, so workers can share a checkout
+but must not share the checkout of the coordinator, which holds that lock for the whole run.
+"""
+
+import os
+import sys
+import time
+import uuid
+import itertools
+import socket
+import logging
+import threading
+import datetime
+
+import bootstrap
+import constants
+import locks
+import room_filter
+import runner
+import solr
+import utils
+
+PENDING = 'pending'
+LEASED = 'leased'
+RESULTS = 'results'
+WORKERS = 'workers'
+
+
+def is_enabled(config):
+    return 'work_queue_dir' in config and config['work_queue_dir']
+
+
+class WorkQueue:
+    def __init__(self, queue_dir, lease_secs=300, max_attempts=3):
+        self.queue_dir = queue_dir
+        self.lease_secs = lease_secs
+        self.max_attempts = max_attempts
+        for d in [PENDING, LEASED, RESULTS, WORKERS]:
+            if not os.path.exists(self.path(d)):
+                os.makedirs(self.path(d))
+
+    def path(self, *parts):
+        return os.path.join(self.queue_dir, *parts)
+
+    def submit(self, job):
+        """Publishes a job, a dict with at least an 'id' which must be unique within the queue"""
+        job['attempts'] = job['attempts'] if 'attempts' in job else 0
+        job['submitted'] = time.time()
+        locks.dump_json(job, self.path(PENDING, '%s.json' % job['id']))
+
+    def claim(self, worker_id):
+        """Leases the oldest pending job to the worker and returns it or None if there are no pending jobs"""
+        names = sorted(n for n in os.listdir(self.path(PENDING)) if n.endswith('.json'))
+        for name in names:
+            leased_path = self.path(LEASED, name)
+            try:
+                # only one worker can win the rename
+                os.rename(self.path(PENDING, name), leased_path)
+            except OSError:
+                continue
+            job = locks.load_json(leased_path)
+            if job is None:
+                continue
+            job['worker'] = worker_id
+            job['leased'] = time.time()
+            locks.dump_json(job, leased_path)
+            return job
+        return None
+
+    def complete(self, job, status, duration):
+        if not os.path.exists(self.path(LEASED, '%s.json' % job['id'])):
+            # cancelled by the coordinator or given up on by requeue_expired, nobody waits for the result
+            logging.getLogger().info('Job %s is no longer leased, dropping its result' % job['id'])
+            return
+        locks.dump_json({'id': job['id'], 'status': status, 'worker': job['worker'] if 'worker' in job else None,
+                         'duration': duration, 'attempts': job['attempts']}, self.path(RESULTS, '%s.json' % job['id']))
+        try:
+            os.remove(self.path(LEASED, '%s.json' % job['id']))
+        except OSError:
+            pass
+
+    def heartbeat(self, worker_id, info=None):
+        locks.dump_json({'id': worker_id, 'time': time.time(), 'info': info},
+                        self.path(WORKERS, '%s.json' % worker_id))
+
+    def has_live_workers(self):
+        for name in os.listdir(self.path(WORKERS)):
+            if name.endswith('.json') and self.is_alive(name[:-len('.json')]):
+                return True
+        return False
+
+    def cancel(self, job_id):
+        """Removes the job wherever it is, a worker running it drops its result"""
+        for d in [PENDING, LEASED, RESULTS]:
+            try:
+                os.remove(self.path(d, '%s.json' % job_id))
+            except OSError:
+                pass
+
+    def is_alive(self, worker_id):
+        try:
+            return time.time() - os.path.getmtime(self.path(WORKERS, '%s.json' % worker_id)) < self.lease_secs
+        except OSError:
+            return False
+
+    def get_claim_time(self, leased_path):
+        """Returns when a job was renamed into leased/, for a worker that died before writing its lease. The rename
+        keeps the modification time of the pending file but changes the status change time."""
+        try:
+            st = os.stat(leased_path)
+        except OSError:
+            return time.time()
+        return max(st.st_mtime, st.st_ctime)
+
+    def requeue_expired(self):
+        """Returns jobs leased by workers that stopped sending heartbeats to pending, or fails them with
+        ABORT_STATUS once they have been attempted max_attempts times. Returns the number of jobs requeued."""
+        logger = logging.getLogger()
+        requeued = 0
+        for name in os.listdir(self.path(LEASED)):
+            if not name.endswith('.json'):
+                continue
+            leased_path = self.path(LEASED, name)
+            job = locks.load_json(leased_path)
+            if job is None:
+                continue
+            if 'worker' in job:
+                if self.is_alive(job['worker']) or time.time() - job['leased'] < self.lease_secs:
+                    continue
+            elif time.time() - self.get_claim_time(leased_path) < self.lease_secs:
+                # not yet updated by the worker which just claimed it
+                continue
+            job['attempts'] += 1
+            if job['attempts'] >= self.max_attempts:
+                logger.error('Job %s was lost by %d workers, giving up' % (job['id'], job['attempts']))
+                self.complete(job, utils.ABORT_STATUS, 0.0)
+                continue
+            logger.warn('Worker %s stopped sending heartbeats, retrying job %s'
+                        % (job['worker'] if 'worker' in job else 'that claimed it', job['id']))
+            job.pop('worker', None)
+            job.pop('leased', None)
+            locks.dump_json(job, self.path(PENDING, name))
+            try:
+                os.remove(self.path(LEASED, name))
+            except OSError:
+                pass
+            requeued += 1
+        return requeued
+
+    def take_result(self, job_id):
+        """Returns and removes the result of the job or returns None if it has not finished"""
+        path = self.path(RESULTS, '%s.json' % job_id)
+        if not os.path.exists(path):
+            return None
+        result = locks.load_json(path)
+        if result is not None:
+            os.remove(path)
+        return result
+
+
+def get_queue(config):
+    return WorkQueue(config['work_queue_dir'],
+                     lease_secs=float(config['work_queue_lease_secs']) if 'work_queue_lease_secs' in config else 300,
+                     max_attempts=int(config['work_queue_max_attempts']) if 'work_queue_max_attempts' in config else 3)
+
+
+def run_filters(config, filters, tests, git_sha, checkout_dir, budget=None, poll_secs=1.0):
+    """Runs each (test_dir, test_name) in tests through the filters on the workers of the configured queue.
+
+    Like room_filter.run_filters, the next filter is only run for a test if the previous one passed. Stops waiting
+    once the scheduler.Budget is exhausted or no worker is alive.
+    Returns a dict of test name -> (status, name of the filter that did not pass or None), the tests missing from it
+    were not run.
+    """
+    logger = logging.getLogger()
+    queue = get_queue(config)
+    batch = uuid.uuid4().hex[:12]
+    seq = itertools.count()
+    # job id -> (test_dir, test_name, index of the filter)
+    running = {}
+    results = {}
+
+    def submit(test_dir, test_name, idx):
+        job_id = '%s-%06d-%s' % (batch, next(seq), filters[idx].name)
+        running[job_id] = (test_dir, test_name, idx)
+        queue.submit({'id': job_id, 'sha': git_sha, 'module': os.path.relpath(test_dir, checkout_dir),
+                      'test': test_name, 'filter': filters[idx].name})
+
+    for test_dir, test_name in tests:
+        if test_dir is None:
+            # e.g. a test reported by jenkins which is excluded or no longer exists, workers cannot run it
+            logger.warn('No module found for test %s, not submitting it' % test_name)
+            results[test_name] = (utils.BAD_STATUS, filters[0].name)
+            continue
+        submit(test_dir, test_name, 0)
+    logger.info('Submitted %d tests to work queue %s at git sha %s' % (len(running), queue.queue_dir, git_sha))
+    t0 = time.time()
+    while len(running) > 0:
+        if budget is not None and budget.exhausted():
+            logger.warn('Time budget exhausted, cancelling %d jobs on work queue %s' % (len(running), queue.queue_dir))
+            break
+        if not queue.has_live_workers() and time.time() - t0 >= queue.lease_secs:
+            logger.warn('No worker sent a heartbeat to work queue %s for %d seconds, cancelling %d jobs'
+                        % (queue.queue_dir, queue.lease_secs, len(running)))
+            break
+        queue.requeue_expired()
+        for job_id in list(running):
+            result = queue.take_result(job_id)
+            if result is None:
+                continue
+            test_dir, test_name, idx = running.pop(job_id)
+            status = result['status']
+            logger.info('Worker %s ran %s through filter %s: %s in %.1f sec'
+                        % (result['worker'], test_name, filters[idx].name, utils.STATUS_NAMES.get(status, status),
+                           result['duration']))
+            if status == utils.GOOD_STATUS and idx + 1 < len(filters):
+                submit(test_dir, test_name, idx + 1)
+            else:
+                results[test_name] = (status, None if status == utils.GOOD_STATUS else filters[idx].name)
+        if len(running) > 0:
+            time.sleep(poll_secs)
+    for job_id in running:
+        queue.cancel(job_id)
+    return results
+
+
+class Worker:
+    def __init__(self, config, queue, worker_id, logger=logging.getLogger()):
+        self.config = config
+        self.queue = queue
+        self.worker_id = worker_id
+        self.logger = logger
+        self.filters = dict((f.name, f) for f in room_filter.get_filters(config, logger))
+        self.git_sha = None
+        self.stopped = threading.Event()
+
+    def send_heartbeats(self):
+        interval = max(self.queue.lease_secs / 4.0, 0.1)
+        while not self.stopped.is_set():
+            self.queue.heartbeat(self.worker_id, {'host': socket.gethostname(), 'pid': os.getpid(),
+                                                  'git_sha': self.git_sha})
+            self.stopped.wait(interval)
+
+    def update_checkout(self, git_sha):
+        """Checks out and compiles git_sha unless it is the last one this worker did, the caller holds the lock on the
+        checkout"""
+        if self.git_sha == git_sha:
+            # another worker sharing the checkout may have moved it since
+            output, ret = utils.run_get_output([constants.GIT_EXE, 'rev-parse', 'HEAD'], cwd=self.config['checkout'])
+            if ret == 0 and output.strip() == git_sha:
+                return
+        self.logger.info('Checking out git sha %s in %s' % (git_sha, self.config['checkout']))
+        checkout = solr.get_checkout(self.config, git_sha, self.logger)
+        checkout.checkout()
+        checkout.compile_tests()
+        self.git_sha = git_sha
+
+    def run_job(self, job):
+        t0 = time.time()
+        status = utils.BAD_STATUS
+        try:
+            if job['filter'] not in self.filters:
+                raise RuntimeError('Filter %s is not configured on worker %s' % (job['filter'], self.worker_id))
+            # other workers sharing the checkout wait until the filter ran against the classes of this job
+            with locks.lock(self.config['checkout'], timeout=locks.get_timeout(self.config)):
+                self.update_checkout(job['sha'])
+                test_dir = os.path.join(self.config['checkout'], job['module'])
+                status = self.filters[job['filter']].filter(test_dir, job['test'])
+        except Exception as e:
+            self.logger.exception('Job %s failed on worker %s' % (job['id'], self.worker_id))
+            status = utils.ABORT_STATUS
+        self.queue.complete(job, status, time.time() - t0)
+        return status
+
+    def run(self, exit_when_idle=None, poll_secs=1.0):
+        """Runs jobs until stopped or, if exit_when_idle is given, until no job was found for that many seconds"""
+        heartbeats = threading.Thread(target=self.send_heartbeats, name='heartbeat')
+        heartbeats.daemon = True
+        heartbeats.start()
+        idle_since = time.time()
+        try:
+            while not self.stopped.is_set():
+                job = self.queue.claim(self.worker_id)
+                if job is None:
+                    if exit_when_idle is not None and time.time() - idle_since > exit_when_idle:
+                        self.logger.info('No jobs for %d seconds, exiting' % exit_when_idle)
+                        break
+                    self.stopped.wait(poll_secs)
+                    continue
+                self.logger.info('Worker %s running job %s (attempt %d)' % (self.worker_id, job['id'],
+                                                                            job['attempts'] + 1))
+                self.run_job(job)
+                idle_since = time.time()
+        finally:
+            self.stopped.set()
+
+
+def main():
+    start = datetime.datetime.now()
+    time_stamp = '%04d.%02d.%02d.%02d.%02d.%02d' % (
+        start.year, start.month, start.day, start.hour, start.minute, start.second)
+    config = bootstrap.get_config()
+    if '-queue' in sys.argv:
+        index = sys.argv.index('-queue')
+        config['work_queue_dir'] = sys.argv[index + 1]
+    if not is_enabled(config):
+        print('No -queue specified and no work_queue_dir in the configuration, exiting.')
+        exit(1)
+    worker_id = '%s-%d' % (socket.gethostname(), os.getpid())
+    if '-worker-id' in sys.argv:
+        index = sys.argv.index('-worker-id')
+        worker_id = sys.argv[index + 1]
+    exit_when_idle = None
+    if '-exit-when-idle' in sys.argv:
+        index = sys.argv.index('-exit-when-idle')
+        exit_when_idle = float(sys.argv[index + 1])
+
+    output_dir = config['output']
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    level = logging.INFO
+    if '-debug' in sys.argv:
+        level = logging.DEBUG
+    config['time_stamp'] = time_stamp
+    bootstrap.setup_logging(output_dir, time_stamp, level)
+    runner.install_signal_handlers()
+    Worker(config, get_queue(config), worker_id).run(exit_when_idle)
+
+
+if __name__ == '__main__':
+    main()
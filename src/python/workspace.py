@@ -0,0 +1,94 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import logging
+
+import bootstrap
+
+
+class Workspace:
+    """State shared by several configurations that are run by the same process.
+
+    All checkouts are worktrees of one bare repository and configurations on the same branch share a worktree.
+    The workspace remembers what it has fetched, checked out, discovered and compiled so that a configuration
+    which resolves to the same SHA as an earlier one does not repeat that work.
+    """
+
+    def __init__(self, root_dir, logger=logging.getLogger()):
+        self.root_dir = root_dir
+        self.shared_repo = os.path.join(root_dir, 'objects.git')
+        self.logger = logger
+        # (checkout dir, branch) whose latest revision was fetched by this process
+        self.fetched = set()
+        # checkout dir -> (revision, sparse include patterns) checked out by this process
+        self.checked_out = {}
+        # (checkout dir, sha, exclude, include) -> tests found by bootstrap.gather_interesting_tests
+        self.tests = {}
+        # (checkout dir, sha) whose tests were compiled by this process
+        self.compiled = set()
+
+    def configure(self, config):
+        """Returns a copy of the configuration that uses the shared repository and the worktree of its branch"""
+        config = dict(config)
+        branch = config['branch'] if 'branch' in config else 'master'
+        config['shared_repo'] = self.shared_repo
+        config['checkout'] = os.path.join(self.root_dir, 'worktrees', branch.replace('/', '_'))
+        return config
+
+    def invalidate_fetches(self):
+        """Makes the next checkout of the latest revision of every branch fetch it again"""
+        self.fetched.clear()
+
+    def is_checked_out(self, checkout_dir):
+        return checkout_dir in self.checked_out
+
+    def checkout(self, checkout):
+        """Same as checkout.checkout() but does nothing if this process already did the same checkout"""
+        sparse = tuple(checkout.sparse_include) if checkout.sparse_include is not None else None
+        if checkout.revision == 'LATEST':
+            key = (checkout.checkout_dir, checkout.branch)
+            if key in self.fetched:
+                self.logger.info('Branch %s was already fetched into %s' % (checkout.branch, checkout.checkout_dir))
+                return
+            checkout.checkout()
+            self.compiled = set(c for c in self.compiled if c[0] != checkout.checkout_dir)
+            self.fetched.add(key)
+            self.checked_out[checkout.checkout_dir] = (checkout.revision, sparse)
+            return
+        if self.checked_out.get(checkout.checkout_dir) == (checkout.revision, sparse):
+            self.logger.info('Reusing checkout of revision %s in %s' % (checkout.revision, checkout.checkout_dir))
+            return
+        checkout.checkout()
+        self.checked_out[checkout.checkout_dir] = (checkout.revision, sparse)
+        # the build outputs in the directory are no longer for the revision they were compiled at
+        self.compiled = set(c for c in self.compiled if c[0] != checkout.checkout_dir)
+
+    def gather_interesting_tests(self, checkout_dir, sha, exclude, include):
+        key = (checkout_dir, sha, tuple(exclude), tuple(include))
+        if key in self.tests:
+            self.logger.info('Reusing tests found in %s at revision %s' % (checkout_dir, sha))
+        else:
+            self.tests[key] = bootstrap.gather_interesting_tests(checkout_dir, exclude, include)
+        return self.tests[key]
+
+    def compile_tests(self, checkout, sha):
+        key = (checkout.checkout_dir, sha)
+        if key in self.compiled:
+            self.logger.info('Tests in %s were already compiled at revision %s' % (checkout.checkout_dir, sha))
+            return
+        checkout.compile_tests()
+        self.compiled.add(key)
@@ -0,0 +1,116 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+
+import pytest
+
+import analytics
+
+
+def entry(name, entry_date, module='solr/core'):
+    return {'name': name, 'entry_date': entry_date, 'git_sha': 'abc', 'module': module}
+
+
+def report(day, clean, detention, demotions=()):
+    """A report in which the detained tests entered detention on the day of their test date if they are in failed"""
+    test_date = '2018-01-%02d 00-00-00' % day
+    return {'test_date': test_date,
+            'clean': {'tests': dict((t, entry(t, '2018-01-01 00:00:00')) for t in clean)},
+            'detention': {'tests': dict((t, entry(t, d)) for t, d in detention)},
+            'demotions': dict((t, entry(t, test_date)) for t in demotions)}
+
+
+def make_history():
+    # TestA: clean, detained (failed), clean, detained (failed) i.e. 3 flips with 2 failures in 4 days
+    # TestB: clean on all 4 days, demoted on day 4 without being detained on that date
+    # TestC: detained since before the history starts, only present on days 3 and 4
+    history = analytics.History()
+    history.add_report(report(1, ['TestA', 'TestB'], []))
+    history.add_report(report(2, ['TestB'], [('TestA', '2018-01-02 09:00:00')]))
+    history.add_report(report(3, ['TestA', 'TestB'], [('TestC', '2017-12-01 00:00:00')]))
+    history.add_report(report(4, ['TestB'], [('TestA', '2018-01-04 09:00:00'), ('TestC', '2017-12-01 00:00:00')],
+                              demotions=['TestB']))
+    return history
+
+
+def test_columns():
+    history = make_history()
+    a, b, c = [history.index[t] for t in ['TestA', 'TestB', 'TestC']]
+    assert history.present[a] == 0b1111 and history.detained[a] == 0b1010 and history.failed[a] == 0b1010
+    assert history.present[b] == 0b1111 and history.detained[b] == 0 and history.failed[b] == 0b1000
+    assert history.present[c] == 0b1100 and history.detained[c] == 0b1100 and history.failed[c] == 0
+
+
+def test_metrics():
+    history = make_history()
+    a, b, c = [history.index[t] for t in ['TestA', 'TestB', 'TestC']]
+    assert history.mask() == 0b1111
+    assert history.mask(1, 3) == 0b0110
+    assert history.mask(3, 1) == 0
+    assert [history.flips(i) for i in [a, b, c]] == [3, 0, 0]
+    assert history.failure_rate(a) == 0.5
+    assert history.failure_rate(a, history.mask(2, 4)) == 0.5
+    assert history.failure_rate(b, history.mask(0, 2)) == 0.0
+    assert history.failure_rate(c, history.mask(0, 2)) == 0.0
+
+
+def test_reports_must_be_added_in_order():
+    history = make_history()
+    with pytest.raises(ValueError):
+        history.add_report(report(4, [], []))
+
+
+def test_data_round_trip():
+    history = make_history()
+    loaded = analytics.History.from_data(json.loads(json.dumps(history.get_data())))
+    assert loaded.get_data() == history.get_data()
+    assert loaded.index == history.index
+
+
+def test_queries():
+    history = make_history()
+    assert analytics.top_flips(history, 10) == [{'test': 'TestA', 'module': 'solr/core', 'flips': 3}]
+    assert [(r['test'], r['failure_rate']) for r in analytics.top_failure_rates(history, 10)] \
+        == [('TestA', 0.5), ('TestB', 0.25)]
+    assert analytics.mtbf_by_module(history, 10) == [{'module': 'solr/core', 'mtbf_days': 10 / 3.0, 'failures': 3}]
+    # TestA failed once in each of the last two windows of 2 dates, TestB only in the recent one
+    assert analytics.failure_trend(history, 10, 2) == [{'test': 'TestB', 'module': 'solr/core', 'change': 0.5,
+                                                        'recent_failure_rate': 0.5}]
+
+
+def write_report(reports_dir, r):
+    date_dir = os.path.join(reports_dir, r['test_date'].replace('-', '.').replace(' ', '.'))
+    os.makedirs(date_dir)
+    with open(os.path.join(date_dir, 'report.json'), 'w') as f:
+        json.dump(r, f)
+
+
+def test_load_reads_only_new_reports(tmpdir):
+    config = {'report': str(tmpdir)}
+    write_report(str(tmpdir), report(2, ['TestA'], []))
+    assert analytics.load(config).dates == ['2018-01-02 00-00-00']
+    write_report(str(tmpdir), report(3, [], [('TestA', '2018-01-03 09:00:00')]))
+    history = analytics.load(config)
+    assert history.dates == ['2018-01-02 00-00-00', '2018-01-03 00-00-00']
+    assert history.failed[history.index['TestA']] == 0b10
+    # a report for an earlier date moves the bits of all later dates, the history is rebuilt
+    write_report(str(tmpdir), report(1, ['TestA'], []))
+    history = analytics.load(config)
+    assert len(history.dates) == 3
+    assert history.failed[history.index['TestA']] == 0b100
+    assert analytics.query(config, 'flips') == [{'test': 'TestA', 'module': 'solr/core', 'flips': 1}]
@@ -0,0 +1,81 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import subprocess
+
+import artifact_cache
+
+
+def make_tgz(tmpdir, name, size):
+    path = str(tmpdir.join(name))
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    return path
+
+
+def test_put_and_get(tmpdir):
+    cache = artifact_cache.ArtifactCache(str(tmpdir.join('cache')))
+    cache.put('ant-abc-tree1', make_tgz(tmpdir, 'solr-8.0.0.tgz', 10), 'sha1')
+    dest_dir = str(tmpdir.mkdir('package'))
+    path = cache.get('ant-abc-tree1', dest_dir)
+    assert path == os.path.join(dest_dir, 'solr-8.0.0.tgz')
+    assert os.path.getsize(path) == 10
+    assert cache.get('ant-abc-tree2', dest_dir) is None
+    assert [(e['key'], e['git_sha'], e['size']) for e in cache.list_entries()] == [('ant-abc-tree1', 'sha1', 10)]
+
+
+def test_evicts_the_least_recently_used(tmpdir):
+    cache = artifact_cache.ArtifactCache(str(tmpdir.join('cache')), max_bytes=25)
+    dest_dir = str(tmpdir.mkdir('package'))
+    cache.put('a', make_tgz(tmpdir, 'a.tgz', 10), 'sha-a')
+    cache.put('b', make_tgz(tmpdir, 'b.tgz', 10), 'sha-b')
+    # a is now used more recently than b
+    assert cache.get('a', dest_dir) is not None
+    cache.put('c', make_tgz(tmpdir, 'c.tgz', 10), 'sha-c')
+    assert [e['key'] for e in cache.list_entries()] == ['a', 'c']
+    # the entry just put is kept even if it alone is too large
+    cache.put('d', make_tgz(tmpdir, 'd.tgz', 30), 'sha-d')
+    assert [e['key'] for e in cache.list_entries()] == ['d']
+
+
+def test_get_key(tmpdir):
+    repo = str(tmpdir)
+    git = ['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com']
+    subprocess.check_call(git + ['init', '-q'], cwd=repo)
+    tmpdir.join('build.xml').write('<project/>')
+    subprocess.check_call(git + ['add', '-A'], cwd=repo)
+    subprocess.check_call(git + ['commit', '-q', '-m', 'initial'], cwd=repo)
+    tree = subprocess.check_output(git + ['rev-parse', 'HEAD^{tree}'], cwd=repo).decode('utf-8').strip()
+
+    cache = artifact_cache.ArtifactCache(str(tmpdir.join('cache')))
+    assert cache.get_key(repo, 'ant', 'digest') == 'ant-digest-%s' % tree
+    tmpdir.join('build.xml').write('<project name="modified"/>')
+    assert cache.get_key(repo, 'ant', 'digest') is None
+
+
+def test_build_digest():
+    command = ['/work/solr/gradlew', '--console=plain', '--offline', ':solr:packaging:distTar']
+    digest = artifact_cache.get_build_digest(command, '/work/solr', 'openjdk 11', {'JAVA_HOME': '/jdk11'})
+    # the same build in another checkout directory
+    assert digest == artifact_cache.get_build_digest(
+        ['/other/solr/gradlew', '--console=plain', '--offline', ':solr:packaging:distTar'], '/other/solr',
+        'openjdk 11', {'JAVA_HOME': '/jdk11', 'PATH': '/bin'})
+    assert digest != artifact_cache.get_build_digest(command[:2] + command[3:], '/work/solr', 'openjdk 11',
+                                                     {'JAVA_HOME': '/jdk11'})
+    assert digest != artifact_cache.get_build_digest(command, '/work/solr', 'openjdk 8', {'JAVA_HOME': '/jdk11'})
+    assert digest != artifact_cache.get_build_digest(command, '/work/solr', 'openjdk 11',
+                                                     {'JAVA_HOME': '/jdk11', 'GRADLE_OPTS': '-Dtests.asserts=false'})
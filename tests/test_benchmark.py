@@ -0,0 +1,80 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import json
+import datetime
+import subprocess
+
+import utils
+import bootstrap
+import constants
+import room_filter
+import jenkins_clean_room
+import fake_reports
+import synthetic_repo
+
+FAKE_ANT = os.path.join(os.path.dirname(os.path.abspath(synthetic_repo.__file__)), 'fake_ant.py')
+
+
+def test_read_failure_report(tmpdir):
+    tests = synthetic_repo.all_tests(2, 3)
+    paths = fake_reports.generate_failure_reports(str(tmpdir), tests, ['apache/Lucene-Solr-Tests-master'],
+                                                  datetime.datetime(2018, 1, 1), 2, failures_per_day=50)
+    assert len(paths) == 2
+    failures = list(jenkins_clean_room.read_failure_report(paths[0], ['apache/Lucene-Solr-Tests-master']))
+    # the failures on the other jobs are left out
+    assert 0 < len(failures) < 50
+    names = set(t for m, t in tests)
+    for test_name, method_name, jenkins in failures:
+        assert test_name in names
+        assert method_name.startswith('test')
+        assert 'apache/Lucene-Solr-Tests-master' in jenkins
+
+
+def test_synthetic_repo(tmpdir):
+    repo = str(tmpdir.join('repo.git'))
+    last = synthetic_repo.generate(repo, 2, 3, 4, commits_per_day=2)
+    assert last.date() == datetime.date(2018, 1, 5)
+    count = subprocess.check_output(['git', '--git-dir', repo, 'rev-list', '--count', 'master']).decode('utf-8')
+    assert int(count) == 1 + 4 * 2
+    checkout_dir = str(tmpdir.join('checkout'))
+    subprocess.check_call(['git', 'clone', '-q', repo, checkout_dir])
+    found = bootstrap.gather_interesting_tests(checkout_dir, [], ['*Test.java'])
+    assert sorted((os.path.relpath(m, checkout_dir), t) for m in found for t in found[m]) \
+        == sorted(synthetic_repo.all_tests(2, 3))
+
+
+def test_fake_ant_follows_the_script(tmpdir):
+    script = str(tmpdir.join('script.json'))
+    with open(script, 'w') as f:
+        json.dump({'tests': {'BadTest': {'exit': 1, 'output': 'Tests with failures'}}}, f)
+    env = dict(os.environ)
+    env['FAKE_ANT_SCRIPT'] = script
+    module_dir = str(tmpdir.mkdir('core'))
+
+    def fake_ant(*args):
+        return subprocess.call([sys.executable, FAKE_ANT] + list(args), cwd=module_dir, env=env,
+                               stdout=subprocess.DEVNULL)
+
+    assert fake_ant('test', '-Dtestcase=GoodTest') == 0
+    assert fake_ant('test', '-Dtestcase=BadTest') == 1
+    assert fake_ant('test', '-Dtests.class=GoodTest,BadTest') == 1
+    # the batch reports can be read like those of ant
+    assert room_filter.read_junit_reports(os.path.join(module_dir, constants.JUNIT_REPORTS_GLOB),
+                                          ['GoodTest', 'BadTest'], 0) \
+        == {'GoodTest': utils.GOOD_STATUS, 'BadTest': utils.BAD_STATUS}
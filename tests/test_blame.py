@@ -0,0 +1,70 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import fnmatch
+import subprocess
+
+import blame
+
+
+class FakeCheckout:
+    def __init__(self, checkout_dir):
+        self.checkout_dir = checkout_dir
+
+    def is_build_file(self, path):
+        return fnmatch.fnmatch(path, '*build.xml')
+
+
+def git(repo, *args):
+    return subprocess.check_output(['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com'] + list(args),
+                                   cwd=repo).decode('utf-8').strip()
+
+
+def commit(repo, files, message):
+    for path, content in files.items():
+        full_path = os.path.join(repo, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'w') as f:
+            f.write(content)
+    git(repo, 'add', '-A')
+    git(repo, 'commit', '-q', '-m', message)
+    return git(repo, 'rev-parse', 'HEAD')
+
+
+def test_get_relevant_commits(tmpdir, monkeypatch):
+    repo = str(tmpdir)
+    git(repo, 'init', '-q')
+    good = commit(repo, {
+        'solr/core/src/java/org/apache/solr/core/SolrCore.java':
+            'package org.apache.solr.core;\npublic class SolrCore {}\n',
+        'solr/core/src/test/org/apache/solr/core/TestSolrCore.java':
+            'package org.apache.solr.core;\npublic class TestSolrCore { SolrCore core; }\n',
+        'lucene/core/src/java/org/apache/lucene/Other.java': 'package org.apache.lucene;\npublic class Other {}\n',
+    }, 'initial')
+    dependency = commit(repo, {'solr/core/src/java/org/apache/solr/core/SolrCore.java':
+                               'package org.apache.solr.core;\npublic class SolrCore { int x; }\n'}, 'dependency')
+    unrelated = commit(repo, {'lucene/core/src/java/org/apache/lucene/Other.java':
+                              'package org.apache.lucene;\npublic class Other { int x; }\n'}, 'unrelated')
+    resource = commit(repo, {'solr/core/src/test-files/solr/solr.xml': '<solr/>'}, 'resource')
+    changes = commit(repo, {'solr/CHANGES.txt': 'changes'}, 'changes')
+    configset = commit(repo, {'solr/server/solr/configsets/_default/conf/solrconfig.xml': '<config/>'}, 'configset')
+    build = commit(repo, {'lucene/build.xml': '<project/>'}, 'build')
+    monkeypatch.chdir(repo)
+    relevant, irrelevant = blame.get_relevant_commits(FakeCheckout(repo), 'TestSolrCore', good, build)
+    assert set(relevant) == {dependency, resource, configset, build}
+    assert set(irrelevant) == {unrelated, changes}
+    assert blame.get_relevant_commits(FakeCheckout(repo), 'TestMissing', good, build) is None
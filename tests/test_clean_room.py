@@ -0,0 +1,62 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import clean_room
+
+
+def room_data():
+    return {'name': 'master', 'last_updated': '2018.10.01.00.00.00',
+            'tests': {'TestFoo': {'name': 'TestFoo', 'entry_date': '2018-09-30 10:00:00', 'git_sha': 'abc',
+                                  'module': 'solr/core'},
+                      'TestBar': {'name': 'TestBar', 'entry_date': '2018-09-30 10:00:00', 'git_sha': 'abc',
+                                  'module': 'solr/core', 'extra_info': {'reproducible': True}}}}
+
+
+def test_entry_round_trip():
+    for d in room_data()['tests'].values():
+        assert clean_room.Entry.from_dict(d).to_dict() == d
+    # entries written before modules were recorded
+    entry = clean_room.Entry.from_dict({'name': 'TestBaz', 'entry_date': '2018-09-30 10:00:00', 'git_sha': 'abc'})
+    assert entry.module is None and entry.extra_info is None
+    assert entry.to_dict() == {'name': 'TestBaz', 'entry_date': '2018-09-30 10:00:00', 'git_sha': 'abc',
+                               'module': None}
+
+
+def test_entries_share_interned_strings():
+    room = clean_room.Room('detention', room_data())
+    foo, bar = room.get_entry('TestFoo'), room.get_entry('TestBar')
+    assert foo.git_sha is bar.git_sha and foo.module is bar.module and foo.entry_date is bar.entry_date
+
+
+def test_room_round_trip():
+    data = room_data()
+    room = clean_room.Room('detention', data)
+    assert room.get_data() == data
+    assert sorted(room.get_tests()) == ['TestBar', 'TestFoo']
+    assert room.num_tests() == 2
+
+
+def test_enter_and_exit():
+    room = clean_room.Room('clean-room', room_data())
+    room.enter('TestBaz', 'lucene/core', '2018-10-01 10:00:00', 'def')
+    assert room.exit('TestFoo')
+    assert not room.exit('TestQux')
+    assert room.has('TestBaz') and not room.has('TestFoo')
+    assert room.get_entered() == {'TestBaz': {'name': 'TestBaz', 'entry_date': '2018-10-01 10:00:00',
+                                              'git_sha': 'def', 'module': 'lucene/core'}}
+    assert list(room.get_exited()) == ['TestFoo']
+    assert room.num_entered() == 1 and room.num_exited() == 1
+    assert sorted(room.get_data()['tests']) == ['TestBar', 'TestBaz']
@@ -0,0 +1,86 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import gzip
+import datetime
+
+import failure_archive
+
+REPORTS = {
+    '2018-01-31': ['org.apache.solr.TestA,testOne,thetaphi/Lucene-Solr-master-Linux/9562/'],
+    '2018-02-01': ['org.apache.solr.TestA,testTwo,thetaphi/Lucene-Solr-master-Linux/9570/',
+                   'org.apache.lucene.TestB,testOne,apache/Lucene-Solr-NightlyTests-master/12/'],
+    '2018-02-03': ['org.apache.lucene.TestB,testThree,local-job'],
+}
+
+
+def write_reports(raw_dir):
+    os.makedirs(raw_dir)
+    for date_s, lines in REPORTS.items():
+        with gzip.open(os.path.join(raw_dir, date_s + failure_archive.RAW_SUFFIX), 'wb') as f:
+            f.write(('\n'.join(lines) + '\n').encode('utf-8'))
+
+
+def date(s):
+    return datetime.datetime.strptime(s, '%Y-%m-%d')
+
+
+def make_archive(tmpdir):
+    config = {'output': str(tmpdir), 'jenkins_jobs': ['thetaphi/Lucene-Solr-master', 'local-job'],
+              'failure_archive_window_days': 5}
+    raw_dir = os.path.join(str(tmpdir), failure_archive.RAW_ARCHIVE_DIR)
+    write_reports(raw_dir)
+    archive = failure_archive.get_archive(config)
+    assert archive.compact(raw_dir) == 3
+    return config, archive, raw_dir
+
+
+def test_failures_round_trip_in_date_order(tmpdir):
+    config, archive, raw_dir = make_archive(tmpdir)
+    expected = [(date('2018-01-31'), 'TestA', 'testOne', 'thetaphi/Lucene-Solr-master-Linux/9562/'),
+                (date('2018-02-01'), 'TestA', 'testTwo', 'thetaphi/Lucene-Solr-master-Linux/9570/'),
+                (date('2018-02-01'), 'TestB', 'testOne', 'apache/Lucene-Solr-NightlyTests-master/12/'),
+                (date('2018-02-03'), 'TestB', 'testThree', 'local-job')]
+    assert sorted(archive.get_failures(date('2018-01-01'), date('2018-02-28'))) == expected
+    # the archive is read back from its files by a new process
+    assert sorted(failure_archive.get_archive(config).get_failures(date('2018-01-01'), date('2018-02-28'))) == expected
+
+
+def test_folding_a_date_twice_has_no_effect(tmpdir):
+    config, archive, raw_dir = make_archive(tmpdir)
+    assert archive.has_date(date('2018-02-01'))
+    assert not archive.has_date(date('2018-02-02'))
+    assert archive.compact(raw_dir) == 0
+    assert len(list(archive.get_failures(date('2018-01-01'), date('2018-02-28')))) == 4
+
+
+def test_get_failures_filters_by_dates_test_and_jobs(tmpdir):
+    config, archive, raw_dir = make_archive(tmpdir)
+    assert [f[2] for f in archive.get_failures(date('2018-02-01'), date('2018-02-02'))] == ['testTwo', 'testOne']
+    assert [f[2] for f in archive.get_failures(date('2018-01-01'), date('2018-02-28'), 'TestB')] == [
+        'testOne', 'testThree']
+    assert list(archive.get_failures(date('2018-01-01'), date('2018-02-28'), 'TestMissing')) == []
+    assert [f[2] for f in archive.get_failures(date('2018-01-01'), date('2018-02-28'), 'TestB',
+                                               ['local-job'])] == ['testThree']
+
+
+def test_count_failures_in_window(tmpdir):
+    config, archive, raw_dir = make_archive(tmpdir)
+    # the window of 5 days ending on 2018-02-03 starts on 2018-01-30, the nightly job is not configured
+    assert failure_archive.count_failures(config, date('2018-02-03')) == {'TestA': 2, 'TestB': 1}
+    assert failure_archive.count_failures(config, date('2018-02-03'), 'TestB') == {'TestB': 1}
+    assert failure_archive.count_failures(config, date('2018-02-05')) == {'TestA': 1, 'TestB': 1}
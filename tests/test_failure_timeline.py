@@ -0,0 +1,102 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import failure_timeline
+
+
+def make_config(tmpdir, name='test'):
+    return {'name': name, 'output': str(tmpdir)}
+
+
+def test_record_keeps_dates_sorted_and_unique():
+    timeline = failure_timeline.FailureTimeline()
+    timeline.record('TestA', '2018-01-03 10:00:00')
+    timeline.record('TestA', '2018-01-01 10-00-00')
+    timeline.record('TestA', '2018-01-03 10-00-00')
+    assert timeline.get_failures('TestA') == ['2018-01-01 10-00-00', '2018-01-03 10-00-00']
+    assert timeline.last_failure('TestA') == '2018-01-03 10-00-00'
+    assert timeline.get_failures('TestB') == []
+
+
+def test_pop_not_failed_since_returns_oldest_first():
+    timeline = failure_timeline.FailureTimeline()
+    timeline.record('TestA', '2018-01-05 00-00-00')
+    timeline.record('TestB', '2018-01-01 00-00-00')
+    timeline.record('TestC', '2018-01-10 00-00-00')
+    timeline.track_all(['TestA', 'TestB', 'TestC', 'TestUnknown'])
+    assert timeline.pop_not_failed_since('2018-01-08 00-00-00') == ['TestB', 'TestA']
+    assert not timeline.is_tracked('TestA')
+    assert timeline.is_tracked('TestC')
+    assert timeline.pop_not_failed_since('2018-01-08 00-00-00') == []
+
+
+def test_failing_again_makes_the_old_heap_item_stale():
+    timeline = failure_timeline.FailureTimeline()
+    timeline.record('TestA', '2018-01-01 00-00-00')
+    timeline.track('TestA')
+    timeline.record('TestA', '2018-01-09 00-00-00')
+    assert timeline.pop_not_failed_since('2018-01-05 00-00-00') == []
+    assert timeline.pop_not_failed_since('2018-01-10 00-00-00') == ['TestA']
+
+
+def test_untracked_tests_are_not_popped():
+    timeline = failure_timeline.FailureTimeline()
+    timeline.record('TestA', '2018-01-01 00-00-00')
+    timeline.track('TestA')
+    timeline.untrack('TestA')
+    assert timeline.pop_not_failed_since('2018-01-10 00-00-00') == []
+
+
+def test_save_and_load_keep_the_heap(tmpdir):
+    config = make_config(tmpdir)
+    timeline = failure_timeline.FailureTimeline()
+    for i, test_name in enumerate(['TestA', 'TestB', 'TestC']):
+        timeline.record(test_name, '2018-01-0%d 00-00-00' % (i + 1))
+        timeline.track(test_name)
+    failure_timeline.save(config, timeline)
+    # another configuration in the same file is left alone
+    failure_timeline.save(make_config(tmpdir, 'other'), failure_timeline.FailureTimeline())
+
+    loaded = failure_timeline.load(config)
+    assert loaded.indexed
+    assert loaded.get_data() == timeline.get_data()
+    assert loaded.num_tracked() == 3
+    assert loaded.pop_not_failed_since('2018-01-03 00-00-00') == ['TestA', 'TestB']
+    assert not failure_timeline.load(make_config(tmpdir, 'missing')).indexed
+
+
+def test_compact_drops_stale_items():
+    timeline = failure_timeline.FailureTimeline()
+    timeline.record('TestA', '2018-01-01 00-00-00')
+    timeline.track('TestA')
+    for day in range(2, 6):
+        timeline.record('TestA', '2018-01-0%d 00-00-00' % day)
+    assert len(timeline.heap) == 5
+    timeline.compact()
+    assert timeline.heap == [('2018-01-05 00-00-00', 'TestA')]
+
+
+def test_track_all_replaces_the_tracked_tests():
+    timeline = failure_timeline.FailureTimeline()
+    for test_name in ['TestA', 'TestB', 'TestC']:
+        timeline.record(test_name, '2018-01-01 00-00-00')
+    timeline.track_all(['TestA', 'TestB'])
+    # as many tests as in detention, but not the same ones
+    assert timeline.num_tracked() == 2
+    assert not timeline.tracks_exactly(['TestA', 'TestC'])
+    timeline.track_all(['TestA', 'TestC'])
+    assert timeline.tracks_exactly(['TestC', 'TestA'])
+    assert timeline.pop_not_failed_since('2018-01-02 00-00-00') == ['TestA', 'TestC']
@@ -0,0 +1,39 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import filter_logs
+
+
+def test_write_and_read_index(tmpdir):
+    log_dir = str(tmpdir.join('filter-logs'))
+    output = 'compile\n   [junit4] Tests with failures [seed: 1]:\nBUILD FAILED\n'
+    first = filter_logs.write(log_dir, 'TestFoo', 'beast', 1, 12.3456, output, placement={'cpus': [0, 1]})
+    second = filter_logs.write(log_dir, 'TestFoo', 'beast', 0, 1.0, 'all good\n')
+
+    assert first['file'] != second['file']
+    assert [m['line'] for m in first['markers']] == [2, 3]
+    assert first['duration'] == 12.346
+    assert filter_logs.read_index(log_dir) == [first, second]
+    assert filter_logs.read_log(log_dir, first) == output
+    assert filter_logs.read_log(log_dir, second) == 'all good\n'
+
+
+def test_write_does_not_overwrite_a_claimed_name(tmpdir):
+    log_dir = str(tmpdir)
+    tmpdir.join('TestFoo.beast.0.log.gz').write('claimed by another run')
+    entry = filter_logs.write(log_dir, 'TestFoo', 'beast', 0, 1.0, 'output')
+    assert entry['file'] == 'TestFoo.beast.1.log.gz'
+    assert tmpdir.join('TestFoo.beast.0.log.gz').read() == 'claimed by another run'
@@ -0,0 +1,110 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import fnmatch
+
+import impact
+
+SOURCES = {
+    'solr/core/src/java/org/apache/solr/core/SolrCore.java':
+        'package org.apache.solr.core;\nimport org.apache.solr.util.Utils;\npublic class SolrCore { Utils u; }\n',
+    'solr/core/src/java/org/apache/solr/util/Utils.java':
+        'package org.apache.solr.util;\n// SolrCore is only mentioned in a comment\npublic class Utils { String s = "SolrCore"; }\n',
+    'solr/core/src/java/org/apache/solr/util/Other.java':
+        'package org.apache.solr.util;\npublic class Other { Utils.Inner i; }\n',
+    'solr/core/src/test/org/apache/solr/core/TestSolrCore.java':
+        'package org.apache.solr.core;\npublic class TestSolrCore { SolrCore core; }\n',
+    'solr/contrib/foo/src/test/org/apache/solr/foo/TestFoo.java':
+        'package org.apache.solr.foo;\nimport org.apache.solr.util.*;\npublic class TestFoo { Other o; }\n',
+}
+
+
+class FakeCheckout:
+    def __init__(self, checkout_dir, changed):
+        self.checkout_dir = checkout_dir
+        self.changed = changed
+
+    def has_commit(self, sha):
+        return True
+
+    def get_changed_files(self, old_sha, new_sha):
+        return self.changed
+
+    def is_build_file(self, path):
+        return fnmatch.fnmatch(path, '*build.xml')
+
+
+def make_graph():
+    graph = impact.DependencyGraph()
+    graph.add_files(sorted(SOURCES.items()))
+    return graph
+
+
+def write_checkout(tmpdir):
+    for path, source in SOURCES.items():
+        full_path = os.path.join(str(tmpdir), path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'w') as f:
+            f.write(source)
+    return str(tmpdir)
+
+
+def test_get_module():
+    assert impact.get_module('solr/core/src/java/org/apache/solr/core/SolrCore.java') == 'solr/core'
+    assert impact.get_module('solr/server/solr/configsets/_default/conf/solrconfig.xml') is None
+
+
+def test_dependencies_from_imports_same_package_and_wildcards():
+    graph = make_graph()
+    assert graph.dependencies['org.apache.solr.core.SolrCore'] == {'org.apache.solr.util.Utils'}
+    # names in comments and strings are not dependencies
+    assert graph.dependencies['org.apache.solr.util.Utils'] == set()
+    assert graph.dependencies['org.apache.solr.util.Other'] == {'org.apache.solr.util.Utils'}
+    assert graph.dependencies['org.apache.solr.foo.TestFoo'] == {'org.apache.solr.util.Other'}
+    assert graph.resolve('org.apache.solr.util.Utils.Inner') == 'org.apache.solr.util.Utils'
+    assert graph.resolve('org.apache.Missing') is None
+
+
+def test_get_closure():
+    graph = make_graph()
+    assert graph.get_closure(['org.apache.solr.util.Other']) == {'org.apache.solr.util.Other',
+                                                                  'org.apache.solr.foo.TestFoo'}
+    assert graph.get_closure(['org.apache.solr.util.Utils']) == set(graph.paths)
+    assert graph.get_dependencies(['org.apache.solr.core.TestSolrCore']) == {
+        'org.apache.solr.core.TestSolrCore', 'org.apache.solr.core.SolrCore', 'org.apache.solr.util.Utils'}
+    assert graph.find_tests('TestSolrCore') == ['org.apache.solr.core.TestSolrCore']
+    assert graph.find_tests('SolrCore') == []
+
+
+def get_affected(tmpdir, changed):
+    checkout = FakeCheckout(write_checkout(tmpdir), changed)
+    return impact.ImpactAnalyzer(checkout, 'new').get_affected_tests('old')
+
+
+def test_changed_class_affects_the_tests_depending_on_it(tmpdir):
+    assert get_affected(tmpdir, ['solr/core/src/java/org/apache/solr/util/Other.java']) == {'TestFoo'}
+    assert get_affected(tmpdir, ['solr/core/src/java/org/apache/solr/core/SolrCore.java',
+                                 'solr/CHANGES.txt']) == {'TestSolrCore'}
+    # a resource affects every class of its module
+    assert get_affected(tmpdir, ['solr/contrib/foo/src/test-files/foo.xml']) == {'TestFoo'}
+
+
+def test_changes_outside_the_modules_affect_all_tests(tmpdir):
+    assert get_affected(tmpdir, ['solr/build.xml']) is None
+    assert get_affected(tmpdir, ['solr/server/solr/configsets/_default/conf/solrconfig.xml']) is None
+    assert get_affected(tmpdir, ['lucene/tools/junit4/solr-tests.policy']) is None
+    assert get_affected(tmpdir, ['dev-tools/scripts/smokeTestRelease.py']) is None
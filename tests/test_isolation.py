@@ -0,0 +1,66 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+import isolation
+
+
+def make_cgroup_parent(tmpdir):
+    # a directory of a cgroup v2 hierarchy as far as Isolation can tell
+    parent = str(tmpdir.mkdir('sys'))
+    open(os.path.join(parent, 'cgroup.controllers'), 'w').close()
+    return os.path.join(parent, 'clean-room')
+
+
+def test_parse_cpu_list():
+    assert isolation.parse_cpu_list('0-3,8, 10-11,') == [0, 1, 2, 3, 8, 10, 11]
+    assert isolation.parse_cpu_list(5) == [5]
+
+
+def test_slots_divide_the_cpus(tmpdir):
+    iso = isolation.Isolation(cores_per_run=2, cpus=[0, 1, 2, 3, 4], slot_dir=str(tmpdir))
+    assert iso.slots == [[0, 1], [2, 3]]
+
+
+def test_cgroups_of_two_instances_do_not_collide(tmpdir):
+    cgroup = make_cgroup_parent(tmpdir)
+    first = isolation.Isolation(cgroup=cgroup, slot_dir=str(tmpdir))
+    second = isolation.Isolation(cgroup=cgroup, slot_dir=str(tmpdir))
+    with first.place() as a, second.place() as b:
+        assert a.cgroup is not None and b.cgroup is not None
+        assert a.cgroup != b.cgroup
+        assert os.path.isdir(a.cgroup) and os.path.isdir(b.cgroup)
+        b_cgroup = b.cgroup
+    assert os.listdir(cgroup) == []
+    # the limits are written into the cgroup of the run
+    limited = isolation.Isolation(cgroup=cgroup, slot_dir=str(tmpdir), cpu_limit=1.5, memory_limit='1G')
+    with limited.place() as p:
+        with open(os.path.join(p.cgroup, 'cpu.max')) as f:
+            assert f.read() == '150000 100000'
+        assert p.cgroup != b_cgroup
+
+
+def test_place_gives_up_waiting_for_a_slot(tmpdir):
+    first = isolation.Isolation(cores_per_run=1, cpus=[0], slot_dir=str(tmpdir))
+    second = isolation.Isolation(cores_per_run=1, cpus=[0], slot_dir=str(tmpdir))
+    with first.place() as held:
+        assert held.cpus == [0]
+        with second.place(timeout=0) as unpinned:
+            assert unpinned.slot is None
+            assert unpinned.cpus is None
+    with second.place(timeout=0) as p:
+        assert p.slot == 0
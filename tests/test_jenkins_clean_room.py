@@ -0,0 +1,36 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import utils
+import jenkins_clean_room
+
+
+def test_reproduction_status_of_the_whole_test():
+    assert jenkins_clean_room.get_reproduction_status('TestFoo', (utils.GOOD_STATUS, None)) == (False, None, None)
+    assert jenkins_clean_room.get_reproduction_status('TestFoo', (utils.HUNG_STATUS, 'beast')) \
+        == (True, 'beast:%s' % utils.STATUS_NAMES[utils.HUNG_STATUS], None)
+
+
+def test_reproduction_status_of_the_failed_methods():
+    bad = utils.STATUS_NAMES[utils.BAD_STATUS]
+    result = {'testA': (utils.GOOD_STATUS, None), 'testB': (utils.BAD_STATUS, 'beast'),
+              'testC': (utils.BAD_STATUS, 'simple')}
+    # the filter status is the one of the first method that failed
+    assert jenkins_clean_room.get_reproduction_status('TestFoo', result, ['testA', 'testB', 'testC']) \
+        == (True, 'beast:%s' % bad, {'testA': utils.STATUS_NAMES[utils.GOOD_STATUS], 'testB': 'beast:%s' % bad,
+                                     'testC': 'simple:%s' % bad})
+    assert jenkins_clean_room.get_reproduction_status('TestFoo', result, ['testA']) \
+        == (False, None, {'testA': utils.STATUS_NAMES[utils.GOOD_STATUS]})
@@ -0,0 +1,112 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import threading
+
+import pytest
+
+import locks
+
+
+def try_lock(path, shared=False):
+    """Returns whether another thread acquires the lock on path without waiting"""
+    acquired = []
+
+    def run():
+        try:
+            with locks.lock(path, shared=shared, timeout=0):
+                acquired.append(True)
+        except RuntimeError:
+            acquired.append(False)
+
+    t = threading.Thread(target=run)
+    t.start()
+    t.join()
+    return acquired[0]
+
+
+def test_exclusive_lock_excludes_other_threads(tmpdir):
+    path = os.path.join(str(tmpdir), 'room.json')
+    with locks.lock(path):
+        assert not try_lock(path)
+        assert not try_lock(path, shared=True)
+    assert try_lock(path)
+    assert os.path.exists(locks.get_lock_path(path))
+
+
+def test_shared_locks_are_held_together(tmpdir):
+    path = os.path.join(str(tmpdir), 'room.json')
+    with locks.lock(path, shared=True):
+        assert try_lock(path, shared=True)
+        assert not try_lock(path)
+
+
+def test_lock_is_reentrant_per_thread(tmpdir):
+    path = os.path.join(str(tmpdir), 'checkout')
+    with locks.lock(path):
+        with locks.lock(path, timeout=0):
+            assert not try_lock(path)
+        # still held by the outer block
+        assert not try_lock(path)
+    assert try_lock(path)
+
+
+def test_shared_lock_is_not_upgraded(tmpdir):
+    path = os.path.join(str(tmpdir), 'room.json')
+    with locks.lock(path, shared=True):
+        with pytest.raises(RuntimeError):
+            with locks.lock(path):
+                pass
+        # the shared lock is still held
+        assert not try_lock(path)
+    with locks.lock(path):
+        # an exclusive lock also covers readers in the same thread
+        with locks.lock(path, shared=True):
+            assert not try_lock(path, shared=True)
+
+
+def test_json_round_trip(tmpdir):
+    path = os.path.join(str(tmpdir), 'data.json')
+    assert locks.load_json(path) is None
+    assert locks.load_json(path, {}) == {}
+    locks.dump_json({'tests': ['TestA']}, path, indent=4)
+    assert locks.load_json(path) == {'tests': ['TestA']}
+    assert os.listdir(str(tmpdir)) == ['data.json']
+    locks.write_atomic(path, b'{"partial')
+    with pytest.raises(ValueError):
+        locks.load_json(path, {})
+
+
+def test_concurrent_writes_do_not_share_a_temporary_file(tmpdir):
+    path = os.path.join(str(tmpdir), 'data.json')
+    errors = []
+
+    def write(i):
+        try:
+            for _ in range(50):
+                locks.dump_json({'writer': i, 'padding': 'x' * 10000}, path)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert locks.load_json(path)['writer'] in range(4)
+    assert os.listdir(str(tmpdir)) == ['data.json']
@@ -0,0 +1,74 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+import pytest
+
+import metrics
+
+
+@pytest.fixture(autouse=True)
+def clear_values():
+    metrics._values.clear()
+    yield
+    metrics._values.clear()
+
+
+def make_config(tmpdir, name='master room'):
+    return {'name': name, 'output': str(tmpdir), 'metrics_dir': os.path.join(str(tmpdir), 'metrics')}
+
+
+@pytest.mark.parametrize('value', ['plain', 'a"b', 'line\nbreak', 'C:\\new\\dir', 'a\\\\nb', 'trailing\\'])
+def test_escape_round_trip(value):
+    assert metrics._unescape(metrics._escape(value)) == value
+
+
+def test_unknown_metric_raises():
+    with pytest.raises(ValueError):
+        metrics.inc('no_such_metric')
+
+
+def test_counters_add_up_across_writes_and_gauges_are_replaced(tmpdir):
+    config = make_config(tmpdir)
+    metrics.inc('filter_invocations_total', filter='C:\\new', status='GOOD')
+    metrics.set_gauge('room_tests', 10, room='clean')
+    path = metrics.write_metrics(config, 'jenkins_clean_room')
+    assert os.path.basename(path) == 'clean_room_jenkins_clean_room_master_room.prom'
+
+    metrics.reset_gauges()
+    metrics.inc('filter_invocations_total', 2, filter='C:\\new', status='GOOD')
+    metrics.set_gauge('room_tests', 7, room='clean')
+    metrics.write_metrics(config, 'jenkins_clean_room')
+
+    counters = metrics.load_counters(path, {'job': 'jenkins_clean_room', 'config': config['name']})
+    assert counters[('filter_invocations_total', (('filter', 'C:\\new'), ('status', 'GOOD')))] == 3.0
+    assert counters[('runs_total', ())] == 2.0
+    # gauges are not read back
+    assert not any(k[0] == 'room_tests' for k in counters)
+    with open(path) as f:
+        samples = [l for l in f.read().split('\n') if l.startswith('clean_room_room_tests')]
+    assert samples == ['clean_room_room_tests{config="master room",job="jenkins_clean_room",room="clean"} 7.0']
+    assert sorted(os.listdir(os.path.dirname(path))) == [os.path.basename(path), os.path.basename(path) + '.lock']
+
+
+def test_reset_gauges_keeps_counters():
+    metrics.inc('runs_total')
+    metrics.set_gauge('deferred_jobs', 3, kind='promote')
+    with metrics.phase('save'):
+        pass
+    metrics.reset_gauges()
+    assert list(metrics._values) == [('runs_total', ())]
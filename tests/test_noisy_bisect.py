@@ -0,0 +1,92 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import math
+
+import pytest
+
+import noisy_bisect
+
+
+def expected_gain(posterior, idx, runs):
+    """The information gain of probing idx, computed by updating copies of the posterior with both outcomes"""
+    bad_pass, good_pass = posterior.pass_likelihoods(runs)
+    p_pass = sum(w * (bad_pass if j <= idx else good_pass) for j, w in enumerate(posterior.weights))
+    expected = 0.0
+    for failed, p in ((False, p_pass), (True, 1.0 - p_pass)):
+        if p <= 0:
+            continue
+        after = copy.deepcopy(posterior)
+        after.update(idx, runs, failed)
+        expected += p * after.entropy()
+    return posterior.entropy() - expected
+
+
+def test_reliable_failure_excludes_later_commits():
+    posterior = noisy_bisect.Posterior(4, 1.0)
+    posterior.update(1, 1, True)
+    assert posterior.weights == pytest.approx([0.5, 0.5, 0.0, 0.0])
+    posterior.update(0, 1, False)
+    assert posterior.best() == (1, pytest.approx(1.0))
+
+
+def test_flaky_pass_only_shifts_the_probability():
+    posterior = noisy_bisect.Posterior(2, 0.5)
+    posterior.update(0, 1, False)
+    # a pass is half as likely if commit 0 is the culprit
+    assert posterior.weights == pytest.approx([1.0 / 3, 2.0 / 3])
+    posterior.update(0, 3, False)
+    assert posterior.best()[0] == 1
+    assert posterior.weights[1] == pytest.approx(16.0 / 17)
+
+
+def test_contradicting_result_raises():
+    posterior = noisy_bisect.Posterior(3, 1.0)
+    posterior.update(0, 1, True)
+    with pytest.raises(ValueError):
+        posterior.update(0, 1, False)
+
+
+def test_information_gain_of_reliable_test_halving_the_candidates():
+    posterior = noisy_bisect.Posterior(4, 1.0)
+    gains = posterior.information_gains(1)
+    assert gains[1] == pytest.approx(math.log(2))
+    # the newest commit always fails
+    assert gains[3] == pytest.approx(0.0)
+
+
+@pytest.mark.parametrize('failure_rate,false_failure_rate,runs', [(0.3, 0.0, 1), (0.3, 0.0, 4), (0.6, 0.05, 2)])
+def test_information_gains_match_updating_the_posterior(failure_rate, false_failure_rate, runs):
+    posterior = noisy_bisect.Posterior(6, failure_rate, false_failure_rate)
+    posterior.update(4, 2, True)
+    posterior.update(1, 1, False)
+    gains = posterior.information_gains(runs)
+    assert gains == pytest.approx([expected_gain(posterior, idx, runs) for idx in range(6)], abs=1e-9)
+
+
+def test_choose_probe_skips_untestable_commits():
+    posterior = noisy_bisect.Posterior(4, 1.0)
+    assert noisy_bisect.choose_probe(posterior, 10.0, 1.0, None, 3, [True, False, True, True]) == (0, 1)
+    assert noisy_bisect.choose_probe(posterior, 10.0, 1.0, None, 3, [False] * 4) == (None, None)
+
+
+def test_choose_probe_reuses_the_compiled_commit():
+    posterior = noisy_bisect.Posterior(4, 0.3)
+    testable = [True] * 4
+    assert noisy_bisect.choose_probe(posterior, 0.0, 1.0, 0, 5, testable)[0] != 0
+    # compiling costs much more than the runs, so the compiled commit beats a better split elsewhere
+    assert noisy_bisect.choose_probe(posterior, 1000.0, 1.0, 0, 5, testable)[0] == 0
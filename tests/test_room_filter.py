@@ -0,0 +1,154 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import subprocess
+
+import runner
+import utils
+import room_filter
+
+
+def start_test_jvm(run_id=None):
+    """Starts a process which looks like a test JVM forked by a gradle daemon for the filter run with run_id"""
+    env = dict(os.environ)
+    if run_id is not None:
+        env[room_filter.RUN_ID_VARIABLE] = run_id
+    return subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)', 'Gradle Test Executor 1'], env=env)
+
+
+def test_find_daemon_test_jvms_of_one_run_only():
+    mine, other, untagged = start_test_jvm('run-1'), start_test_jvm('run-2'), start_test_jvm()
+    try:
+        assert room_filter.find_daemon_test_jvms('run-1') == [mine.pid]
+        assert room_filter.find_daemon_test_jvms('run-2') == [other.pid]
+        assert room_filter.find_daemon_test_jvms('run-3') == []
+    finally:
+        for p in [mine, other, untagged]:
+            p.kill()
+            p.wait()
+
+
+def write_report(path, suite, failures=0, skipped=0, tests=2):
+    with open(path, 'w') as f:
+        f.write('<testsuite name="%s" tests="%d" failures="%d" errors="0" skipped="%d"><testcase name="a"/></testsuite>'
+                % (suite, tests, failures, skipped))
+
+
+def test_read_junit_report(tmpdir):
+    path = str(tmpdir.join('TEST-org.apache.solr.TestFoo.xml'))
+    write_report(path, 'org.apache.solr.TestFoo')
+    assert room_filter.read_junit_report(path) == ('TestFoo', utils.GOOD_STATUS)
+    write_report(path, 'org.apache.solr.TestFoo', failures=1)
+    assert room_filter.read_junit_report(path) == ('TestFoo', utils.BAD_STATUS)
+    write_report(path, 'org.apache.solr.TestFoo', skipped=2)
+    assert room_filter.read_junit_report(path) == ('TestFoo', utils.SKIP_STATUS)
+    # gradle wraps the suite and leaves out the counts
+    with open(path, 'w') as f:
+        f.write('<testsuites><testsuite name="org.apache.solr.TestFoo"><testcase name="a"><error/></testcase>'
+                '</testsuite></testsuites>')
+    assert room_filter.read_junit_report(path) == ('TestFoo', utils.BAD_STATUS)
+
+
+def test_read_junit_reports_of_the_given_tests_only(tmpdir):
+    write_report(str(tmpdir.join('TEST-org.apache.solr.TestFoo.xml')), 'org.apache.solr.TestFoo', failures=1)
+    write_report(str(tmpdir.join('TEST-org.apache.solr.TestBar.xml')), 'org.apache.solr.TestBar')
+    write_report(str(tmpdir.join('TEST-org.apache.solr.TestBaz.xml')), 'org.apache.solr.TestBaz')
+    tmpdir.join('TEST-org.apache.solr.TestQux.xml').write('not xml')
+    os.utime(str(tmpdir.join('TEST-org.apache.solr.TestBaz.xml')), (0, 0))
+    pattern = os.path.join(str(tmpdir), 'TEST-*.xml')
+    assert room_filter.read_junit_reports(pattern, ['TestFoo', 'TestBaz', 'TestQux'], 1) \
+        == {'TestFoo': utils.BAD_STATUS}
+
+
+def test_filter_batch_clears_old_reports_and_caps_the_timeout(tmpdir, monkeypatch):
+    test_dir = tmpdir.mkdir('core')
+    reports_dir = tmpdir.mkdir('build')
+    write_report(str(reports_dir.join('TEST-org.apache.solr.TestFoo.xml')), 'org.apache.solr.TestFoo')
+    write_report(str(reports_dir.join('TEST-org.apache.solr.TestOther.xml')), 'org.apache.solr.TestOther')
+    timeouts = []
+
+    def run(cmd, timeout, cwd=None):
+        # TestFoo's JVM crashed before it wrote a report, only TestBar's is written
+        write_report(str(reports_dir.join('TEST-org.apache.solr.TestBar.xml')), 'org.apache.solr.TestBar',
+                     failures=1)
+        timeouts.append(timeout)
+        result = runner.CommandResult(cmd)
+        result.returncode = 1
+        return result, None
+
+    f = room_filter.Filter('simple', 'test ${test_name}', batch_command='test ${test_names}', timeout=600,
+                           batch_timeout=900, reports_glob='../build/TEST-*.xml', log_command_output_level=None)
+    monkeypatch.setattr(f, 'run', run)
+    assert f.filter_batch(str(test_dir), ['TestFoo', 'TestBar']) == {'TestBar': utils.BAD_STATUS}
+    assert timeouts == [900]
+    assert not reports_dir.join('TEST-org.apache.solr.TestFoo.xml').exists()
+    assert reports_dir.join('TEST-org.apache.solr.TestOther.xml').exists()
+
+
+def test_silent_run_is_hung():
+    f = room_filter.Filter('simple', 'test ${test_name}', silence_timeout=1, log_command_output_level=None)
+    result = runner.CommandResult(['ant'])
+    result.silent = True
+    result.returncode = -15
+    assert f.get_status(result) == utils.HUNG_STATUS
+    result.silent = False
+    result.timed_out = True
+    assert f.get_status(result) == utils.BAD_STATUS
+
+
+class FakeFilter:
+    def __init__(self, name, method_command=None, failing=()):
+        self.name = name
+        self.method_command = method_command
+        self.failing = failing
+        self.runs = []
+
+    def filter(self, test_dir, test_name, method_name=None):
+        self.runs.append(method_name)
+        return utils.BAD_STATUS if method_name in self.failing else utils.GOOD_STATUS
+
+
+def test_reproduce_methods():
+    suite = FakeFilter('suite')
+    method = FakeFilter('beast', method_command='test ${test_name}.${method_name}', failing=['testB'])
+    results = room_filter.reproduce_methods([suite, method], 'solr/core', 'TestFoo', ['testA', 'testB'])
+    assert results == {'testA': (utils.GOOD_STATUS, None), 'testB': (utils.BAD_STATUS, 'beast')}
+    # the filter without a method command runs the whole test once for all the methods
+    assert suite.runs == [None]
+    assert method.runs == ['testA', 'testB']
+    assert room_filter.has_method_filters([suite, method])
+    assert not room_filter.has_method_filters([suite])
+
+
+def test_method_command(tmpdir, monkeypatch):
+    commands = []
+
+    def run(cmd, timeout, cwd=None):
+        commands.append(cmd)
+        result = runner.CommandResult(cmd)
+        result.returncode = 0
+        return result, None
+
+    f = room_filter.Filter('simple', 'ant test -Dtestcase=${test_name}',
+                           method_command='ant test -Dtestcase=${test_name} -Dtests.method=${method_name}',
+                           log_command_output_level=None)
+    monkeypatch.setattr(f, 'run', run)
+    assert f.filter(str(tmpdir), 'TestFoo', 'testA') == utils.GOOD_STATUS
+    assert f.filter(str(tmpdir), 'TestFoo') == utils.GOOD_STATUS
+    assert [' '.join(c) for c in commands] \
+        == ['ant test -Dtestcase=TestFoo -Dtests.method=testA', 'ant test -Dtestcase=TestFoo']
@@ -0,0 +1,111 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import time
+import asyncio
+
+import runner
+
+
+def python(code):
+    return [sys.executable, '-c', code]
+
+
+def is_alive(pid, wait_secs=5.0):
+    """Returns whether the process is still alive after waiting up to wait_secs for a killed process to exit"""
+    deadline = time.time() + wait_secs
+    while _is_alive(pid) and time.time() < deadline:
+        time.sleep(0.1)
+    return _is_alive(pid)
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    # a zombie is as good as dead
+    with open('/proc/%d/stat' % pid, 'r') as f:
+        return f.read().split(') ')[1][0] != 'Z'
+
+
+def test_run_returns_the_output_and_returncode(tmpdir):
+    chunks = []
+    result = runner.run(python('import os, sys; print(os.getcwd()); sys.stderr.write("err\\n"); sys.exit(3)'),
+                        cwd=str(tmpdir), on_output=chunks.append)
+    assert result.returncode == 3
+    assert result.output == '%s\nerr\n' % str(tmpdir)
+    assert ''.join(chunks) == result.output
+    assert not result.timed_out and not result.silent and not result.cancelled
+
+
+def test_timeout_kills_the_process_group(tmpdir):
+    pid_file = str(tmpdir.join('child.pid'))
+    # the child is what ant forking a JVM looks like
+    code = 'import subprocess, sys, time; p = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"]);' \
+           'open(%r, "w").write(str(p.pid)); time.sleep(60)' % pid_file
+    t0 = time.time()
+    result = runner.run(python(code), timeout=2)
+    assert time.time() - t0 < 30
+    assert result.timed_out
+    assert result.returncode < 0
+    with open(pid_file, 'r') as f:
+        assert not is_alive(int(f.read()))
+
+
+def test_cancel_kills_the_process_group():
+    async def cancel():
+        task = asyncio.ensure_future(runner.run_async(python('import time; time.sleep(60)')))
+        await asyncio.sleep(1)
+        pids = list(runner._live)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            return pids
+    pids = asyncio.run(cancel())
+    assert len(pids) == 1
+    assert not is_alive(pids[0])
+    assert runner._live == {}
+
+
+def test_run_all_keeps_the_order(tmpdir):
+    results = runner.run_all([python('import time; time.sleep(0.5); print(1)'), (python('print(2)'), str(tmpdir))],
+                             concurrency=2)
+    assert [r.output for r in results] == ['1\n', '2\n']
+
+
+def test_silence_kills_the_command_and_adds_the_diagnostics():
+    pgids = []
+
+    def on_silence(pgid):
+        pgids.append(pgid)
+        return 'thread dump\n'
+
+    result = runner.run(python('import time; print("started", flush=True); time.sleep(60)'), timeout=30,
+                        silence_timeout=1, on_silence=on_silence)
+    assert result.silent and not result.timed_out
+    assert result.output == 'started\nthread dump\n'
+    assert len(pgids) == 1 and not is_alive(pgids[0])
+
+
+def test_output_resets_the_silence_timeout():
+    result = runner.run(python('import time\nfor i in range(4):\n    print(i, flush=True)\n    time.sleep(0.5)'),
+                        silence_timeout=1.5)
+    assert not result.silent
+    assert result.returncode == 0
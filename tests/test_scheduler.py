@@ -0,0 +1,98 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+import scheduler
+
+JOBS = [('solr/core', 'Test%d' % i) for i in range(5)]
+
+
+def test_budget():
+    assert not scheduler.Budget().exhausted()
+    assert not scheduler.Budget(60).exhausted()
+    assert scheduler.Budget(60, time.time() - 61).exhausted()
+    assert scheduler.get_budget({}).secs is None
+    assert scheduler.get_budget({'time_budget_secs': 0}).secs is None
+    assert scheduler.get_budget({'time_budget_secs': '3600'}).secs == 3600.0
+    assert scheduler.get_chunk_size({}) == 20
+    assert scheduler.get_chunk_size({'time_budget_chunk_size': 2}) == 2
+
+
+def test_run_jobs_without_budget_hands_all_jobs_ahead():
+    chunks = []
+
+    def run_ahead(chunk):
+        chunks.append(chunk)
+        # Test1 could not be run ahead
+        return dict((name, 'ahead') for module, name in chunk if name != 'Test1')
+
+    results, deferred = scheduler.run_jobs(scheduler.Budget(), JOBS, lambda module, name: 'one', run_ahead, 2)
+    assert chunks == [JOBS]
+    assert results == {'Test0': 'ahead', 'Test1': 'one', 'Test2': 'ahead', 'Test3': 'ahead', 'Test4': 'ahead'}
+    assert deferred == []
+
+
+def test_run_jobs_defers_the_jobs_left_when_the_budget_is_exhausted():
+    budget = scheduler.Budget(3600)
+    ran = []
+
+    def run_one(module, name):
+        ran.append(name)
+        if len(ran) == 3:
+            budget.start -= 3600
+        return name.lower()
+
+    results, deferred = scheduler.run_jobs(budget, JOBS, run_one)
+    assert ran == ['Test0', 'Test1', 'Test2']
+    assert results == {'Test0': 'test0', 'Test1': 'test1', 'Test2': 'test2'}
+    assert deferred == JOBS[3:]
+
+
+def test_run_jobs_checks_the_budget_between_chunks():
+    budget = scheduler.Budget(3600)
+    chunks = []
+
+    def run_ahead(chunk):
+        chunks.append(chunk)
+        budget.start -= 3600
+        return dict((name, 'ahead') for module, name in chunk)
+
+    results, deferred = scheduler.run_jobs(budget, JOBS, None, run_ahead, 2)
+    assert chunks == [JOBS[:2]]
+    assert results == {'Test0': 'ahead', 'Test1': 'ahead'}
+    assert deferred == JOBS[2:]
+
+
+def test_defer_carries_over_the_previous_record():
+    first = scheduler.defer(scheduler.REPRODUCE, 'solr/core', 'TestA', '2018-01-01', methods=['testOne'])
+    assert first == {'kind': scheduler.REPRODUCE, 'test': 'TestA', 'module': 'solr/core', 'since': '2018-01-01',
+                     'deferrals': 1, 'methods': ['testOne']}
+    second = scheduler.defer(scheduler.REPRODUCE, 'solr/core', 'TestA', '2018-01-02', first)
+    assert second['since'] == '2018-01-01'
+    assert second['deferrals'] == 2
+    assert 'methods' not in second
+
+
+def test_save_and_load_deferred(tmpdir):
+    config = {'name': 'master', 'output': str(tmpdir)}
+    other = {'name': 'branch', 'output': str(tmpdir)}
+    assert scheduler.load_deferred(config) == []
+    jobs = [scheduler.defer(scheduler.PROMOTE, 'solr/core', 'TestA', '2018-01-01')]
+    scheduler.save_deferred(config, jobs)
+    scheduler.save_deferred(other, [])
+    assert scheduler.load_deferred(config) == jobs
+    assert scheduler.load_deferred(other) == []
@@ -0,0 +1,166 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import subprocess
+
+import build_backend
+import solr
+
+
+class FakeAnt(build_backend.AntBackend):
+    """Runs a python script that records the tasks in ant.log of the directory instead of ant"""
+
+    def get_command(self, *tasks):
+        return [sys.executable, '-c', 'import sys; open("ant.log", "a").write(" ".join(sys.argv[1:]) + "\\n")'] \
+               + list(tasks)
+
+    def bootstrap(self, timeout=None):
+        pass
+
+
+def git(repo, *args):
+    return subprocess.check_output(['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com'] + list(args),
+                                   cwd=repo).decode('utf-8').strip()
+
+
+def commit(repo, files, message):
+    for path, content in files.items():
+        full_path = os.path.join(repo, path)
+        if content is None:
+            os.remove(full_path)
+            continue
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'w') as f:
+            f.write(content)
+    git(repo, 'add', '-A')
+    git(repo, 'commit', '-q', '-m', message)
+    return git(repo, 'rev-parse', 'HEAD')
+
+
+def make_origin(tmpdir):
+    origin = str(tmpdir.mkdir('origin'))
+    git(origin, 'init', '-q')
+    git(origin, 'symbolic-ref', 'HEAD', 'refs/heads/master')
+    with open(os.path.join(origin, '.gitignore'), 'w') as f:
+        f.write('build/\nant.log\n')
+    commit(origin, {'build.xml': '<project/>',
+                    'lucene/core/build.xml': '<project/>',
+                    'lucene/core/src/java/Foo.java': 'class Foo {}',
+                    'solr/core/build.xml': '<project/>',
+                    'solr/core/src/java/Bar.java': 'class Bar {}'}, 'initial')
+    return origin
+
+
+def make_checkout(origin, checkout_dir, revision='LATEST', incremental=False):
+    return solr.LuceneSolrCheckout(origin, checkout_dir, revision, incremental=incremental, backend=FakeAnt())
+
+
+def read(path):
+    with open(path, 'r') as f:
+        return f.read()
+
+
+def test_checkout_fetches_only_the_configured_branch(tmpdir):
+    origin = make_origin(tmpdir)
+    checkout_dir = str(tmpdir.join('checkout'))
+    make_checkout(origin, checkout_dir).checkout()
+    assert git(checkout_dir, 'rev-parse', 'HEAD') == git(origin, 'rev-parse', 'master')
+
+    git(origin, 'checkout', '-q', '-b', 'other')
+    commit(origin, {'other.txt': 'other'}, 'other branch')
+    git(origin, 'checkout', '-q', 'master')
+    head = commit(origin, {'solr/core/src/java/Bar.java': 'class Bar { int x; }'}, 'change')
+    make_checkout(origin, checkout_dir).checkout()
+    assert git(checkout_dir, 'rev-parse', 'HEAD') == head
+    assert git(checkout_dir, 'for-each-ref', '--format=%(refname)', 'refs/remotes/origin/other') == ''
+
+
+def test_checkout_of_a_known_revision_does_not_fetch(tmpdir):
+    origin = make_origin(tmpdir)
+    first = git(origin, 'rev-parse', 'HEAD')
+    checkout_dir = str(tmpdir.join('checkout'))
+    make_checkout(origin, checkout_dir).checkout()
+    commit(origin, {'solr/core/src/java/Bar.java': 'class Bar { int x; }'}, 'change')
+    # a local modification is discarded
+    with open(os.path.join(checkout_dir, 'build.xml'), 'w') as f:
+        f.write('modified')
+    make_checkout(origin, checkout_dir, revision=first).checkout()
+    assert git(checkout_dir, 'rev-parse', 'HEAD') == first
+    assert git(checkout_dir, 'status', '--porcelain') == ''
+    # the new commit was not fetched
+    assert git(checkout_dir, 'rev-parse', 'origin/master') == first
+
+
+def test_get_remote_sha(tmpdir):
+    origin = make_origin(tmpdir)
+    assert make_checkout(origin, str(tmpdir.join('checkout'))).get_remote_sha() == git(origin, 'rev-parse', 'master')
+
+
+def test_incremental_update_cleans_only_the_changed_modules(tmpdir):
+    origin = make_origin(tmpdir)
+    checkout_dir = str(tmpdir.join('checkout'))
+    make_checkout(origin, checkout_dir, incremental=True).checkout()
+    for module in ['lucene/core', 'solr/core']:
+        os.makedirs(os.path.join(checkout_dir, module, 'build'))
+    commit(origin, {'solr/core/src/java/Bar.java': 'class Bar { int x; }', 'README.md': 'docs'}, 'change')
+    make_checkout(origin, checkout_dir, incremental=True).checkout()
+    # the build outputs are kept and only the changed module is cleaned
+    assert os.path.exists(os.path.join(checkout_dir, 'lucene/core/build'))
+    assert os.path.exists(os.path.join(checkout_dir, 'solr/core/build'))
+    assert not os.path.exists(os.path.join(checkout_dir, 'lucene/core/ant.log'))
+    assert read(os.path.join(checkout_dir, 'solr/core/ant.log')) == 'clean\n'
+
+    commit(origin, {'build.xml': '<project name="changed"/>'}, 'build change')
+    make_checkout(origin, checkout_dir, incremental=True).checkout()
+    # a changed build file forces a clean rebuild
+    assert not os.path.exists(os.path.join(checkout_dir, 'lucene/core/build'))
+    assert not os.path.exists(os.path.join(checkout_dir, 'solr/core/build'))
+
+
+def test_get_changed_modules(tmpdir):
+    origin = make_origin(tmpdir)
+    first = git(origin, 'rev-parse', 'HEAD')
+    second = commit(origin, {'lucene/core/src/java/Foo.java': 'class Foo { int x; }',
+                             'solr/core/src/java/Bar.java': None, 'solr/CHANGES.txt': 'changes'}, 'change')
+    third = commit(origin, {'lucene/ivy-versions.properties': 'x=1'}, 'dependency change')
+    checkout = make_checkout(origin, origin)
+    x = os.getcwd()
+    try:
+        os.chdir(origin)
+        assert checkout.get_changed_modules(first, second) == (False, ['lucene/core', 'solr/core'])
+        assert checkout.get_changed_modules(second, third) == (True, [])
+        assert checkout.get_changed_modules(first, 'no-such-revision') == (True, [])
+    finally:
+        os.chdir(x)
+
+
+def test_checkouts_share_a_repository(tmpdir):
+    origin = make_origin(tmpdir)
+    shared_repo = str(tmpdir.join('objects.git'))
+    master = str(tmpdir.join('worktrees', 'master'))
+    other = str(tmpdir.join('worktrees', 'other'))
+    for checkout_dir in [master, other]:
+        solr.LuceneSolrCheckout(origin, checkout_dir, shared_repo=shared_repo, backend=FakeAnt()).checkout()
+        assert git(checkout_dir, 'rev-parse', 'HEAD') == git(origin, 'rev-parse', 'master')
+        assert os.path.exists(os.path.join(checkout_dir, 'solr/core/src/java/Bar.java'))
+    assert git(master, 'rev-parse', '--git-common-dir') == git(other, 'rev-parse', '--git-common-dir')
+
+    # a deleted worktree, e.g. by -clean-build, is added again
+    subprocess.check_call(['rm', '-rf', master])
+    solr.LuceneSolrCheckout(origin, master, shared_repo=shared_repo, backend=FakeAnt()).checkout()
+    assert git(master, 'rev-parse', 'HEAD') == git(origin, 'rev-parse', 'master')
@@ -0,0 +1,157 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+import threading
+
+import locks
+import scheduler
+import utils
+import work_queue
+
+
+class FakeFilter:
+    def __init__(self, name):
+        self.name = name
+
+
+def make_queue(tmpdir, lease_secs=300, max_attempts=3):
+    return work_queue.WorkQueue(os.path.join(str(tmpdir), 'queue'), lease_secs=lease_secs, max_attempts=max_attempts)
+
+
+def test_claim_complete_and_take_result(tmpdir):
+    queue = make_queue(tmpdir)
+    assert queue.claim('w1') is None
+    queue.submit({'id': 'job-2'})
+    queue.submit({'id': 'job-1'})
+    job = queue.claim('w1')
+    assert job['id'] == 'job-1'
+    assert job['worker'] == 'w1'
+    assert job['attempts'] == 0
+    assert queue.take_result('job-1') is None
+    queue.complete(job, utils.GOOD_STATUS, 1.5)
+    assert os.listdir(queue.path(work_queue.LEASED)) == []
+    result = queue.take_result('job-1')
+    assert result['status'] == utils.GOOD_STATUS
+    assert result['worker'] == 'w1'
+    assert queue.take_result('job-1') is None
+    assert queue.claim('w2')['id'] == 'job-2'
+
+
+def test_lease_of_live_worker_is_kept(tmpdir):
+    queue = make_queue(tmpdir)
+    queue.submit({'id': 'job-1'})
+    job = queue.claim('w1')
+    # leased long ago, but the worker still sends heartbeats
+    job['leased'] -= 1000
+    locks.dump_json(job, queue.path(work_queue.LEASED, 'job-1.json'))
+    queue.heartbeat('w1')
+    assert queue.requeue_expired() == 0
+    assert os.listdir(queue.path(work_queue.PENDING)) == []
+
+
+def test_lease_of_dead_worker_is_requeued(tmpdir):
+    queue = make_queue(tmpdir, lease_secs=0)
+    queue.submit({'id': 'job-1'})
+    queue.claim('w1')
+    assert queue.requeue_expired() == 1
+    job = queue.claim('w2')
+    assert job['id'] == 'job-1'
+    assert job['attempts'] == 1
+
+
+def test_lease_without_worker_is_requeued_after_lease_secs(tmpdir):
+    # the worker died between renaming the job into leased/ and writing its lease
+    queue = make_queue(tmpdir)
+    queue.submit({'id': 'job-1'})
+    os.rename(queue.path(work_queue.PENDING, 'job-1.json'), queue.path(work_queue.LEASED, 'job-1.json'))
+    assert queue.requeue_expired() == 0
+    queue.lease_secs = 0
+    assert queue.requeue_expired() == 1
+    assert queue.claim('w1')['id'] == 'job-1'
+
+
+def test_job_lost_max_attempts_times_is_aborted(tmpdir):
+    queue = make_queue(tmpdir, lease_secs=0, max_attempts=2)
+    queue.submit({'id': 'job-1'})
+    queue.claim('w1')
+    assert queue.requeue_expired() == 1
+    queue.claim('w2')
+    assert queue.requeue_expired() == 0
+    assert queue.take_result('job-1')['status'] == utils.ABORT_STATUS
+    assert queue.claim('w3') is None
+
+
+def test_run_filters_fails_tests_without_module(tmpdir):
+    config = {'work_queue_dir': os.path.join(str(tmpdir), 'queue')}
+    filters = [FakeFilter('first'), FakeFilter('second')]
+    checkout_dir = str(tmpdir)
+    module_dir = os.path.join(checkout_dir, 'solr', 'core')
+    queue = work_queue.get_queue(config)
+    claimed = []
+
+    def work():
+        # passes the first filter and fails the second one
+        while len(claimed) < 2:
+            job = queue.claim('w1')
+            if job is None:
+                time.sleep(0.01)
+                continue
+            claimed.append(job)
+            queue.complete(job, utils.GOOD_STATUS if job['filter'] == 'first' else utils.BAD_STATUS, 0.1)
+
+    worker = threading.Thread(target=work)
+    worker.start()
+    results = work_queue.run_filters(config, filters, [(None, 'TestMissing'), (module_dir, 'TestA')], 'sha',
+                                     checkout_dir, poll_secs=0.01)
+    worker.join()
+    assert results == {'TestMissing': (utils.BAD_STATUS, 'first'), 'TestA': (utils.BAD_STATUS, 'second')}
+    assert [(j['module'], j['test'], j['filter']) for j in claimed] == [
+        (os.path.join('solr', 'core'), 'TestA', 'first'), (os.path.join('solr', 'core'), 'TestA', 'second')]
+
+
+def test_run_filters_cancels_jobs_once_the_budget_is_spent(tmpdir):
+    config = {'work_queue_dir': os.path.join(str(tmpdir), 'queue')}
+    queue = work_queue.get_queue(config)
+    queue.heartbeat('w1')
+    checkout_dir = str(tmpdir)
+    module_dir = os.path.join(checkout_dir, 'solr', 'core')
+    tests = [(module_dir, 'TestA'), (module_dir, 'TestB')]
+    results = work_queue.run_filters(config, [FakeFilter('first')], tests, 'sha', checkout_dir,
+                                     scheduler.Budget(60, time.time() - 61), poll_secs=0.01)
+    assert results == {}
+    for d in [work_queue.PENDING, work_queue.LEASED, work_queue.RESULTS]:
+        assert os.listdir(queue.path(d)) == []
+
+
+def test_run_filters_stops_without_live_workers(tmpdir):
+    config = {'work_queue_dir': os.path.join(str(tmpdir), 'queue'), 'work_queue_lease_secs': 0.05}
+    queue = work_queue.get_queue(config)
+    checkout_dir = str(tmpdir)
+    results = work_queue.run_filters(config, [FakeFilter('first')], [(checkout_dir, 'TestA')], 'sha', checkout_dir,
+                                     poll_secs=0.01)
+    assert results == {}
+    assert os.listdir(queue.path(work_queue.PENDING)) == []
+
+
+def test_result_of_cancelled_job_is_dropped(tmpdir):
+    queue = make_queue(tmpdir)
+    queue.submit({'id': 'job-1'})
+    job = queue.claim('w1')
+    queue.cancel('job-1')
+    queue.complete(job, utils.GOOD_STATUS, 1.0)
+    assert queue.take_result('job-1') is None
@@ -0,0 +1,100 @@
+#!/bin/python
+
+# Copyright 2018 Shalin Shekhar Mangar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+import workspace
+
+
+class FakeCheckout:
+    def __init__(self, checkout_dir, revision='LATEST', branch='master', sparse_include=None):
+        self.checkout_dir = checkout_dir
+        self.revision = revision
+        self.branch = branch
+        self.sparse_include = sparse_include
+        self.checkouts = 0
+        self.compiles = 0
+
+    def checkout(self):
+        self.checkouts += 1
+
+    def compile_tests(self):
+        self.compiles += 1
+
+
+def test_configure():
+    ws = workspace.Workspace('/ws')
+    config = {'name': 'solr 7x', 'branch': 'branch_7x', 'checkout': '/original'}
+    configured = ws.configure(config)
+    assert configured['checkout'] == os.path.join('/ws', 'worktrees', 'branch_7x')
+    assert configured['shared_repo'] == os.path.join('/ws', 'objects.git')
+    assert config['checkout'] == '/original'
+    assert ws.configure({'checkout': '/x'})['checkout'] == os.path.join('/ws', 'worktrees', 'master')
+
+
+def test_latest_is_fetched_once_until_invalidated():
+    ws = workspace.Workspace('/ws')
+    checkout = FakeCheckout('/ws/worktrees/master')
+    ws.checkout(checkout)
+    ws.checkout(checkout)
+    assert checkout.checkouts == 1
+    assert ws.is_checked_out('/ws/worktrees/master')
+    ws.invalidate_fetches()
+    ws.checkout(checkout)
+    assert checkout.checkouts == 2
+
+
+def test_revision_is_checked_out_again_only_when_it_changes():
+    ws = workspace.Workspace('/ws')
+    checkout = FakeCheckout('/ws/worktrees/master', revision='abc')
+    ws.checkout(checkout)
+    ws.checkout(checkout)
+    assert checkout.checkouts == 1
+    # a different sparse checkout of the same revision
+    checkout.sparse_include = ['*/solr/*']
+    ws.checkout(checkout)
+    assert checkout.checkouts == 2
+
+
+def test_compile_is_reused_until_the_checkout_moves():
+    ws = workspace.Workspace('/ws')
+    checkout = FakeCheckout('/ws/worktrees/master', revision='abc')
+    ws.checkout(checkout)
+    ws.compile_tests(checkout, 'abc')
+    ws.compile_tests(checkout, 'abc')
+    assert checkout.compiles == 1
+    checkout.revision = 'def'
+    ws.checkout(checkout)
+    checkout.revision = 'abc'
+    ws.checkout(checkout)
+    ws.compile_tests(checkout, 'abc')
+    assert checkout.compiles == 2
+
+
+def test_gather_interesting_tests_is_cached(monkeypatch):
+    calls = []
+
+    def gather(checkout_dir, exclude, include):
+        calls.append(checkout_dir)
+        return {'solr/core': ['TestFoo']}
+
+    monkeypatch.setattr(workspace.bootstrap, 'gather_interesting_tests', gather)
+    ws = workspace.Workspace('/ws')
+    assert ws.gather_interesting_tests('/ws/worktrees/master', 'abc', [], ['*.java']) == {'solr/core': ['TestFoo']}
+    ws.gather_interesting_tests('/ws/worktrees/master', 'abc', [], ['*.java'])
+    assert len(calls) == 1
+    ws.gather_interesting_tests('/ws/worktrees/master', 'def', [], ['*.java'])
+    assert len(calls) == 2